@@ -0,0 +1,26 @@
+"""Add truncated flag to messages
+
+Revision ID: b41c9e2d7a15
+Revises: 7203b0f8bee0
+Create Date: 2026-10-19 10:12:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41c9e2d7a15'
+down_revision: Union[str, None] = '7203b0f8bee0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('truncated', sa.Boolean(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('messages', 'truncated')
@@ -0,0 +1,30 @@
+"""Add rolling summary to conversations
+
+Revision ID: c8d3f1a6e920
+Revises: b41c9e2d7a15
+Create Date: 2026-10-19 15:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8d3f1a6e920'
+down_revision: Union[str, None] = 'b41c9e2d7a15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column(
+        'conversations', sa.Column('summary_message_count', sa.Integer(), server_default='0', nullable=False)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('conversations', 'summary_message_count')
+    op.drop_column('conversations', 'summary')
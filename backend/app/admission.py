@@ -0,0 +1,300 @@
+"""
+Contrôle d'admission devant les générations LLM.
+
+Le rate limiting slowapi (par IP) ne borne pas la charge globale : une rafale de
+requêtes sature Ollama et toutes les réponses ralentissent ensemble. Ici chaque
+LLM a une limite de générations simultanées ; au-delà, les requêtes attendent
+dans une file bornée, servie par priorité de tier (interactif avant standard,
+standard avant batch), avec un budget de temps d'attente par tier.
+
+Refus rapides plutôt qu'une dégradation générale :
+- file pleine : 429 (Retry-After estimé) ;
+- budget d'attente dépassé : 503 (Retry-After estimé).
+
+La place est prise au moment de la génération, pour le LLM (ou l'endpoint routé)
+qui génère réellement, et par le seul meneur d'une question coalescée : les
+requêtes qui rejoignent une génération en cours ne consomment pas de place. Le
+tier de la requête suit la génération (argument `tier` du pipeline, métadonnées
+LangChain pour le routeur) ; sans tier, la génération n'est pas soumise à l'admission.
+
+Les endpoints dont la réponse commence avant la génération (streaming SSE) ou qui
+lancent de nombreuses générations (batch) vérifient d'abord la capacité (`check`),
+sans prendre de place : un refus prévisible est renvoyé en 429/503 avec Retry-After
+avant le début de la réponse.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from .config import settings
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Priorité des tiers (plus petit = servi en premier)
+TIER_PRIORITIES = {"interactive": 0, "standard": 1, "batch": 2}
+
+# Clé des métadonnées LangChain portant le tier jusqu'au routeur d'endpoints
+TIER_METADATA_KEY = "admission_tier"
+
+
+class AdmissionRejected(Exception):
+    """Requête refusée par le contrôle d'admission (file pleine ou attente trop longue)."""
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class AdmissionTicket:
+    """Place de génération obtenue ; à libérer une fois la génération terminée."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.started_at = time.perf_counter()
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.controller._release(time.perf_counter() - self.started_at)
+
+    def __enter__(self) -> "AdmissionTicket":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    async def __aenter__(self) -> "AdmissionTicket":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+class AdmissionController:
+    """
+    Limite de générations simultanées d'un LLM, avec file d'attente par priorité.
+
+    Utilisable depuis la boucle d'événements (`acquire`) comme depuis un thread de
+    travail (`acquire_blocking`) : l'état est protégé par un verrou et les places
+    sont transmises via des `concurrent.futures.Future`.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, budgets: Dict[str, float]):
+        """
+        Args:
+            name: Nom du LLM (tag des métriques)
+            max_concurrency: Générations simultanées maximales
+            max_queue: Requêtes en attente maximales
+            budgets: Temps d'attente maximal (secondes) par tier
+        """
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.budgets = budgets
+        self.active = 0
+        self._waiters: List[list] = []  # [priorité, ordre d'arrivée, future]
+        self._sequence = itertools.count()
+        self._service_time = 5.0  # Durée moyenne d'une génération (EWMA, secondes)
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def retry_after(self) -> int:
+        """Estimation (secondes) du délai avant qu'une place se libère pour une nouvelle requête."""
+        return max(1, math.ceil(self._service_time * (self.queue_depth + 1) / self.max_concurrency))
+
+    def _publish(self) -> None:
+        metrics = get_metrics_collector()
+        tags = {"llm": self.name}
+        metrics.set_gauge("admission.queue_depth", self.queue_depth, tags=tags)
+        metrics.set_gauge("admission.in_flight", self.active, tags=tags)
+
+    def _reject(self, tier: str, status_code: int, reason: str, detail: str) -> AdmissionRejected:
+        get_metrics_collector().increment("admission.rejected", tags={"llm": self.name, "tier": tier, "reason": reason})
+        logger.warning(f"🚦 Requête {tier} refusée ({reason}) pour {self.name}: {detail}")
+        return AdmissionRejected(status_code, self.retry_after(), detail)
+
+    def _enter(self, tier: str) -> Optional[Future]:
+        """Place immédiate (None) ou future à attendre dans la file."""
+        with self._lock:
+            if self.active < self.max_concurrency and self.queue_depth == 0:
+                self.active += 1
+                self._publish()
+                return None
+            if self.queue_depth >= self.max_queue:
+                raise self._reject(tier, 429, "queue_full", "Serveur saturé, veuillez réessayer plus tard.")
+            future: Future = Future()
+            heapq.heappush(self._waiters, [TIER_PRIORITIES.get(tier, 1), next(self._sequence), future])
+            self._publish()
+            return future
+
+    def check(self, tier: str = "standard") -> None:
+        """
+        Vérification non bloquante, sans prendre de place : refuse d'emblée une requête
+        que la file refuserait (file pleine, ou attente estimée au-delà du budget du tier).
+
+        Raises:
+            AdmissionRejected: 429 si la file est pleine, 503 si l'attente estimée dépasse le budget du tier
+        """
+        with self._lock:
+            if self.active < self.max_concurrency and self.queue_depth == 0:
+                return
+            if self.queue_depth >= self.max_queue:
+                raise self._reject(tier, 429, "queue_full", "Serveur saturé, veuillez réessayer plus tard.")
+            # Seules les attentes de priorité égale ou supérieure passeraient avant cette requête
+            priority = TIER_PRIORITIES.get(tier, 1)
+            ahead = sum(1 for rank, _, future in self._waiters if rank <= priority and not future.done())
+            if self._service_time * (ahead + 1) / self.max_concurrency > self.budgets.get(tier, 10.0):
+                raise self._reject(
+                    tier, 503, "queue_estimate", "Temps d'attente estimé trop long, veuillez réessayer."
+                )
+
+    def _abandon(self, future: Future) -> bool:
+        """Retire une attente de la file ; False si la place venait d'être attribuée (à garder ou rendre)."""
+        with self._lock:
+            cancelled = future.cancel()
+            self._publish()
+            return cancelled
+
+    def _admitted(self, tier: str, start: float) -> AdmissionTicket:
+        get_metrics_collector().record_histogram(
+            "admission.wait_ms", (time.perf_counter() - start) * 1000, tags={"llm": self.name, "tier": tier}
+        )
+        return AdmissionTicket(self)
+
+    async def acquire(self, tier: str = "standard") -> AdmissionTicket:
+        """
+        Attend une place de génération.
+
+        Raises:
+            AdmissionRejected: 429 si la file est pleine, 503 si le budget d'attente du tier est dépassé
+        """
+        start = time.perf_counter()
+        future = self._enter(tier)
+        if future is None:
+            return self._admitted(tier, start)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.budgets.get(tier, 10.0))
+        except asyncio.TimeoutError:
+            if self._abandon(future):
+                raise self._reject(tier, 503, "queue_timeout", "Temps d'attente dépassé, veuillez réessayer.")
+            # La place a été attribuée au moment du dépassement : la garder
+        except asyncio.CancelledError:
+            # Client parti pendant l'attente : rendre la place si elle venait d'être attribuée
+            if not self._abandon(future):
+                self._release(None)
+            raise
+        return self._admitted(tier, start)
+
+    def acquire_blocking(self, tier: str = "standard") -> AdmissionTicket:
+        """Version bloquante de `acquire`, pour les générations exécutées dans un thread de travail."""
+        start = time.perf_counter()
+        future = self._enter(tier)
+        if future is not None:
+            try:
+                future.result(timeout=self.budgets.get(tier, 10.0))
+            except FutureTimeoutError:
+                if self._abandon(future):
+                    raise self._reject(tier, 503, "queue_timeout", "Temps d'attente dépassé, veuillez réessayer.")
+        return self._admitted(tier, start)
+
+    def _release(self, service_time: Optional[float]) -> None:
+        with self._lock:
+            if service_time is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+            # Transmettre la place à la requête en attente la plus prioritaire (hors attentes abandonnées)
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if future.set_running_or_notify_cancel():
+                    future.set_result(None)
+                    self._publish()
+                    return
+            self.active -= 1
+            self._publish()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.active,
+                "queue_depth": self.queue_depth,
+                "max_queue": self.max_queue,
+                "service_time_s": round(self._service_time, 3),
+            }
+
+
+_controllers: Dict[str, AdmissionController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_admission_controller(llm_name: Optional[str] = None) -> AdmissionController:
+    """Contrôleur d'admission d'un LLM (None = LLM par défaut)."""
+    from .llm_manager import get_llm_manager
+
+    name = llm_name or get_llm_manager().default_llm or "default"
+    with _controllers_lock:
+        controller = _controllers.get(name)
+        if controller is None:
+            controller = _controllers[name] = AdmissionController(
+                name,
+                max_concurrency=settings.llm_concurrency_limits.get(name, settings.llm_max_concurrency),
+                max_queue=settings.admission_max_queue,
+                budgets={
+                    "interactive": settings.admission_budget_interactive,
+                    "standard": settings.admission_budget_standard,
+                    "batch": settings.admission_budget_batch,
+                },
+            )
+        return controller
+
+
+def admission_stats() -> Dict[str, Dict[str, float]]:
+    """État des contrôleurs d'admission (exposé dans /health/detailed)."""
+    with _controllers_lock:
+        controllers = dict(_controllers)
+    return {name: controller.stats() for name, controller in controllers.items()}
+
+
+def tier_config(tier: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Configuration LangChain portant le tier d'admission jusqu'au routeur (None sans tier)."""
+    return {"metadata": {TIER_METADATA_KEY: tier}} if tier else None
+
+
+def tier_from_config(config: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Tier d'admission d'une configuration LangChain (voir `tier_config`)."""
+    return ((config or {}).get("metadata") or {}).get(TIER_METADATA_KEY)
+
+
+@contextmanager
+def admitted(llm_name: Optional[str], tier: Optional[str]) -> Iterator[Optional[AdmissionTicket]]:
+    """Place de génération pour `llm_name` le temps du bloc (aucune sans tier)."""
+    if tier is None:
+        yield None
+        return
+    with get_admission_controller(llm_name).acquire_blocking(tier) as ticket:
+        yield ticket
+
+
+@asynccontextmanager
+async def aadmitted(llm_name: Optional[str], tier: Optional[str]) -> AsyncIterator[Optional[AdmissionTicket]]:
+    """Version asynchrone de `admitted`."""
+    if tier is None:
+        yield None
+        return
+    async with await get_admission_controller(llm_name).acquire(tier) as ticket:
+        yield ticket
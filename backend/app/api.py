@@ -2,14 +2,18 @@
 API FastAPI pour exposer le RAG photographie au frontend.
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.exceptions import RequestValidationError
-from pydantic import BaseModel, EmailStr, validator
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTasks as StarletteBackgroundTasks
+import anyio
+from pydantic import BaseModel, EmailStr, Field, validator
 from typing import List, Optional
 from fastapi import Query
+import asyncio
 import json
 import re
 import html
@@ -17,8 +21,21 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
-from .rag_pipeline import answer_question, answer_question_stream, _load_or_build_vector_store
-from .pipeline_components import RetrievalEngine
+from .rag_pipeline import (
+    answer_question,
+    answer_question_stream_async,
+    answer_questions,
+    _get_engine,
+    _load_or_build_vector_store,
+    _max_retrieval_docs,
+)
+from .compute_threads import apply_thread_policy
+from .loop_monitor import get_loop_monitor
+from .llm_manager import get_llm_manager
+from .admission import AdmissionRejected, get_admission_controller
+from .sse import coalesce_chunks, record_stream_outcome, sse_event
+from .conversation_memory import prepare_question, refresh_summary
+from .metadata_filter import RetrievalFilters
 from .monitoring_phoenix import initialize_phoenix, get_phoenix_monitor
 from .auth import (
     create_access_token,
@@ -107,6 +124,17 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
     return response
 
 
+# Refus du contrôle d'admission (file pleine : 429, attente trop longue : 503)
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Retourne le refus en JSON avec un en-tête Retry-After."""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 # Gestionnaire d'exceptions global pour garantir des réponses JSON
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -150,6 +178,15 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 async def startup_event():
     init_db()
 
+    # Éviter la sursouscription du CPU par FAISS / torch sous requêtes concurrentes
+    apply_thread_policy()
+
+    # Retard de la boucle d'événements (métrique event_loop.lag_ms)
+    get_loop_monitor().start()
+
+    # Modèles Ollama maintenus en mémoire (ping des modèles inactifs)
+    get_llm_manager().start_keep_warm()
+
     # Initialiser Phoenix monitoring
     try:
         phoenix_endpoint = os.getenv("PHOENIX_ENDPOINT", "http://localhost:6006")
@@ -159,6 +196,12 @@ async def startup_event():
         logger.warning(f"Phoenix monitoring non disponible: {e}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await get_loop_monitor().stop()
+    get_llm_manager().stop_keep_warm()
+
+
 # Sécurité pour les tokens JWT
 security = HTTPBearer()
 
@@ -246,6 +289,7 @@ class SourceInfo(BaseModel):
     path: str
     page: Optional[str] = None
     preview: str
+    score: Optional[float] = None  # Similarité cosinus avec la question
 
 
 class AnswerResponse(BaseModel):
@@ -432,10 +476,22 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
     }
 
 
+class RetrievalFilterRequest(BaseModel):
+    """Filtres optionnels appliqués dans la recherche vectorielle (et BM25)."""
+
+    source_document: Optional[List[str]] = None
+    section_type: Optional[List[str]] = None
+    min_confidence_ocr: Optional[float] = Field(None, ge=0.0, le=1.0)
+
+
 class ConversationRequest(BaseModel):
     conversation_id: Optional[int] = None
     question: str
     force_rebuild: bool = False
+    filters: Optional[RetrievalFilterRequest] = None
+
+    def retrieval_filters(self) -> Optional[RetrievalFilters]:
+        return RetrievalFilters.from_dict(self.filters.dict()) if self.filters else None
 
     @validator("question")
     def validate_question(cls, v):
@@ -444,6 +500,33 @@ class ConversationRequest(BaseModel):
         return input_sanitizer.sanitize_question(v)
 
 
+class BatchQuestionRequest(BaseModel):
+    questions: List[str] = Field(..., min_items=1, max_items=50)
+    force_rebuild: bool = False
+    filters: Optional[RetrievalFilterRequest] = None
+
+    @validator("questions", each_item=True)
+    def validate_question(cls, v):
+        return input_sanitizer.sanitize_question(v)
+
+
+class BatchAnswerItem(BaseModel):
+    question: str
+    answer: str
+    sources: List[SourceInfo]
+    num_sources: int
+    cached: bool = False
+    error: Optional[str] = None  # Génération en échec pour cette question
+
+
+class BatchAnswerResponse(BaseModel):
+    results: List[BatchAnswerItem]
+    timings: dict
+    num_questions: int
+    num_unique_chunks: int
+    num_errors: int = 0
+
+
 class ConversationResponse(BaseModel):
     id: int
     title: str
@@ -456,6 +539,7 @@ class MessageResponse(BaseModel):
     role: str
     content: str
     image_url: Optional[str] = None
+    truncated: bool = False
     created_at: str
 
 
@@ -486,6 +570,7 @@ async def get_messages(
             "role": msg.role,
             "content": msg.content,
             "image_url": msg.image_url,
+            "truncated": bool(msg.truncated),
             "created_at": msg.created_at.isoformat() if msg.created_at else "",
         }
         for msg in messages
@@ -516,19 +601,56 @@ async def delete_conversation_endpoint(
 
 
 async def generate_streaming_response(
-    question: str, conversation_id: int, db: Session, current_user: User, force_rebuild: bool = False
+    question: str,
+    conversation_id: int,
+    db: Session,
+    current_user: User,
+    force_rebuild: bool = False,
+    filters: Optional[RetrievalFilters] = None,
+    tier: str = "interactive",
+    request: Optional[Request] = None,
 ):
     """
     Génère une réponse en streaming et sauvegarde dans la DB.
+    La place de génération (tier `tier`) n'est prise que par la génération réellement lancée.
+
+    Le retrieval s'exécute dans un thread et les tokens arrivent via `astream` du LLM :
+    la boucle d'événements reste libre pour les autres requêtes pendant la génération.
+
+    Si le client se déconnecte (onglet fermé), la génération LLM est annulée et la
+    réponse partielle est sauvegardée avec `truncated=True`.
     """
     full_answer = ""
     sources = []
+    saved = False
+    disconnected = False
+
+    async def tokens():
+        # Texte brut accumulé avant regroupement en trames
+        nonlocal full_answer
+        async for chunk in answer_question_stream_async(
+            question, force_rebuild=force_rebuild, filters=filters, tier=tier
+        ):
+            if isinstance(chunk, str):
+                full_answer += chunk
+            yield chunk
 
+    # Tokens regroupés en trames `chunk` (toutes les N ms ou M octets)
+    frames = coalesce_chunks(tokens())
     try:
-        # Stream la réponse
-        for chunk in answer_question_stream(question, force_rebuild=force_rebuild):
-            # Vérifier si c'est le dernier chunk avec sources
-            if isinstance(chunk, dict) and "sources" in chunk:
+        async for chunk in frames:
+            if isinstance(chunk, str):
+                # Trame `chunk` déjà sérialisée
+                yield chunk
+                if request is not None and await request.is_disconnected():
+                    disconnected = True
+                    break
+            elif isinstance(chunk, dict) and "early_sources" in chunk:
+                # Sources connues dès la fin du retrieval : envoyées avant le premier token
+                sources = chunk["early_sources"]
+                yield sse_event({"type": "sources", "sources": sources, "early": True})
+            elif isinstance(chunk, dict) and "sources" in chunk:
+                # Dernier élément avec les sources
                 sources = chunk["sources"]
                 full_answer = chunk.get("full_answer", full_answer)
                 if not full_answer:
@@ -537,29 +659,28 @@ async def generate_streaming_response(
 
                 # Sauvegarder la réponse complète dans la DB
                 if full_answer:
-                    add_message(db, conversation_id, "assistant", full_answer)
+                    await run_in_threadpool(add_message, db, conversation_id, "assistant", full_answer)
+                    saved = True
 
                 # Envoyer les sources
-                yield f"data: {json.dumps({'type': 'sources', 'sources': sources})}\n\n"
-                # Envoyer le signal de fin
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                yield sse_event({"type": "sources", "sources": sources})
+                # Envoyer le signal de fin (avec les jalons serveur : sources, premier et dernier token)
+                yield sse_event({"type": "done", "timings": chunk.get("timings", {})})
                 break
-            elif isinstance(chunk, str):
-                # C'est un chunk de texte
-                full_answer += chunk
-                # Envoyer le chunk au client
-                yield f"data: {json.dumps({'type': 'chunk', 'content': chunk})}\n\n"
             else:
                 # Format inattendu, logger pour debug
                 print(f"Chunk inattendu: {type(chunk)} - {chunk}")
 
+        if disconnected:
+            return
+
         # Si on n'a pas reçu de sources, les récupérer manuellement
         if not sources and full_answer:
             try:
-                vector_store = _load_or_build_vector_store(force_rebuild=force_rebuild)
-                retriever_engine = RetrievalEngine(vector_store)
-                retriever = retriever_engine.get_retriever()
-                retrieved_docs = retriever.invoke(question)
+                vector_store = await run_in_threadpool(_load_or_build_vector_store, force_rebuild=force_rebuild)
+                # Moteur en cache (même retriever que le pipeline), pas un nouveau moteur par requête
+                engine = _get_engine(vector_store, _max_retrieval_docs(None))
+                retrieved_docs = await engine.retriever.ainvoke(question)
 
                 for doc in retrieved_docs:
                     source_info = {
@@ -571,7 +692,7 @@ async def generate_streaming_response(
                     sources.append(source_info)
 
                 if sources:
-                    yield f"data: {json.dumps({'type': 'sources', 'sources': sources})}\n\n"
+                    yield sse_event({"type": "sources", "sources": sources})
             except Exception as e:
                 print(f"Erreur lors de la récupération des sources: {e}")
 
@@ -579,18 +700,42 @@ async def generate_streaming_response(
         if full_answer:
             try:
                 # Vérifier si le message existe déjà
-                existing_messages = get_conversation_messages(db, conversation_id, current_user.id)
+                existing_messages = await run_in_threadpool(
+                    get_conversation_messages, db, conversation_id, current_user.id
+                )
                 if not existing_messages or existing_messages[-1].content != full_answer:
-                    add_message(db, conversation_id, "assistant", full_answer)
+                    await run_in_threadpool(add_message, db, conversation_id, "assistant", full_answer)
+                saved = True
             except Exception as e:
                 print(f"Erreur lors de la sauvegarde du message: {e}")
 
+    except (asyncio.CancelledError, GeneratorExit):
+        # Flux annulé par le serveur (client parti) : la génération LLM est annulée avec lui
+        disconnected = True
+        raise
+    except AdmissionRejected as e:
+        # Génération refusée (file pleine ou attente trop longue) : le client peut réessayer plus tard
+        yield sse_event({"type": "error", "message": e.detail, "status": e.status_code, "retry_after": e.retry_after})
     except Exception as e:
         import traceback
 
         error_details = traceback.format_exc()
         print(f"Erreur dans generate_streaming_response: {error_details}")
-        yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        yield sse_event({"type": "error", "message": str(e)})
+    finally:
+        # Protégé de l'annulation : fermer le flux LLM et sauvegarder la réponse partielle
+        with anyio.CancelScope(shield=True):
+            await frames.aclose()
+            if disconnected and full_answer and not saved:
+                try:
+                    await run_in_threadpool(
+                        add_message, db, conversation_id, "assistant", full_answer, truncated=True
+                    )
+                except Exception:
+                    logger.exception(
+                        f"Erreur lors de la sauvegarde de la réponse tronquée (conversation {conversation_id})"
+                    )
+        record_stream_outcome(full_answer, truncated=disconnected)
 
 
 @app.post("/ask/stream")
@@ -606,6 +751,9 @@ async def ask_question_stream(
     Sauvegarde automatiquement les messages dans la base de données.
     """
     try:
+        # Capacité vérifiée avant le début du flux : un refus prévisible part en 429/503 avec Retry-After
+        get_admission_controller().check("interactive")
+
         # Créer ou récupérer la conversation
         if conversation_data.conversation_id:
             conversation = get_conversation(db, conversation_data.conversation_id, current_user.id)
@@ -616,10 +764,23 @@ async def ask_question_stream(
 
         # Ajouter le message utilisateur
         add_message(db, conversation.id, "user", conversation_data.question)
+        # Question de suivi reformulée en question autonome (retrieval, caches et génération)
+        question = await run_in_threadpool(prepare_question, db, conversation.id, conversation_data.question)
+
+        # Après le flux : mettre à jour le résumé de la conversation
+        background = StarletteBackgroundTasks()
+        background.add_task(refresh_summary, conversation.id)
 
         return StreamingResponse(
             generate_streaming_response(
-                conversation_data.question, conversation.id, db, current_user, conversation_data.force_rebuild
+                question,
+                conversation.id,
+                db,
+                current_user,
+                conversation_data.force_rebuild,
+                filters=conversation_data.retrieval_filters(),
+                tier="interactive",
+                request=request,
             ),
             media_type="text/event-stream",
             headers={
@@ -627,8 +788,9 @@ async def ask_question_stream(
                 "Connection": "keep-alive",
                 "X-Accel-Buffering": "no",
             },
+            background=background,
         )
-    except HTTPException:
+    except (HTTPException, AdmissionRejected):
         raise
     except Exception as e:
         import traceback
@@ -652,6 +814,7 @@ async def ask_question_stream(
 async def ask_question(
     request: Request,
     conversation_data: ConversationRequest,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -671,15 +834,20 @@ async def ask_question(
         # Ajouter le message utilisateur
         add_message(db, conversation.id, "user", conversation_data.question)
 
-        # Obtenir la réponse du RAG
-        result = answer_question(
-            question=conversation_data.question,
+        # Obtenir la réponse du RAG hors de la boucle d'événements (place de génération du tier standard)
+        question = await run_in_threadpool(prepare_question, db, conversation.id, conversation_data.question)
+        result = await run_in_threadpool(
+            answer_question,
+            question=question,
             show_sources=True,
             force_rebuild=conversation_data.force_rebuild,
+            filters=conversation_data.retrieval_filters(),
+            tier="standard",
         )
 
-        # Ajouter la réponse de l'assistant
+        # Ajouter la réponse de l'assistant ; le résumé de la conversation est mis à jour après la réponse
         add_message(db, conversation.id, "assistant", result.get("answer", ""))
+        background_tasks.add_task(refresh_summary, conversation.id)
 
         # Convertir les sources en modèles Pydantic
         sources = [
@@ -697,12 +865,42 @@ async def ask_question(
             sources=sources,
             num_sources=result.get("num_sources", 0),
         )
-    except HTTPException:
+    except (HTTPException, AdmissionRejected):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement: {str(e)}")
 
 
+@app.post("/ask/batch", response_model=BatchAnswerResponse)
+@limiter.limit("5/minute")
+async def ask_questions_batch(
+    request: Request,
+    batch_data: BatchQuestionRequest,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Pose plusieurs questions en une fois (évaluation offline, jobs batch).
+    Encodage et recherche FAISS groupés ; les réponses ne sont pas sauvegardées dans une conversation.
+    """
+    filters = RetrievalFilters.from_dict(batch_data.filters.dict()) if batch_data.filters else None
+    # Capacité vérifiée avant le retrieval du batch entier
+    get_admission_controller().check("batch")
+    try:
+        # Tier batch : chaque génération est servie après les requêtes interactives et standard
+        return await run_in_threadpool(
+            answer_questions,
+            batch_data.questions,
+            force_rebuild=batch_data.force_rebuild,
+            filters=filters,
+            tier="batch",
+        )
+    except (HTTPException, AdmissionRejected):
+        # Refus d'admission : 429/503 avec Retry-After via le gestionnaire dédié
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors du traitement du batch: {str(e)}")
+
+
 # ========== Export de conversations ==========
 
 
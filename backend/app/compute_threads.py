@@ -0,0 +1,261 @@
+"""
+Politique de threads de calcul pour le retrieval (FAISS + modèle d'embedding).
+
+Par défaut FAISS (OpenMP) et torch/BLAS utilisent un thread par cœur. Quand le
+threadpool FastAPI exécute plusieurs requêtes en parallèle, chaque recherche et
+chaque encodage lancent autant de threads que de cœurs : le CPU est sursouscrit
+et la latence de queue explose. On fixe donc le nombre de threads intra-op à
+cœurs / requêtes concurrentes (ou à une valeur explicite).
+
+Le nombre de threads OpenMP (FAISS) est un réglage par thread : il est appliqué
+dans chaque thread de calcul (micro-batcher, shards, threadpool, single-flight) à
+sa première recherche, via `limit_current_thread`. Les limites de torch et des
+BLAS (threadpoolctl) sont globales au processus : elles ne sont posées qu'une fois,
+au démarrage de l'application (`apply_thread_policy`), avec les variables
+d'environnement (OMP_NUM_THREADS...) lues par les bibliothèques chargées ensuite.
+Rien n'est modifié à l'import du package.
+
+Mode benchmark :
+    python -m app.compute_threads --clients 8 --requests 50 --threads 1,2,4
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from .config import settings
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Tentative d'import de threadpoolctl (limite les threads BLAS de numpy)
+try:
+    from threadpoolctl import threadpool_limits
+
+    THREADPOOLCTL_AVAILABLE = True
+except ImportError:
+    THREADPOOLCTL_AVAILABLE = False
+
+_BLAS_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+_current_threads: Optional[int] = None
+_lock = threading.Lock()
+_thread_state = threading.local()
+
+
+def effective_concurrency() -> int:
+    """
+    Nombre de requêtes qui calculent en même temps sur le chemin de retrieval.
+    Avec le micro-batching, un seul worker encode et recherche pour toutes les requêtes ;
+    sans, on suppose le CPU saturé de requêtes (un thread chacune).
+    """
+    if settings.compute_concurrency > 0:
+        return settings.compute_concurrency
+    return 1 if settings.query_batching_enabled else (os.cpu_count() or 1)
+
+
+def threads_per_request(cpu_count: Optional[int] = None, concurrency: Optional[int] = None) -> int:
+    """Threads intra-op par requête : COMPUTE_THREADS, sinon cœurs / concurrence (au moins 1)."""
+    if settings.compute_threads > 0:
+        return settings.compute_threads
+    cpu_count = cpu_count or os.cpu_count() or 1
+    concurrency = concurrency or effective_concurrency()
+    return max(1, cpu_count // max(1, concurrency))
+
+
+def configure_thread_environment(num_threads: Optional[int] = None) -> None:
+    """
+    Pose OMP_NUM_THREADS, MKL_NUM_THREADS et OPENBLAS_NUM_THREADS (sans écraser l'environnement),
+    pour les runtimes qui lisent ces variables à leur chargement.
+    """
+    value = str(num_threads or threads_per_request())
+    for name in _BLAS_ENV_VARS:
+        os.environ.setdefault(name, value)
+
+
+def _set_omp_threads(num_threads: int) -> None:
+    """Threads OpenMP de FAISS pour le thread appelant (réglage propre à chaque thread)."""
+    try:
+        import faiss
+
+        faiss.omp_set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def _set_process_threads(num_threads: int) -> None:
+    """Limites de torch (intra-op) et des BLAS : globales au processus, tous threads confondus."""
+    try:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+    if THREADPOOLCTL_AVAILABLE:
+        threadpool_limits(limits=num_threads)
+
+
+def limit_current_thread() -> None:
+    """
+    Applique la limite OpenMP de FAISS au thread appelant, si ce n'est pas déjà fait.
+    Appelé en tête des calculs de retrieval : coût d'une lecture thread-local ensuite.
+    Ne touche pas aux limites globales (torch, BLAS) : une requête ne modifie pas celles des autres.
+    """
+    num_threads = _current_threads
+    if num_threads is None or getattr(_thread_state, "threads", None) == num_threads:
+        return
+    _set_omp_threads(num_threads)
+    _thread_state.threads = num_threads
+
+
+def apply_thread_policy(num_threads: Optional[int] = None) -> int:
+    """
+    Fixe le nombre de threads de calcul, une fois au démarrage de l'application : variables
+    d'environnement et limites globales de torch et des BLAS tout de suite, limite OpenMP
+    de FAISS au thread appelant puis à chaque thread de calcul à sa prochaine recherche.
+
+    Args:
+        num_threads: Nombre de threads (None = `threads_per_request()`)
+
+    Returns:
+        Nombre de threads appliqué
+    """
+    global _current_threads
+    num_threads = num_threads or threads_per_request()
+
+    with _lock:
+        configure_thread_environment(num_threads)
+        _set_process_threads(num_threads)
+        _current_threads = num_threads
+        limit_current_thread()
+
+    get_metrics_collector().set_gauge("compute.threads_per_request", num_threads)
+    logger.info(f"🧵 Threads de calcul par requête: {num_threads} (concurrence: {effective_concurrency()})")
+    return num_threads
+
+
+def get_thread_policy() -> Dict[str, Any]:
+    """État courant de la politique de threads (exposé dans les diagnostics)."""
+    return {
+        "threads_per_request": _current_threads,
+        "cpu_count": os.cpu_count(),
+        "concurrency": effective_concurrency(),
+    }
+
+
+# ---------- Benchmark ----------
+
+
+def _percentile(values: Sequence[float], percentile: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round((len(ordered) - 1) * percentile / 100)))
+    return ordered[index]
+
+
+def benchmark(
+    vector_store: Any,
+    questions: Sequence[str],
+    thread_counts: Sequence[int],
+    clients: int = 8,
+    requests_per_client: int = 20,
+    k: int = 4,
+    batcher: Optional[Any] = None,
+) -> List[Dict[str, float]]:
+    """
+    Mesure la latence du retrieval (encodage + recherche FAISS) sous `clients`
+    requêtes concurrentes, pour chaque nombre de threads.
+
+    Returns:
+        Une ligne par nombre de threads : threads, p50_ms, p99_ms, mean_ms, throughput_rps
+    """
+    from .vector_search import embed_queries, search_vectors
+
+    def _one_request(i: int) -> float:
+        question = questions[i % len(questions)]
+        start = time.perf_counter()
+        if batcher is not None:
+            batcher.search(vector_store, question, k)
+        else:
+            search_vectors(vector_store, embed_queries(vector_store, [question]), k)
+        return (time.perf_counter() - start) * 1000
+
+    results = []
+    for num_threads in thread_counts:
+        apply_thread_policy(num_threads)
+        _one_request(0)  # Échauffement (chargement paresseux, caches)
+        total = clients * requests_per_client
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            latencies = list(executor.map(_one_request, range(total)))
+        elapsed = time.perf_counter() - start
+        results.append(
+            {
+                "threads": num_threads,
+                "p50_ms": _percentile(latencies, 50),
+                "p99_ms": _percentile(latencies, 99),
+                "mean_ms": sum(latencies) / len(latencies),
+                "throughput_rps": total / elapsed if elapsed > 0 else 0.0,
+            }
+        )
+    return results
+
+
+DEFAULT_BENCHMARK_QUESTIONS = [
+    "Quelle ouverture choisir pour un portrait ?",
+    "Comment régler l'ISO en basse lumière ?",
+    "Quelle vitesse d'obturation pour figer un sujet en mouvement ?",
+    "Qu'est-ce que la règle des tiers ?",
+    "Comment augmenter la profondeur de champ ?",
+]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark des threads de calcul du retrieval")
+    parser.add_argument("--clients", type=int, default=8, help="Requêtes concurrentes")
+    parser.add_argument("--requests", type=int, default=20, help="Requêtes par client")
+    parser.add_argument("--threads", default="", help="Nombres de threads à tester (ex: 1,2,4)")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--batching", action="store_true", help="Passer par le micro-batcher")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    from .query_batcher import get_query_batcher
+    from .rag_pipeline import _load_or_build_vector_store
+
+    cpu_count = os.cpu_count() or 1
+    if args.threads:
+        thread_counts = [int(t) for t in args.threads.split(",")]
+    else:
+        thread_counts = sorted({1, 2, 4, cpu_count // max(1, args.clients) or 1, cpu_count})
+
+    vector_store = _load_or_build_vector_store()
+    rows = benchmark(
+        vector_store,
+        DEFAULT_BENCHMARK_QUESTIONS,
+        thread_counts,
+        clients=args.clients,
+        requests_per_client=args.requests,
+        k=args.k,
+        batcher=get_query_batcher() if args.batching else None,
+    )
+
+    print(f"CPU: {cpu_count} cœurs, {args.clients} clients concurrents, {args.requests} requêtes/client")
+    print(f"{'threads':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'moy. (ms)':>10} {'req/s':>8}")
+    for row in rows:
+        print(
+            f"{row['threads']:>8} {row['p50_ms']:>10.2f} {row['p99_ms']:>10.2f} "
+            f"{row['mean_ms']:>10.2f} {row['throughput_rps']:>8.1f}"
+        )
+    best = min(rows, key=lambda row: row["p99_ms"])
+    print(f"Meilleur p99 avec COMPUTE_THREADS={best['threads']}")
+
+
+if __name__ == "__main__":
+    main()
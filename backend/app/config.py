@@ -7,6 +7,26 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv(BASE_DIR / ".env")
 
 
+def _parse_int_mapping(value: str) -> dict:
+    """Parse « nom:valeur,nom:valeur » (ex: CONTEXT_TOKEN_BUDGETS=llama3:1024,gpt-4o-mini:3000)."""
+    mapping = {}
+    for item in value.split(","):
+        name, _, number = item.strip().rpartition(":")
+        if name and number.strip().isdigit():
+            mapping[name.strip()] = int(number)
+    return mapping
+
+
+def _parse_str_mapping(value: str) -> dict:
+    """Parse « nom:valeur,nom:valeur » avec des valeurs texte (ex: OLLAMA_KEEP_ALIVE_POLICY=ollama_small:-1)."""
+    mapping = {}
+    for item in value.split(","):
+        name, _, text = item.strip().partition(":")
+        if name and text.strip():
+            mapping[name.strip()] = text.strip()
+    return mapping
+
+
 class Settings:
     data_dir: Path = BASE_DIR / "data"
     vector_store_dir: Path = BASE_DIR / "storage" / "vector_store"
@@ -24,11 +44,117 @@ class Settings:
     # OPTIMISATION: Réduction du délai par défaut de 30ms à 5ms pour plus de rapidité
     streaming_delay: float = float(os.getenv("STREAMING_DELAY", "0.005"))  # 5ms par défaut (optimisé)
 
+    # Regroupement des tokens en trames SSE : envoi toutes les N ms ou dès M octets (0 = une trame par token)
+    sse_flush_interval_ms: float = float(os.getenv("SSE_FLUSH_INTERVAL_MS", "50"))
+    sse_flush_bytes: int = int(os.getenv("SSE_FLUSH_BYTES", "256"))
+
     # Nombre de documents à récupérer pour le RAG (défaut optimisé pour vitesse)
     num_retrieval_docs: int = int(os.getenv("NUM_RETRIEVAL_DOCS", "2"))  # 2 au lieu de 3 pour plus de rapidité
 
-    # Taille maximale du contexte (en caractères) pour limiter la latence
-    max_context_length: int = int(os.getenv("MAX_CONTEXT_LENGTH", "1500"))  # Limiter le contexte à 1500 caractères
+    # Budget du contexte en tokens (phrases entières, tokenizer du modèle) pour un temps au premier token prévisible
+    context_token_budget: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "512"))
+    # Budgets par modèle : « modèle:tokens,modèle:tokens »
+    context_token_budgets: dict = _parse_int_mapping(os.getenv("CONTEXT_TOKEN_BUDGETS", ""))
+
+    # Recherche hybride BM25 + vecteurs (fusion par Reciprocal Rank Fusion)
+    hybrid_search_enabled: bool = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+    hybrid_vector_k: int = int(os.getenv("HYBRID_VECTOR_K", "4"))  # Candidats FAISS (petit grâce au BM25)
+    hybrid_lexical_k: int = int(os.getenv("HYBRID_LEXICAL_K", "20"))  # Candidats BM25 (peu coûteux)
+    rrf_k: int = int(os.getenv("RRF_K", "60"))
+    bm25_k1: float = float(os.getenv("BM25_K1", "1.5"))
+    bm25_b: float = float(os.getenv("BM25_B", "0.75"))
+
+    # Micro-batching des requêtes concurrentes (un encodage + un index.search par batch)
+    query_batching_enabled: bool = os.getenv("QUERY_BATCHING_ENABLED", "true").lower() == "true"
+    query_batch_window_ms: float = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+    query_batch_max_size: int = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+
+    # Retrieval avec scores : seuil de pertinence (similarité cosinus) et k dynamique
+    retrieval_score_threshold: float = float(os.getenv("RETRIEVAL_SCORE_THRESHOLD", "0.3"))
+    retrieval_candidates: int = int(os.getenv("RETRIEVAL_CANDIDATES", "8"))  # Candidats fusionnés évalués
+    dynamic_k_enabled: bool = os.getenv("DYNAMIC_K_ENABLED", "true").lower() == "true"
+    dynamic_k_min: int = int(os.getenv("DYNAMIC_K_MIN", "1"))
+    dynamic_k_max: int = int(os.getenv("DYNAMIC_K_MAX", "3"))
+    dynamic_k_dominance_margin: float = float(os.getenv("DYNAMIC_K_DOMINANCE_MARGIN", "0.15"))
+    dynamic_k_score_band: float = float(os.getenv("DYNAMIC_K_SCORE_BAND", "0.1"))
+
+    # Diversification MMR des candidats (λ = 1 : pertinence pure, λ = 0 : diversité pure)
+    mmr_enabled: bool = os.getenv("MMR_ENABLED", "true").lower() == "true"
+    mmr_lambda: float = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+    # Reranking cross-encoder (CPU) des candidats ; ses scores (0-1) remplacent alors la similarité cosinus
+    rerank_enabled: bool = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+    rerank_model_name: str = os.getenv("RERANK_MODEL_NAME", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+    rerank_cache_size: int = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+    rerank_batch_size: int = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+
+    # Threads de calcul (FAISS OpenMP, torch, BLAS) par requête : 0 = cœurs / concurrence
+    compute_threads: int = int(os.getenv("COMPUTE_THREADS", "0"))
+    # Requêtes de retrieval calculant simultanément : 0 = auto (1 avec le micro-batching)
+    compute_concurrency: int = int(os.getenv("COMPUTE_CONCURRENCY", "0"))
+
+    # Index shardé par collection (sous-dossier de data/) : chaque shard est sauvegardé et reconstruit séparément
+    vector_store_sharded: bool = os.getenv("VECTOR_STORE_SHARDED", "false").lower() == "true"
+    shard_search_workers: int = int(os.getenv("SHARD_SEARCH_WORKERS", "4"))
+
+    # Nombre de générations LLM simultanées pour /ask/batch et answer_questions
+    batch_generation_concurrency: int = int(os.getenv("BATCH_GENERATION_CONCURRENCY", "4"))
+
+    # Cache sémantique des réponses (questions proches par similarité cosinus des embeddings)
+    semantic_cache_enabled: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    semantic_cache_threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    semantic_cache_max_entries: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+    semantic_cache_ttl: float = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))  # Secondes
+    semantic_cache_sample_rate: float = float(os.getenv("SEMANTIC_CACHE_SAMPLE_RATE", "0.05"))
+
+    # Coalescence des questions identiques en cours (une seule génération partagée)
+    single_flight_enabled: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+    # Routage sur plusieurs endpoints du LLM par défaut (OLLAMA_EXTRA_BASE_URLS) : charge, latence, disjoncteur
+    llm_router_enabled: bool = os.getenv("LLM_ROUTER_ENABLED", "true").lower() == "true"
+    llm_circuit_failure_threshold: int = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "3"))
+    llm_circuit_open_seconds: float = float(os.getenv("LLM_CIRCUIT_OPEN_SECONDS", "30"))
+    # Requête de couverture quand le premier token dépasse ce percentile des temps observés
+    llm_hedge_enabled: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    llm_hedge_percentile: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+
+    # Maintien en mémoire des modèles Ollama (keep_alive : « 30m », « 1h », « -1 » = toujours, « 0 » = décharger)
+    ollama_keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    # Politique par LLM : « nom:keep_alive,nom:keep_alive » (ex: ollama_small:-1)
+    ollama_keep_alive_policy: dict = _parse_str_mapping(os.getenv("OLLAMA_KEEP_ALIVE_POLICY", ""))
+    # Ping des modèles inactifs depuis N secondes pour éviter leur déchargement (0 = désactivé)
+    ollama_keep_warm_interval: float = float(os.getenv("OLLAMA_KEEP_WARM_INTERVAL", "600"))
+
+    # Cascade : questions simples vers un petit modèle (CASCADE_SMALL_MODEL, ex. llama3.2:1b), le reste au modèle par défaut
+    cascade_enabled: bool = os.getenv("CASCADE_ENABLED", "false").lower() == "true"
+    cascade_max_words: int = int(os.getenv("CASCADE_MAX_WORDS", "14"))  # Longueur maximale d'une question simple
+    cascade_min_score: float = float(os.getenv("CASCADE_MIN_SCORE", "0.5"))  # Pertinence minimale du meilleur chunk
+    cascade_min_margin: float = float(os.getenv("CASCADE_MIN_MARGIN", "0.05"))  # Écart avec le second chunk
+
+    # Calculs d'exposition (EV, expositions équivalentes, stops, hyperfocale) répondus sans LLM
+    calculator_enabled: bool = os.getenv("CALCULATOR_ENABLED", "true").lower() == "true"
+
+    # Mémoire de conversation : résumé glissant + derniers échanges, questions de suivi reformulées
+    conversation_memory_enabled: bool = os.getenv("CONVERSATION_MEMORY_ENABLED", "true").lower() == "true"
+    memory_recent_turns: int = int(os.getenv("MEMORY_RECENT_TURNS", "3"))  # Échanges gardés tels quels
+    memory_summary_max_tokens: int = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "200"))
+    memory_turn_max_tokens: int = int(os.getenv("MEMORY_TURN_MAX_TOKENS", "150"))  # Par message dans les prompts
+    memory_fold_batch: int = int(os.getenv("MEMORY_FOLD_BATCH", "4"))  # Messages repliés par mise à jour du résumé
+
+    # Contrôle d'admission : générations simultanées par LLM et file d'attente par priorité
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    # Limites par LLM : « nom:limite,nom:limite »
+    llm_concurrency_limits: dict = _parse_int_mapping(os.getenv("LLM_CONCURRENCY_LIMITS", ""))
+    admission_max_queue: int = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+    # Budgets de temps d'attente par tier (secondes) avant un refus 503
+    admission_budget_interactive: float = float(os.getenv("ADMISSION_BUDGET_INTERACTIVE", "10"))
+    admission_budget_standard: float = float(os.getenv("ADMISSION_BUDGET_STANDARD", "20"))
+    admission_budget_batch: float = float(os.getenv("ADMISSION_BUDGET_BATCH", "60"))
+
+    # Clients LLM mis en cache et sessions HTTP keep-alive partagées par fournisseur
+    llm_pool_connections: int = int(os.getenv("LLM_POOL_CONNECTIONS", "4"))  # Hôtes distincts en pool
+    llm_pool_maxsize: int = int(os.getenv("LLM_POOL_MAXSIZE", "16"))  # Connexions keep-alive par hôte
+    llm_client_idle_timeout: float = float(os.getenv("LLM_CLIENT_IDLE_TIMEOUT", "300"))  # Secondes
 
 
 settings = Settings()
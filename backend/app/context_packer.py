@@ -0,0 +1,177 @@
+"""
+Assemblage du contexte du prompt avec un budget en tokens.
+
+L'ancienne troncature (500 caractères par document, 1500 au total) coupait les
+chunks en pleine phrase et ne donnait aucune garantie sur la taille réelle du
+prompt. Ici on compte les tokens avec le tokenizer du modèle (tiktoken pour les
+modèles OpenAI) ou une approximation rapide, et on remplit un budget par modèle
+avec des phrases entières, en suivant l'ordre de pertinence des chunks.
+"""
+
+import logging
+import math
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from .config import settings
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Tentative d'import de tiktoken (tokenizer exact des modèles OpenAI)
+try:
+    import tiktoken
+
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Fin de phrase : ponctuation finale suivie d'un espace, ou saut de ligne
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+_WORD_OR_SYMBOL = re.compile(r"\w+|[^\w\s]")
+
+# Séparateur entre documents, identique à celui de la chaîne « stuff documents »
+DOCUMENT_SEPARATOR = "\n\n"
+
+
+def approximate_token_count(text: str) -> int:
+    """
+    Approximation rapide du nombre de tokens (BPE) : un token par symbole et par
+    tranche de 4 caractères d'un mot. Légèrement pessimiste pour le français.
+    """
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _WORD_OR_SYMBOL.findall(text))
+
+
+def token_counter_for(model_name: Optional[str]) -> Callable[[str], int]:
+    """Fonction de comptage des tokens pour un modèle (tokenizer exact si disponible)."""
+    if TIKTOKEN_AVAILABLE and model_name:
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except KeyError:
+            pass
+    return approximate_token_count
+
+
+def split_sentences(text: str) -> List[str]:
+    """Découpe un texte en phrases (ponctuation finale ou saut de ligne)."""
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+@dataclass
+class PackedContext:
+    """Contexte assemblé : documents réduits à leurs phrases retenues et nombre de tokens."""
+
+    documents: List[Document] = field(default_factory=list)
+    tokens: int = 0
+    budget: int = 0
+    dropped_sentences: int = 0
+
+    @property
+    def text(self) -> str:
+        return DOCUMENT_SEPARATOR.join(doc.page_content for doc in self.documents)
+
+
+class ContextPacker:
+    """Remplit un budget de tokens avec des phrases entières des chunks classés par pertinence."""
+
+    def __init__(self, budget: int, count_tokens: Callable[[str], int] = approximate_token_count):
+        """
+        Args:
+            budget: Nombre maximal de tokens du contexte
+            count_tokens: Fonction de comptage (tokenizer du modèle ou approximation)
+        """
+        self.budget = budget
+        self.count_tokens = count_tokens
+
+    def pack(self, documents: Sequence[Any]) -> PackedContext:
+        """
+        Assemble le contexte dans l'ordre des documents (du plus pertinent au moins pertinent).
+
+        Les phrases de chaque document sont prises dans l'ordre tant qu'elles tiennent
+        dans le budget ; au premier dépassement on passe au document suivant (pas de
+        phrase coupée, pas de trou au milieu d'un passage). Seule exception : si aucune
+        phrase ne tient, la première phrase du premier document est coupée au budget.
+        """
+        packed = PackedContext(budget=self.budget)
+        separator_tokens = self.count_tokens(DOCUMENT_SEPARATOR)
+
+        for doc in documents:
+            sentences = split_sentences(doc.page_content)
+            cost = separator_tokens if packed.documents else 0
+            kept: List[str] = []
+            for sentence in sentences:
+                # +1 : espace entre deux phrases
+                sentence_tokens = self.count_tokens(sentence) + (1 if kept else 0)
+                if packed.tokens + cost + sentence_tokens > self.budget:
+                    break
+                kept.append(sentence)
+                cost += sentence_tokens
+            packed.dropped_sentences += len(sentences) - len(kept)
+            if kept:
+                packed.documents.append(Document(page_content=" ".join(kept), metadata=doc.metadata))
+                packed.tokens += cost
+
+        if not packed.documents and documents:
+            # Aucune phrase entière ne tient (première phrase trop longue) : plutôt qu'un
+            # contexte vide, garder le début de la première phrase du chunk le plus pertinent
+            top = documents[0]
+            sentences = split_sentences(top.page_content)
+            truncated = self._truncate(sentences[0]) if sentences else ""
+            if truncated:
+                packed.documents.append(Document(page_content=truncated, metadata=top.metadata))
+                packed.tokens = self.count_tokens(truncated)
+                packed.dropped_sentences -= 1
+
+        metrics = get_metrics_collector()
+        metrics.record_histogram("context.packed_tokens", packed.tokens)
+        metrics.record_histogram("context.dropped_sentences", packed.dropped_sentences)
+        return packed
+
+    def _fits(self, text: str) -> bool:
+        return self.count_tokens(text) <= self.budget
+
+    def _truncate(self, sentence: str) -> str:
+        """Plus long début de la phrase (mots entiers, sinon caractères) tenant dans le budget, avec « … »."""
+        words = sentence.split()
+        count = _longest_prefix(len(words), lambda n: self._fits(" ".join(words[:n]) + "…"))
+        if count:
+            return " ".join(words[:count]) + "…"
+        # Premier mot trop long à lui seul : couper au caractère
+        count = _longest_prefix(len(sentence), lambda n: self._fits(sentence[:n] + "…"))
+        return sentence[:count] + "…" if count else ""
+
+
+def _longest_prefix(size: int, fits: Callable[[int], bool]) -> int:
+    """Plus grand n ≤ size tel que fits(n) (fits est croissant : recherche dichotomique)."""
+    low, high = 0, size
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def token_budget_for(model_name: Optional[str]) -> int:
+    """Budget de tokens du contexte pour un modèle (CONTEXT_TOKEN_BUDGETS, sinon CONTEXT_TOKEN_BUDGET)."""
+    return settings.context_token_budgets.get(model_name or "", settings.context_token_budget)
+
+
+_packers: Dict[Optional[str], ContextPacker] = {}
+_packers_lock = threading.Lock()
+
+
+def get_context_packer(model_name: Optional[str] = None) -> ContextPacker:
+    """Packer (budget et tokenizer) d'un modèle, construit une seule fois."""
+    with _packers_lock:
+        packer = _packers.get(model_name)
+        if packer is None:
+            packer = _packers[model_name] = ContextPacker(token_budget_for(model_name), token_counter_for(model_name))
+            logger.info(f"📐 Budget de contexte pour {model_name or 'défaut'}: {packer.budget} tokens")
+        return packer
@@ -0,0 +1,237 @@
+"""
+Mémoire de conversation bornée : résumé glissant + derniers échanges.
+
+Une question de suivi (« Et pour un portrait ? ») n'a pas de sens seule, mais
+ajouter tout l'historique au prompt le ferait grandir sans limite. Ici :
+
+- les anciens messages sont repliés, par lots, dans un résumé stocké avec la
+  conversation (`Conversation.summary`) : seuls les messages pas encore résumés
+  sont envoyés au LLM, avec le résumé précédent (mise à jour incrémentale) ;
+- les N derniers échanges sont gardés tels quels ;
+- une question de suivi est reformulée en question autonome à partir du résumé
+  et des derniers échanges. C'est cette question qui sert au retrieval, aux
+  caches et à la génération.
+
+Résumé, échanges récents et messages sont tronqués à un budget de tokens : la
+taille des prompts reste bornée quelle que soit la longueur de la conversation.
+"""
+
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .context_packer import approximate_token_count, split_sentences
+from .database import Conversation, SessionLocal
+from .db_chat import update_conversation_summary
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Questions qui dépendent de l'historique : pronoms, reprises. « il » impersonnel
+# (s'il, il faut, faut-il, il y a, il vaut mieux...) ne renvoie à rien de l'historique.
+_FOLLOW_UP = re.compile(
+    r"(?<![sS]['’])(?<!faut-)(?<!vaut-)\bils?\b(?!\s+(?:faut|y\s+a|vaut|fait)\b)|"
+    r"\b(elles?|ça|cela|ceci|celui|celle|ceux|ce réglage|cet? objectif|le même|la même|"
+    r"aussi|encore|plutôt|et (si|pour|avec|en)|dans ce cas|it|that|this|those)\b",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[^\W_]+")
+# Questions elliptiques (« Pourquoi ? », « Et après ? », « Combien de stops ? ») : au plus 3 mots,
+# commençant par un interrogatif ou un connecteur (« Le bokeh ? » reste une question autonome)
+_ELLIPTIC = re.compile(
+    r"^\W*(pourquoi|comment|combien|lequel|laquelle|lesquel(le)?s|quoi|et|mais|alors|donc|sinon|why|how|and)\b",
+    re.IGNORECASE,
+)
+_ELLIPTIC_MAX_WORDS = 3
+
+_CONDENSE_PROMPT = """Reformule la dernière question en une question autonome, compréhensible sans l'historique.
+Réponds uniquement par la question reformulée.
+
+Résumé de la conversation : {summary}
+
+Derniers échanges :
+{turns}
+
+Dernière question : {question}
+Question autonome :"""
+
+_SUMMARY_PROMPT = """Mets à jour le résumé d'une conversation de photographie avec les nouveaux échanges.
+Garde les sujets, réglages et matériel mentionnés. Au plus {max_words} mots. Réponds uniquement par le résumé.
+
+Résumé actuel : {summary}
+
+Nouveaux échanges :
+{turns}
+
+Résumé mis à jour :"""
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Garde les premières phrases entières de `text` dans `max_tokens` tokens (au moins un début de phrase)."""
+    if approximate_token_count(text) <= max_tokens:
+        return text
+    kept: List[str] = []
+    used = 0
+    for sentence in split_sentences(text):
+        tokens = approximate_token_count(sentence)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    if not kept:
+        # Première phrase trop longue : la couper (≈ 4 caractères par token)
+        return text[: max_tokens * 4].rstrip() + "…"
+    return " ".join(kept)
+
+
+def _format_turns(turns: List[Tuple[str, str]]) -> str:
+    labels = {"user": "Utilisateur", "assistant": "Assistant"}
+    return "\n".join(
+        f"{labels.get(role, role)} : {truncate_to_tokens(content, settings.memory_turn_max_tokens)}"
+        for role, content in turns
+    )
+
+
+def _llm_text(result: Any) -> str:
+    return (getattr(result, "content", result) or "").strip()
+
+
+def _memory_llm() -> Any:
+    """LLM des reformulations et résumés : petit modèle de la cascade s'il est enregistré."""
+    from .llm_manager import get_llm_manager
+
+    manager = get_llm_manager()
+    return manager.get_llm("ollama_small" if "ollama_small" in manager.llms else None)
+
+
+@dataclass
+class ConversationMemory:
+    """Résumé des anciens messages et derniers échanges (hors question courante)."""
+
+    summary: str = ""
+    recent: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def empty(self) -> bool:
+        return not self.summary and not self.recent
+
+
+def load_memory(conversation: Conversation, exclude_last: bool = True) -> ConversationMemory:
+    """
+    Mémoire d'une conversation : résumé stocké et derniers échanges.
+
+    Args:
+        conversation: Conversation (messages chargés par la relation)
+        exclude_last: Ignorer le dernier message (question courante déjà enregistrée)
+    """
+    messages = list(conversation.messages)
+    if exclude_last and messages:
+        messages = messages[:-1]
+    # Derniers échanges, plus les messages sortis de la fenêtre mais pas encore repliés dans le
+    # résumé (repli par lots) : sinon ils ne seraient ni dans le résumé ni dans les échanges.
+    # Borné à un lot de plus que la fenêtre si les résumés échouent.
+    window = max(0, settings.memory_recent_turns * 2)
+    start = max(0, len(messages) - window)
+    unsummarized = max(conversation.summary_message_count or 0, start - settings.memory_fold_batch)
+    recent = messages[min(start, unsummarized) :]
+    return ConversationMemory(
+        summary=conversation.summary or "",
+        recent=[(message.role, message.content) for message in recent],
+    )
+
+
+def is_follow_up(question: str) -> bool:
+    """Question qui dépend probablement de l'historique (reprise, pronom, question elliptique)."""
+    if _FOLLOW_UP.search(question):
+        return True
+    return len(_WORD.findall(question)) <= _ELLIPTIC_MAX_WORDS and bool(_ELLIPTIC.match(question))
+
+
+def condense_question(question: str, memory: ConversationMemory, llm: Optional[Any] = None) -> str:
+    """
+    Question autonome pour le retrieval, les caches et la génération.
+
+    Sans historique, ou si la question ne dépend pas de l'historique, elle est
+    renvoyée telle quelle (aucun appel LLM).
+    """
+    if memory.empty or not is_follow_up(question):
+        return question
+    start = time.perf_counter()
+    prompt = _CONDENSE_PROMPT.format(
+        summary=memory.summary or "(aucun)", turns=_format_turns(memory.recent) or "(aucun)", question=question
+    )
+    try:
+        standalone = _llm_text((llm or _memory_llm()).invoke(prompt)).splitlines()[0].strip()
+    except Exception as e:
+        logger.warning(f"Reformulation de la question impossible, question d'origine utilisée: {e}")
+        return question
+    metrics = get_metrics_collector()
+    metrics.increment("memory.condensed")
+    metrics.record_histogram("memory.condense_ms", (time.perf_counter() - start) * 1000)
+    if not standalone:
+        return question
+    logger.debug(f"💬 Question reformulée: {question!r} -> {standalone!r}")
+    return truncate_to_tokens(standalone, settings.memory_turn_max_tokens)
+
+
+def prepare_question(db: Session, conversation_id: int, question: str, llm: Optional[Any] = None) -> str:
+    """Question autonome pour une conversation (la question courante est déjà enregistrée)."""
+    if not settings.conversation_memory_enabled:
+        return question
+    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    if conversation is None:
+        return question
+    return condense_question(question, load_memory(conversation), llm=llm)
+
+
+def fold_summary(db: Session, conversation: Conversation, llm: Optional[Any] = None) -> bool:
+    """
+    Replie dans le résumé les messages sortis de la fenêtre des derniers échanges,
+    par lots d'au moins MEMORY_FOLD_BATCH messages.
+
+    Returns:
+        True si le résumé a été mis à jour
+    """
+    messages = list(conversation.messages)
+    window = settings.memory_recent_turns * 2
+    folded = conversation.summary_message_count or 0
+    pending = messages[folded : max(folded, len(messages) - window)]
+    if len(pending) < settings.memory_fold_batch:
+        return False
+
+    start = time.perf_counter()
+    max_tokens = settings.memory_summary_max_tokens
+    prompt = _SUMMARY_PROMPT.format(
+        max_words=max_tokens * 3 // 4,
+        summary=conversation.summary or "(vide)",
+        turns=_format_turns([(message.role, message.content) for message in pending]),
+    )
+    try:
+        summary = _llm_text((llm or _memory_llm()).invoke(prompt))
+    except Exception as e:
+        logger.warning(f"Mise à jour du résumé de la conversation {conversation.id} impossible: {e}")
+        return False
+    update_conversation_summary(db, conversation.id, truncate_to_tokens(summary, max_tokens), folded + len(pending))
+    get_metrics_collector().record_histogram("memory.summary_ms", (time.perf_counter() - start) * 1000)
+    logger.debug(f"💬 Résumé de la conversation {conversation.id} mis à jour ({len(pending)} messages repliés)")
+    return True
+
+
+def refresh_summary(conversation_id: int) -> None:
+    """Mise à jour du résumé après une réponse (tâche de fond, session de base de données dédiée)."""
+    if not settings.conversation_memory_enabled:
+        return
+    db = SessionLocal()
+    try:
+        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        if conversation is not None:
+            fold_summary(db, conversation)
+    except Exception as e:
+        logger.warning(f"Résumé de la conversation {conversation_id} non mis à jour: {e}")
+    finally:
+        db.close()
@@ -97,6 +97,9 @@ class Conversation(Base):
     title = Column(String(500), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Mémoire de conversation : résumé des anciens messages et nombre de messages déjà résumés
+    summary = Column(Text, nullable=True)
+    summary_message_count = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Relations
     user = relationship("User", back_populates="conversations")
@@ -115,6 +118,8 @@ class Message(Base):
     role = Column(String(50), nullable=False)  # 'user' ou 'assistant'
     content = Column(Text, nullable=False)
     image_url = Column(String(500), nullable=True)
+    # Réponse interrompue (client déconnecté pendant le streaming)
+    truncated = Column(Boolean, default=False, server_default="0", nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     # Relations
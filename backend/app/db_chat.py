@@ -41,6 +41,15 @@ def update_conversation_title(db: Session, conversation_id: int, user_id: int, t
     return conversation
 
 
+def update_conversation_summary(db: Session, conversation_id: int, summary: str, message_count: int) -> None:
+    """Enregistre le résumé d'une conversation et le nombre de messages qu'il couvre."""
+    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    if conversation:
+        conversation.summary = summary
+        conversation.summary_message_count = message_count
+        db.commit()
+
+
 def delete_conversation(db: Session, conversation_id: int, user_id: int) -> bool:
     """Supprime une conversation."""
     conversation = get_conversation(db, conversation_id, user_id)
@@ -51,10 +60,22 @@ def delete_conversation(db: Session, conversation_id: int, user_id: int) -> bool
     return False
 
 
-def add_message(db: Session, conversation_id: int, role: str, content: str, image_url: Optional[str] = None) -> Message:
-    """Ajoute un message à une conversation."""
+def add_message(
+    db: Session,
+    conversation_id: int,
+    role: str,
+    content: str,
+    image_url: Optional[str] = None,
+    truncated: bool = False,
+) -> Message:
+    """Ajoute un message à une conversation (`truncated` : réponse interrompue par le client)."""
     message = Message(
-        conversation_id=conversation_id, role=role, content=content, image_url=image_url, created_at=datetime.utcnow()
+        conversation_id=conversation_id,
+        role=role,
+        content=content,
+        image_url=image_url,
+        truncated=truncated,
+        created_at=datetime.utcnow(),
     )
     db.add(message)
 
@@ -0,0 +1,120 @@
+"""
+Diversification des chunks récupérés : Maximal Marginal Relevance (MMR) vectorisée
+et fusion des chunks voisins d'un même document.
+
+Le chunking se fait avec un recouvrement de 150 caractères : les meilleurs
+candidats sont souvent deux chunks adjacents de la même page, qui consomment
+le budget de contexte pour un contenu quasi identique.
+"""
+
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+from .hybrid_retrieval import ScoredChunk
+
+
+def _overlaps_textually(a: str, b: str, min_overlap: int = 50) -> bool:
+    """Vrai si la fin de l'un des textes est reprise au début de l'autre (recouvrement du splitter)."""
+    for first, second in ((a, b), (b, a)):
+        tail = first[-min_overlap:]
+        if len(tail) == min_overlap and tail in second[: len(tail) * 4]:
+            return True
+    return False
+
+
+def are_neighbours(doc_a: Any, doc_b: Any) -> bool:
+    """
+    Deux chunks sont voisins s'ils viennent du même document et sont adjacents
+    (`chunk_index` consécutifs ou plages `start_index` qui se recouvrent). Pour les
+    vector stores construits sans ces métadonnées, on détecte le recouvrement de texte.
+    """
+    meta_a, meta_b = doc_a.metadata, doc_b.metadata
+    if meta_a.get("source_document") != meta_b.get("source_document"):
+        return False
+    if meta_a.get("page") != meta_b.get("page"):
+        return False
+
+    if "chunk_index" in meta_a and "chunk_index" in meta_b:
+        return abs(int(meta_a["chunk_index"]) - int(meta_b["chunk_index"])) <= 1
+    if "start_index" in meta_a and "start_index" in meta_b:
+        start_a, start_b = int(meta_a["start_index"]), int(meta_b["start_index"])
+        end_a, end_b = start_a + len(doc_a.page_content), start_b + len(doc_b.page_content)
+        return start_a < end_b and start_b < end_a
+    return _overlaps_textually(doc_a.page_content, doc_b.page_content)
+
+
+def mmr_order(
+    relevance: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.7,
+    excluded_pairs: Optional[np.ndarray] = None,
+) -> List[int]:
+    """
+    Sélection MMR : à chaque étape, argmax de λ·pertinence − (1−λ)·max(similarité aux déjà choisis).
+
+    Args:
+        relevance: Similarité de chaque candidat avec la question (N,)
+        vectors: Vecteurs des candidats (N, d)
+        k: Nombre de candidats à sélectionner
+        lambda_mult: 1.0 = pertinence pure, 0.0 = diversité pure
+        excluded_pairs: Matrice booléenne (N, N) ; un candidat voisin d'un candidat choisi est écarté
+
+    Returns:
+        Indices des candidats sélectionnés, dans l'ordre de sélection
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1.0, norms)
+    similarity = unit @ unit.T
+
+    max_redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+
+    while len(selected) < k and available.any():
+        redundancy = np.where(np.isfinite(max_redundancy), max_redundancy, 0.0)
+        mmr = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        chosen = int(np.argmax(np.where(available, mmr, -np.inf)))
+        selected.append(chosen)
+        available[chosen] = False
+        if excluded_pairs is not None:
+            available &= ~excluded_pairs[chosen]
+        max_redundancy = np.maximum(max_redundancy, similarity[:, chosen])
+
+    return selected
+
+
+def diversify(chunks: Sequence[ScoredChunk], k: int, lambda_mult: float = 0.7) -> List[ScoredChunk]:
+    """
+    Re-classe les candidats par MMR et écarte les voisins (chunks qui se recouvrent)
+    d'un chunk déjà retenu.
+
+    Args:
+        chunks: Candidats avec score et vecteur (`HybridRetriever.score_candidates`)
+        k: Nombre maximal de chunks retournés
+        lambda_mult: Compromis pertinence / diversité
+
+    Returns:
+        Au plus `k` chunks, dans l'ordre de sélection MMR
+    """
+    if not chunks:
+        return []
+    if any(chunk.vector is None for chunk in chunks):
+        return list(chunks[:k])
+
+    n = len(chunks)
+    neighbours = np.zeros((n, n), dtype=bool)
+    for i in range(n):
+        for j in range(i + 1, n):
+            if are_neighbours(chunks[i].document, chunks[j].document):
+                neighbours[i, j] = neighbours[j, i] = True
+
+    relevance = np.array([chunk.relevance for chunk in chunks], dtype=np.float32)
+    vectors = np.vstack([chunk.vector for chunk in chunks]).astype(np.float32)
+    order = mmr_order(relevance, vectors, k, lambda_mult=lambda_mult, excluded_pairs=neighbours)
+    return [chunks[i] for i in order]
@@ -0,0 +1,148 @@
+"""
+LLM factice déterministe pour les benchmarks et tests de charge (LLMProvider.FAKE).
+
+Sans Ollama, l'API ne peut pas être testée en charge ; avec Ollama, la variance
+du modèle masque les surcoûts du reste du pipeline (retrieval, admission, SSE...).
+Ce client simule un LLM au comportement reproductible :
+
+- réponse déterministe (même prompt, même réponse) ;
+- temps au premier token et débit (tokens/s) configurables, avec une gigue ;
+- injection d'erreurs (avant le premier token ou en cours de flux).
+
+Gigue et erreurs suivent une séquence pseudo-aléatoire initialisée par `seed` :
+deux exécutions du même scénario produisent les mêmes délais et les mêmes erreurs.
+Sélection par variable d'environnement : LLM_PROVIDER=fake (voir ENV_TEMPLATE.txt).
+"""
+
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import Field, PrivateAttr
+
+# Vocabulaire des réponses générées (tokens d'un mot suivi d'une espace)
+_VOCABULARY = (
+    "ouverture vitesse ISO diaphragme exposition lumière capteur objectif focale profondeur de champ "
+    "flou netteté bruit balance des blancs histogramme trépied stabilisation mise au point cadrage "
+    "composition contraste portrait paysage macro nuit mouvement f/2.8 f/8 1/500 1/60 100 3200"
+).split()
+
+
+class FakeLLMError(RuntimeError):
+    """Erreur injectée par le LLM factice."""
+
+
+class BenchmarkLLM(LLM):
+    """LLM factice : réponses déterministes, latence et erreurs configurables."""
+
+    model_name: str = "fake-llm"
+    ttft_ms: float = 200.0  # Temps au premier token
+    tokens_per_second: float = 50.0  # Débit après le premier token (0 = instantané)
+    jitter: float = 0.1  # Variation relative des délais (0.1 = ±10 %)
+    error_rate: float = 0.0  # Probabilité d'échec d'un appel
+    error_after_tokens: Optional[int] = None  # None = échec avant le premier token
+    answer_tokens: int = 60  # Longueur des réponses
+    seed: int = 42
+    calls: int = Field(default=0, exclude=True)
+    _rng: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {
+            "model_name": self.model_name,
+            "ttft_ms": self.ttft_ms,
+            "tokens_per_second": self.tokens_per_second,
+            "answer_tokens": self.answer_tokens,
+            "seed": self.seed,
+        }
+
+    def answer_for(self, prompt: str) -> List[str]:
+        """Tokens de la réponse, fonction du prompt seul."""
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        return [rng.choice(_VOCABULARY) + " " for _ in range(self.answer_tokens)]
+
+    def _plan(self, prompt: str) -> tuple:
+        """(tokens, délai du premier token, délai entre tokens, position de l'erreur ou None)."""
+        with self._lock:
+            self.calls += 1
+            factor = 1 + self._rng.uniform(-self.jitter, self.jitter)
+            fails = self._rng.random() < self.error_rate
+        tokens = self.answer_for(prompt)
+        first_delay = max(0.0, self.ttft_ms / 1000 * factor)
+        token_delay = max(0.0, factor / self.tokens_per_second) if self.tokens_per_second > 0 else 0.0
+        error_at = (self.error_after_tokens or 0) if fails else None
+        return tokens, first_delay, token_delay, error_at
+
+    @staticmethod
+    def _fail(position: int) -> FakeLLMError:
+        return FakeLLMError(f"Erreur injectée par le LLM factice (après {position} tokens)")
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        tokens, first_delay, token_delay, error_at = self._plan(prompt)
+        time.sleep(first_delay)
+        for i, token in enumerate(tokens):
+            if i == error_at:
+                raise self._fail(i)
+            if i:
+                time.sleep(token_delay)
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield GenerationChunk(text=token)
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        tokens, first_delay, token_delay, error_at = self._plan(prompt)
+        await asyncio.sleep(first_delay)
+        for i, token in enumerate(tokens):
+            if i == error_at:
+                raise self._fail(i)
+            if i:
+                await asyncio.sleep(token_delay)
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield GenerationChunk(text=token)
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join([chunk.text async for chunk in self._astream(prompt, stop, run_manager, **kwargs)])
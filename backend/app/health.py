@@ -229,4 +229,36 @@ class HealthChecker:
             "timers": timer_stats,
         }
 
+        # Retard de la boucle d'événements (appels bloquants exécutés sur la boucle)
+        from .loop_monitor import get_loop_monitor
+
+        health["event_loop"] = get_loop_monitor().stats()
+
+        # Cache sémantique des réponses (réglage du seuil de similarité)
+        from .semantic_cache import get_semantic_cache
+
+        health["semantic_cache"] = get_semantic_cache().stats()
+
+        # Contrôle d'admission : générations en cours et files d'attente par LLM
+        from .admission import admission_stats
+
+        health["admission"] = admission_stats()
+
+        # Voie rapide du calculateur d'exposition : réponses calculées et replis vers le RAG
+        from .photo_calculator import calculator_stats
+
+        health["calculator"] = calculator_stats()
+
+        # Réutilisation des clients LLM et des connexions HTTP keep-alive
+        try:
+            from .llm_manager import get_llm_manager
+
+            health["llm_connections"] = get_llm_manager().connection_stats()
+            # Cascade petit / grand modèle : routage, latence par tier, taux d'escalade
+            cascade = get_llm_manager().get_cascade()
+            if cascade is not None:
+                health["model_cascade"] = cascade.stats()
+        except Exception as e:
+            logger.warning(f"Impossible de récupérer les stats des clients LLM: {e}")
+
         return health
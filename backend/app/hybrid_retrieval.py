@@ -0,0 +1,199 @@
+"""
+Retrieval hybride : fusion des candidats lexicaux (BM25) et vectoriels (FAISS).
+"""
+
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from .query_batcher import VectorHits
+from .vector_search import documents_at, embed_queries, exact_relevance, reconstruct_vectors, search_vectors
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Fusionne plusieurs classements par Reciprocal Rank Fusion.
+
+    score(d) = somme sur les classements de 1 / (k + rang(d)), rang commençant à 1.
+
+    Args:
+        rankings: Listes de positions, chacune triée de la plus à la moins pertinente
+        k: Constante d'amortissement (60 dans l'article original)
+
+    Returns:
+        Liste de (position, score RRF) triée par score décroissant
+    """
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            fused[position] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+@dataclass(eq=False)
+class ScoredChunk:
+    """Chunk candidat avec son score de similarité (cosinus) et son score de fusion."""
+
+    position: int
+    chunk_id: str
+    document: Document
+    score: float
+    fused_score: float
+    vector: Optional[np.ndarray] = None
+    rerank_score: Optional[float] = None
+
+    @property
+    def relevance(self) -> float:
+        """Score du cross-encoder s'il a été appliqué, sinon similarité cosinus."""
+        return self.score if self.rerank_score is None else self.rerank_score
+
+
+def select_by_score(
+    chunks: Sequence[ScoredChunk],
+    threshold: float,
+    min_k: int = 1,
+    max_k: int = 4,
+    dominance_margin: float = 0.15,
+    score_band: float = 0.1,
+) -> List[ScoredChunk]:
+    """
+    Seuil de pertinence + k dynamique (sur `ScoredChunk.relevance`).
+
+    - les chunks sous `threshold` sont écartés (en gardant au moins `min_k` chunks) ;
+    - si le meilleur chunk domine le suivant d'au moins `dominance_margin`, on ne garde que lui ;
+    - sinon (scores serrés) on garde tous les chunks à moins de `score_band` du meilleur, jusqu'à `max_k`.
+
+    L'ordre d'entrée (classement fusionné) est conservé.
+    """
+    if not chunks:
+        return []
+
+    by_score = sorted(chunks, key=lambda chunk: chunk.relevance, reverse=True)
+    relevant = [chunk for chunk in by_score if chunk.relevance >= threshold]
+    if len(relevant) < min_k:
+        relevant = by_score[:min_k]
+    if not relevant:
+        return []
+
+    best = relevant[0].relevance
+    if len(relevant) > 1 and best - relevant[1].relevance >= dominance_margin:
+        keep = max(1, min_k)
+    else:
+        keep = max(min_k, sum(1 for chunk in relevant if chunk.relevance >= best - score_band))
+    selected = {id(chunk) for chunk in relevant[: min(keep, max_k)]}
+    return [chunk for chunk in chunks if id(chunk) in selected]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever LangChain combinant BM25 et FAISS.
+
+    Le BM25 sert de générateur de candidats bon marché ; un petit `vector_k`
+    suffit donc côté FAISS. Sans index lexical, le retriever se comporte comme
+    une recherche vectorielle classique. Un `mask` (filtres de métadonnées) est
+    appliqué à l'intérieur des deux recherches. Avec un `batcher`, la partie
+    vectorielle passe par le micro-batcher partagé entre requêtes concurrentes.
+    """
+
+    vector_store: Any
+    lexical_index: Optional[Any] = None
+    mask: Optional[Any] = None
+    k: int = 4
+    vector_k: int = 4
+    lexical_k: int = 20
+    rrf_k: int = 60
+    batcher: Optional[Any] = None
+
+    @property
+    def vector_search_k(self) -> int:
+        """k de la recherche FAISS : `vector_k` avec le BM25, sinon au moins `k` (seule source de candidats)."""
+        return self.vector_k if self.lexical_index is not None else max(self.k, self.vector_k)
+
+    def vector_hits(self, query: str) -> VectorHits:
+        """Recherche vectorielle seule (via le micro-batcher si configuré)."""
+        k = self.vector_search_k
+        if self.batcher is not None:
+            return self.batcher.search(self.vector_store, query, k, mask=self.mask)
+        query_vectors = embed_queries(self.vector_store, [query])
+        distances, positions = search_vectors(self.vector_store, query_vectors, k, mask=self.mask)
+        return VectorHits(distances=distances[0], positions=positions[0], query_vector=query_vectors[0])
+
+    def vector_hits_batch(
+        self, queries: Sequence[str], timings: Optional[Dict[str, float]] = None
+    ) -> List[VectorHits]:
+        """
+        Recherche vectorielle pour plusieurs questions : un seul encodage batch
+        et une seule recherche matricielle FAISS.
+
+        Args:
+            queries: Questions
+            timings: Dict optionnel complété avec `embedding_ms` et `search_ms`
+        """
+        start = time.perf_counter()
+        query_vectors = embed_queries(self.vector_store, queries)
+        embedded = time.perf_counter()
+        distances, positions = search_vectors(self.vector_store, query_vectors, self.vector_search_k, mask=self.mask)
+        if timings is not None:
+            timings["embedding_ms"] = (embedded - start) * 1000
+            timings["search_ms"] = (time.perf_counter() - embedded) * 1000
+        return [
+            VectorHits(distances=distances[i], positions=positions[i], query_vector=query_vectors[i])
+            for i in range(len(queries))
+        ]
+
+    def fuse(self, query: str, hits: VectorHits) -> List[Tuple[int, float]]:
+        """Fusionne les résultats vectoriels d'une question avec ses candidats BM25."""
+        vector_ranking = [int(p) for p in hits.positions if p >= 0]
+
+        if self.lexical_index is None:
+            return [(position, 1.0 / (self.rrf_k + rank)) for rank, position in enumerate(vector_ranking, start=1)]
+
+        lexical_hits = self.lexical_index.search(query, self.lexical_k, allowed=self.mask)
+        lexical_ranking = [position for position, _ in lexical_hits]
+        return reciprocal_rank_fusion([vector_ranking, lexical_ranking], k=self.rrf_k)
+
+    def rank(self, query: str) -> List[Tuple[int, float]]:
+        """Retourne les positions FAISS fusionnées (position, score RRF), meilleures en premier."""
+        return self.fuse(query, self.vector_hits(query))
+
+    def score_candidates(self, hits: VectorHits, fused: Sequence[Tuple[int, float]]) -> List[ScoredChunk]:
+        """
+        Attache à chaque candidat fusionné son score de similarité exact avec la question
+        (y compris pour les candidats venus uniquement du BM25).
+        """
+        positions = [position for position, _ in fused]
+        vectors = reconstruct_vectors(self.vector_store, positions)
+        scores = exact_relevance(self.vector_store, hits.query_vector, vectors)
+        documents = documents_at(self.vector_store, positions)
+        return [
+            ScoredChunk(
+                position=position,
+                chunk_id=self.vector_store.index_to_docstore_id[position],
+                document=document,
+                score=float(score),
+                fused_score=fused_score,
+                vector=vector,
+            )
+            for (position, fused_score), document, score, vector in zip(fused, documents, scores, vectors)
+        ]
+
+    def retrieve_scored(self, query: str, n_candidates: Optional[int] = None) -> List[ScoredChunk]:
+        """Retourne les `n_candidates` meilleurs candidats fusionnés, avec leurs scores."""
+        hits = self.vector_hits(query)
+        return self.score_candidates(hits, self.fuse(query, hits)[: n_candidates or self.k])
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        ranked = self.rank(query)[: self.k]
+        return documents_at(self.vector_store, [position for position, _ in ranked])
@@ -0,0 +1,183 @@
+"""
+Index inversé BM25 persistant pour la recherche lexicale.
+
+Les questions de photographie contiennent beaucoup de tokens techniques exacts
+("f/2.8", "1/250", "ISO 3200") que les embeddings MiniLM rapprochent mal.
+Cet index sert de générateur de candidats rapide, fusionné ensuite avec FAISS.
+"""
+
+import json
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_FILENAME = "bm25_index.json"
+
+# Mots vides français (et quelques mots anglais fréquents dans les manuels)
+STOPWORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "c", "d", "dans", "de", "des", "du", "elle", "en", "est", "et",
+    "il", "ils", "je", "j", "l", "la", "le", "les", "leur", "lui", "ma", "mais", "me", "mes", "moi", "mon",
+    "ne", "nos", "notre", "nous", "on", "ou", "par", "pas", "pour", "qu", "que", "qui", "s", "sa", "se",
+    "ses", "son", "sur", "ta", "te", "tes", "toi", "ton", "tu", "un", "une", "vos", "votre", "vous", "y",
+    "quoi", "comment", "quel", "quelle", "quels", "quelles", "est-ce", "the", "of", "and", "to", "in",
+}
+
+# Ordre important : les motifs techniques passent avant les mots simples
+_TOKEN_PATTERN = re.compile(
+    r"f/?\d+(?:[.,]\d+)?"  # ouverture : f/2.8, f2,8, f8
+    r"|\d+/\d+"  # vitesse : 1/250
+    r"|\d+(?:[.,]\d+)?"  # nombres : 3200, 2.8
+    r"|[a-z]+"  # mots
+)
+
+
+def _strip_accents(text: str) -> str:
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in normalized if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Découpe un texte en tokens normalisés en préservant les réglages photo.
+
+    "ISO 3200 à f/2,8 et 1/250s" -> ["iso", "3200", "iso3200", "f/2.8", "1/250"]
+    """
+    text = _strip_accents(text.lower())
+    tokens: List[str] = []
+    previous = None
+    for match in _TOKEN_PATTERN.finditer(text):
+        token = match.group(0).replace(",", ".")
+        if token[0] == "f" and len(token) > 1 and (token[1] == "/" or token[1].isdigit()):
+            token = "f/" + token.lstrip("f/")
+        if token in STOPWORDS:
+            previous = None
+            continue
+        tokens.append(token)
+        # "ISO 3200" est aussi indexé comme un token composé "iso3200"
+        if previous == "iso" and token.isdigit():
+            tokens.append(f"iso{token}")
+        previous = token
+    return tokens
+
+
+class BM25Index:
+    """
+    Index inversé BM25 (Okapi) aligné sur les positions du vector store FAISS.
+
+    Le document i de l'index correspond à la position i de l'index FAISS,
+    ce qui permet de fusionner directement les candidats lexicaux et vectoriels.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.avgdl: float = 0.0
+        self._idf: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], doc_ids: Sequence[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """
+        Construit l'index à partir des textes des chunks.
+
+        Args:
+            texts: Contenu des chunks, dans l'ordre des positions FAISS
+            doc_ids: Identifiants docstore correspondants (même ordre)
+            k1: Saturation de la fréquence des termes
+            b: Normalisation par la longueur des documents
+        """
+        index = cls(k1=k1, b=b)
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for position, text in enumerate(texts):
+            term_counts = Counter(tokenize(text))
+            index.doc_lengths.append(sum(term_counts.values()))
+            for term, tf in term_counts.items():
+                postings[term].append((position, tf))
+        index.doc_ids = list(doc_ids)
+        if len(index.doc_ids) != len(index.doc_lengths):
+            raise ValueError("Le nombre d'identifiants ne correspond pas au nombre de textes")
+        index.postings = dict(postings)
+        index._finalize()
+        return index
+
+    def _finalize(self) -> None:
+        n_docs = len(self.doc_lengths)
+        self.avgdl = (sum(self.doc_lengths) / n_docs) if n_docs else 0.0
+        self._idf = {
+            term: math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+    def search(self, query: str, k: int = 10, allowed: Optional[Sequence[bool]] = None) -> List[Tuple[int, float]]:
+        """
+        Recherche les k meilleurs chunks pour une requête.
+
+        Args:
+            query: Texte de la requête
+            k: Nombre de résultats
+            allowed: Masque optionnel (par position) des chunks autorisés
+
+        Returns:
+            Liste de (position, score BM25) triée par score décroissant
+        """
+        if not self.doc_lengths or k <= 0:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        avgdl = self.avgdl or 1.0
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self._idf[term]
+            for position, tf in plist:
+                if allowed is not None and not allowed[position]:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / avgdl)
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+    # ---------- Persistance ----------
+
+    def save(self, storage_dir: Path) -> Path:
+        """Sauvegarde l'index au format JSON à côté de l'index FAISS."""
+        path = Path(storage_dir) / LEXICAL_INDEX_FILENAME
+        payload = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        logger.info(f"Index BM25 sauvegardé ({len(self)} chunks, {len(self.postings)} termes)")
+        return path
+
+    @classmethod
+    def load(cls, storage_dir: Path) -> "BM25Index":
+        """Charge un index précédemment sauvegardé avec `save`."""
+        path = Path(storage_dir) / LEXICAL_INDEX_FILENAME
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        index = cls(k1=payload["k1"], b=payload["b"])
+        index.doc_ids = payload["doc_ids"]
+        index.doc_lengths = payload["doc_lengths"]
+        index.postings = {term: [tuple(p) for p in plist] for term, plist in payload["postings"].items()}
+        index._finalize()
+        return index
+
+    @staticmethod
+    def exists(storage_dir: Path) -> bool:
+        return (Path(storage_dir) / LEXICAL_INDEX_FILENAME).exists()
@@ -0,0 +1,406 @@
+"""
+Clients HTTP partagés (keep-alive, pool de connexions) pour les fournisseurs LLM.
+
+Sans pool, chaque question ouvre une nouvelle connexion TCP (et TLS pour les
+fournisseurs distants). Ici une session par fournisseur est partagée entre
+tous les clients LLM, avec des pools bornés et une éviction des sessions inactives.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_community.llms import Ollama
+from langchain_community.llms.ollama import OllamaEndpointNotFoundError
+from pydantic import Field
+
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Au-delà de ce seuil, le `load_duration` renvoyé par Ollama correspond à un (re)chargement
+# du modèle en mémoire (quelques ms seulement quand le modèle est déjà chargé)
+MODEL_LOAD_THRESHOLD_MS = 500.0
+
+# Dernière réponse reçue par (base_url, modèle) : un modèle actif n'a pas besoin d'être maintenu chaud
+_model_activity: Dict[Tuple[str, str], float] = {}
+
+
+def record_model_response(base_url: str, model: str, load_ms: Optional[float] = None) -> None:
+    """Enregistre une réponse d'Ollama ; compte un chargement de modèle si `load_duration` est élevé."""
+    _model_activity[(base_url, model)] = time.time()
+    if load_ms is None:
+        return
+    metrics = get_metrics_collector()
+    metrics.record_histogram("llm.load_duration_ms", load_ms, tags={"model": model})
+    if load_ms >= MODEL_LOAD_THRESHOLD_MS:
+        metrics.increment("llm.model_loads", tags={"model": model})
+        logger.info(f"🐢 Modèle {model} (re)chargé par Ollama en {load_ms:.0f}ms")
+
+
+def last_model_activity(base_url: str, model: str) -> Optional[float]:
+    """Date de la dernière réponse d'Ollama pour ce modèle (None si aucune)."""
+    return _model_activity.get((base_url, model))
+
+
+class PooledOllama(Ollama):
+    """
+    Client Ollama utilisant une `requests.Session` partagée (connexions keep-alive)
+    au lieu de `requests.post` (nouvelle connexion à chaque appel), et une
+    `aiohttp.ClientSession` partagée pour le streaming asynchrone au lieu d'une
+    session (et d'une connexion) par appel.
+    """
+
+    session: Optional[Any] = Field(default=None, exclude=True)
+    # Renvoie la session aiohttp partagée de la boucle d'événements courante
+    async_session: Optional[Callable[[], Any]] = Field(default=None, exclude=True)
+
+    def _build_request_payload(self, payload: Any, stop: Optional[List[str]] = None, **kwargs: Any) -> Dict[str, Any]:
+        # Même construction que `_OllamaCommon._create_stream`
+        if self.stop is not None and stop is not None:
+            raise ValueError("`stop` found in both the input and default params.")
+        elif self.stop is not None:
+            stop = self.stop
+
+        params = self._default_params
+        for key in self._default_params:
+            if key in kwargs:
+                params[key] = kwargs[key]
+
+        if "options" in kwargs:
+            params["options"] = kwargs["options"]
+        else:
+            params["options"] = {
+                **params["options"],
+                "stop": stop,
+                **{k: v for k, v in kwargs.items() if k not in self._default_params},
+            }
+
+        if payload.get("messages"):
+            return {"messages": payload.get("messages", []), **params}
+        return {"prompt": payload.get("prompt"), "images": payload.get("images", []), **params}
+
+    def _observe(self, line: str) -> None:
+        # Dernière ligne d'une réponse : durée de chargement du modèle (en ns)
+        if '"done"' not in line:
+            return
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return
+        if data.get("done"):
+            load_ns = data.get("load_duration")
+            record_model_response(self.base_url, self.model, load_ns / 1e6 if load_ns is not None else None)
+
+    def _observed(self, lines: Iterator[str]) -> Iterator[str]:
+        for line in lines:
+            self._observe(line)
+            yield line
+
+    async def _acreate_stream(
+        self,
+        api_url: str,
+        payload: Any,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        if self.async_session is None:
+            async for line in super()._acreate_stream(api_url, payload, stop=stop, **kwargs):
+                self._observe(line)
+                yield line
+            return
+
+        response = await self.async_session().post(
+            url=api_url,
+            headers={
+                "Content-Type": "application/json",
+                **(self.headers if isinstance(self.headers, dict) else {}),
+            },
+            auth=self.auth,
+            json=self._build_request_payload(payload, stop=stop, **kwargs),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        # Libérer la réponse même si le consommateur s'arrête en cours de route (annulation) :
+        # la connexion retourne alors au pool (ou est fermée si le corps n'a pas été lu).
+        try:
+            if response.status != 200:
+                detail = await response.text()
+                if response.status == 404:
+                    raise OllamaEndpointNotFoundError(
+                        "Ollama call failed with status code 404. "
+                        "Maybe your model is not found "
+                        f"and you should pull the model with `ollama pull {self.model}`."
+                    )
+                raise ValueError(f"Ollama call failed with status code {response.status}. Details: {detail}")
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8").strip()
+                if line:
+                    self._observe(line)
+                    yield line
+        finally:
+            response.release()
+
+    def _create_stream(
+        self,
+        api_url: str,
+        payload: Any,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[str]:
+        if self.session is None:
+            return self._observed(super()._create_stream(api_url, payload, stop=stop, **kwargs))
+
+        response = self.session.post(
+            url=api_url,
+            headers={
+                "Content-Type": "application/json",
+                **(self.headers if isinstance(self.headers, dict) else {}),
+            },
+            auth=self.auth,
+            json=self._build_request_payload(payload, stop=stop, **kwargs),
+            stream=True,
+            timeout=self.timeout,
+        )
+        response.encoding = "utf-8"
+        if response.status_code != 200:
+            detail = response.text
+            response.close()
+            if response.status_code == 404:
+                raise OllamaEndpointNotFoundError(
+                    "Ollama call failed with status code 404. "
+                    "Maybe your model is not found "
+                    f"and you should pull the model with `ollama pull {self.model}`."
+                )
+            raise ValueError(f"Ollama call failed with status code {response.status_code}. Details: {detail}")
+        return self._observed(self._iter_lines(response))
+
+    @staticmethod
+    def _iter_lines(response: requests.Response) -> Iterator[str]:
+        # Fermer la réponse même si le consommateur s'arrête en cours de route :
+        # la connexion retourne alors au pool (ou est fermée si le corps n'a pas été lu).
+        try:
+            yield from response.iter_lines(decode_unicode=True)
+        finally:
+            response.close()
+
+
+class _PooledSession:
+    """Session HTTP d'un fournisseur et ses statistiques d'utilisation."""
+
+    def __init__(self, client: Any, kind: str):
+        self.client = client
+        self.kind = kind
+        self.last_used = time.time()
+        self.requests = 0
+        self.connections = 0
+        self.idle_releases = 0
+        # Boucle d'événements d'une session `aiohttp` (une session n'est utilisable que dans sa boucle)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Compteurs des pools urllib3 déjà libérés (les pools sont recréés à la demande)
+        self._released_requests = 0
+        self._released_connections = 0
+
+    def touch(self) -> None:
+        self.last_used = time.time()
+
+    def _pool_counts(self) -> Tuple[int, int]:
+        """(connexions ouvertes, requêtes servies) d'après les pools urllib3 actuels."""
+        connections = requests_served = 0
+        # Le même adaptateur est monté pour http:// et https://
+        adapters = {id(adapter): adapter for adapter in self.client.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    requests_served += pool.num_requests
+        return connections, requests_served
+
+    def refresh(self) -> None:
+        """Met à jour le compteur de requêtes (et la date d'activité) d'une session `requests`."""
+        if self.kind != "requests":
+            return
+        _, requests_served = self._pool_counts()
+        total = self._released_requests + requests_served
+        if total != self.requests:
+            self.requests = total
+            self.touch()
+
+    def release_idle_connections(self) -> None:
+        """
+        Ferme les connexions keep-alive. Pour `requests`, la session reste utilisable
+        (les pools sont recréés à la prochaine requête) ; pour `httpx`, l'expiration
+        keep-alive du client s'en charge déjà.
+        """
+        if self.kind != "requests":
+            return
+        connections, requests_served = self._pool_counts()
+        self._released_connections += connections
+        self._released_requests += requests_served
+        self.client.close()
+        self.idle_releases += 1
+
+    def stats(self) -> Dict[str, Any]:
+        self.refresh()
+        stats = {
+            "requests": self.requests,
+            "idle_seconds": round(time.time() - self.last_used, 1),
+            "idle_releases": self.idle_releases,
+        }
+        if self.kind == "requests":
+            connections = self._released_connections + self._pool_counts()[0]
+        elif self.kind == "aiohttp":
+            connections = self.connections
+        else:
+            pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+            connections = len(getattr(pool, "connections", [])) if pool is not None else None
+        if connections is not None:
+            stats["connections_opened"] = connections
+            stats["connections_reused"] = max(0, self.requests - connections)
+        return stats
+
+
+class ConnectionPools:
+    """Sessions HTTP partagées par fournisseur LLM, avec pools bornés et éviction sur inactivité."""
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 16, idle_timeout: float = 300.0):
+        """
+        Args:
+            pool_connections: Nombre d'hôtes distincts gardés en pool
+            pool_maxsize: Connexions keep-alive maximales par hôte
+            idle_timeout: Secondes d'inactivité avant fermeture des connexions
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, _PooledSession] = {}
+        self._lock = threading.Lock()
+
+    def requests_session(self, provider: str) -> requests.Session:
+        """Session `requests` partagée (Ollama)."""
+        with self._lock:
+            pooled = self._sessions.get(provider)
+            if pooled is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                pooled = self._sessions[provider] = _PooledSession(session, "requests")
+            pooled.touch()
+            return pooled.client
+
+    def httpx_client(self, provider: str, asynchronous: bool = False) -> Any:
+        """Client `httpx` partagé (OpenAI), keep-alive avec expiration des connexions inactives."""
+        import httpx
+
+        key = f"{provider}:async" if asynchronous else provider
+        with self._lock:
+            pooled = self._sessions.get(key)
+            if pooled is None:
+                limits = httpx.Limits(
+                    max_connections=self.pool_maxsize,
+                    max_keepalive_connections=self.pool_maxsize,
+                    keepalive_expiry=self.idle_timeout,
+                )
+                pooled = _PooledSession(None, "httpx")
+
+                def _count_request(request):
+                    pooled.requests += 1
+                    pooled.touch()
+
+                async def _acount_request(request):
+                    _count_request(request)
+
+                if asynchronous:
+                    pooled.client = httpx.AsyncClient(limits=limits, event_hooks={"request": [_acount_request]})
+                else:
+                    pooled.client = httpx.Client(limits=limits, event_hooks={"request": [_count_request]})
+                self._sessions[key] = pooled
+            pooled.touch()
+            return pooled.client
+
+    def aiohttp_session(self, provider: str) -> aiohttp.ClientSession:
+        """
+        Session `aiohttp` partagée (streaming Ollama asynchrone), pour la boucle d'événements courante.
+
+        Une session est liée à la boucle qui l'a créée : elle est recréée si la boucle change
+        (l'ancienne est fermée dans sa boucle si celle-ci tourne encore).
+        """
+        loop = asyncio.get_running_loop()
+        key = f"{provider}:aiohttp"
+        with self._lock:
+            pooled = self._sessions.get(key)
+            if pooled is None or pooled.loop is not loop or pooled.client.closed:
+                if pooled is not None:
+                    _close_aiohttp(pooled)
+                pooled = _PooledSession(None, "aiohttp")
+                pooled.loop = loop
+
+                async def _count_request(session, context, params):
+                    pooled.requests += 1
+                    pooled.touch()
+
+                async def _count_connection(session, context, params):
+                    pooled.connections += 1
+
+                trace = aiohttp.TraceConfig()
+                trace.on_request_start.append(_count_request)
+                trace.on_connection_create_end.append(_count_connection)
+                connector = aiohttp.TCPConnector(limit_per_host=self.pool_maxsize, keepalive_timeout=self.idle_timeout)
+                pooled.client = aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+                self._sessions[key] = pooled
+            pooled.touch()
+            return pooled.client
+
+    def evict_idle(self) -> List[str]:
+        """Libère les connexions des sessions inactives depuis plus de `idle_timeout` secondes."""
+        now = time.time()
+        released = []
+        with self._lock:
+            for key, pooled in self._sessions.items():
+                pooled.refresh()
+                if pooled.kind == "requests" and now - pooled.last_used > self.idle_timeout:
+                    pooled.release_idle_connections()
+                    pooled.touch()
+                    released.append(key)
+        if released:
+            logger.info(f"🔌 Connexions HTTP inactives fermées: {', '.join(released)}")
+        return released
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {key: pooled.stats() for key, pooled in self._sessions.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for pooled in sessions:
+            if pooled.kind == "requests":
+                pooled.client.close()
+            elif pooled.kind == "aiohttp":
+                _close_aiohttp(pooled)
+
+
+def _close_aiohttp(pooled: _PooledSession) -> None:
+    """Ferme une session `aiohttp` dans sa boucle (rien à faire si la boucle est déjà fermée)."""
+    loop = pooled.loop
+    if pooled.client.closed or loop is None or loop.is_closed():
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        loop.create_task(pooled.client.close())
+    elif loop.is_running():
+        asyncio.run_coroutine_threadsafe(pooled.client.close(), loop)
+    else:
+        loop.run_until_complete(pooled.client.close())
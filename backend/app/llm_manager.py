@@ -4,11 +4,24 @@ Gestionnaire multi-LLM pour supporter plusieurs modèles.
 
 import os
 import logging
-from typing import Optional, Dict, Any, List
+import re
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple, Union
 from enum import Enum
 
+from .config import settings
+from .llm_clients import ConnectionPools, last_model_activity, record_model_response
+from .llm_router import LLMRouter, RoutedLLM
+from .model_cascade import CascadePolicy
+
 logger = logging.getLogger(__name__)
 
+# Nombre de secondes sans unité (« -1 », « 3600 ») : Ollama l'attend en entier, pas en chaîne
+_KEEP_ALIVE_SECONDS = re.compile(r"[+-]?\d+")
+# Durée nulle : le modèle est déchargé aussitôt (« 0 », « 0s », « 0m »...)
+_KEEP_ALIVE_ZERO = re.compile(r"[+-]?0+(\.0+)?(ns|us|µs|ms|s|m|h)?")
+
 
 class LLMProvider(Enum):
     """Fournisseurs de LLM supportés."""
@@ -17,6 +30,7 @@ class LLMProvider(Enum):
     OPENAI = "openai"
     HUGGINGFACE = "huggingface"
     ANTHROPIC = "anthropic"
+    FAKE = "fake"  # LLM factice déterministe (benchmarks, tests de charge)
 
 
 class LLMConfig:
@@ -42,6 +56,19 @@ class LLMConfig:
         self.max_tokens = max_tokens
         self.extra_params = kwargs
 
+    def cache_key(self) -> Tuple:
+        """Clé identifiant un client construit à partir de cette configuration."""
+        return (
+            self.name,
+            self.provider.value,
+            self.model_name,
+            self.base_url,
+            self.api_key,
+            self.temperature,
+            self.max_tokens,
+            tuple(sorted((key, repr(value)) for key, value in self.extra_params.items())),
+        )
+
 
 class LLMManager:
     """Gestionnaire pour plusieurs modèles LLM."""
@@ -49,6 +76,20 @@ class LLMManager:
     def __init__(self):
         self.llms: Dict[str, LLMConfig] = {}
         self.default_llm: Optional[str] = None
+        # Clients construits, réutilisés tant que la configuration ne change pas : clé -> [client, dernier usage]
+        self._clients: Dict[Tuple, List[Any]] = {}
+        self._clients_lock = threading.Lock()
+        self._client_hits = 0
+        self._client_misses = 0
+        self._pools = ConnectionPools(
+            pool_connections=settings.llm_pool_connections,
+            pool_maxsize=settings.llm_pool_maxsize,
+            idle_timeout=settings.llm_client_idle_timeout,
+        )
+        self._router: Optional[LLMRouter] = None
+        self._cascade: Optional[CascadePolicy] = None
+        self._keep_warm_thread: Optional[threading.Thread] = None
+        self._keep_warm_stop = threading.Event()
         self._initialize_default_llms()
 
     def _initialize_default_llms(self):
@@ -59,6 +100,39 @@ class LLMManager:
         self.add_llm("ollama_default", LLMProvider.OLLAMA, ollama_model, base_url=ollama_base_url)
         self.set_default("ollama_default")
 
+        # Hôtes Ollama supplémentaires servant le même modèle (routage, voir llm_router)
+        extra_urls = [url.strip() for url in os.getenv("OLLAMA_EXTRA_BASE_URLS", "").split(",") if url.strip()]
+        for i, url in enumerate(extra_urls, start=2):
+            self.add_llm(f"ollama_{i}", LLMProvider.OLLAMA, ollama_model, base_url=url)
+
+        # Petit modèle rapide pour les questions simples (cascade, voir model_cascade)
+        small_model = os.getenv("CASCADE_SMALL_MODEL")
+        if small_model:
+            self.add_llm(
+                "ollama_small",
+                LLMProvider.OLLAMA,
+                small_model,
+                base_url=os.getenv("CASCADE_SMALL_BASE_URL", ollama_base_url),
+            )
+
+        # LLM factice déterministe pour les benchmarks et tests de charge (LLM_PROVIDER=fake)
+        if os.getenv("LLM_PROVIDER", "ollama").lower() == LLMProvider.FAKE.value:
+            # Position de l'erreur injectée (vide = avant le premier token)
+            error_after_tokens = os.getenv("FAKE_LLM_ERROR_AFTER_TOKENS", "")
+            self.add_llm(
+                "fake_default",
+                LLMProvider.FAKE,
+                "fake-llm",
+                ttft_ms=float(os.getenv("FAKE_LLM_TTFT_MS", "200")),
+                tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+                jitter=float(os.getenv("FAKE_LLM_JITTER", "0.1")),
+                error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+                error_after_tokens=int(error_after_tokens) if error_after_tokens else None,
+                answer_tokens=int(os.getenv("FAKE_LLM_ANSWER_TOKENS", "60")),
+                seed=int(os.getenv("FAKE_LLM_SEED", "42")),
+            )
+            self.set_default("fake_default")
+
         # OpenAI (si configuré)
         openai_api_key = os.getenv("OPENAI_API_KEY")
         if openai_api_key:
@@ -94,6 +168,8 @@ class LLMManager:
             **kwargs,
         )
         self.llms[name] = config
+        self._invalidate_clients(name)
+        self._router = None
         logger.info(f"LLM ajouté: {name} ({provider.value}/{model_name})")
 
     def set_default(self, name: str):
@@ -101,12 +177,16 @@ class LLMManager:
         if name not in self.llms:
             raise ValueError(f"LLM '{name}' non trouvé")
         self.default_llm = name
+        self._router = None
         logger.info(f"LLM par défaut: {name}")
 
     def get_llm(self, name: Optional[str] = None):
         """
         Récupère une instance LangChain LLM.
 
+        Le client est construit une seule fois par configuration puis réutilisé ;
+        les clients HTTP (Ollama, OpenAI) partagent une session keep-alive par fournisseur.
+
         Args:
             name: Nom du LLM (None = utiliser le défaut)
 
@@ -117,13 +197,40 @@ class LLMManager:
         if not llm_name or llm_name not in self.llms:
             raise ValueError(f"LLM '{llm_name}' non trouvé")
 
-        config = self.llms[llm_name]
+        # LLM par défaut servi par plusieurs endpoints : routage par charge et latence
+        if name is None:
+            router = self.get_router()
+            if router is not None:
+                return RoutedLLM(router, self)
 
+        config = self.llms[llm_name]
+        key = config.cache_key()
+        self.evict_idle()
+
+        with self._clients_lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = time.time()
+                self._client_hits += 1
+                return entry[0]
+            self._client_misses += 1
+            llm = self._create_llm(config)
+            self._clients[key] = [llm, time.time()]
+            return llm
+
+    def _create_llm(self, config: LLMConfig):
+        """Construit le client LangChain d'une configuration."""
         if config.provider == LLMProvider.OLLAMA:
-            from langchain_community.llms import Ollama
+            from .llm_clients import PooledOllama
 
-            return Ollama(
-                model=config.model_name, base_url=config.base_url, temperature=config.temperature, **config.extra_params
+            params = {**config.extra_params, "keep_alive": self.keep_alive_for(config.name)}
+            return PooledOllama(
+                model=config.model_name,
+                base_url=config.base_url,
+                temperature=config.temperature,
+                session=self._pools.requests_session(LLMProvider.OLLAMA.value),
+                async_session=lambda: self._pools.aiohttp_session(LLMProvider.OLLAMA.value),
+                **params,
             )
 
         elif config.provider == LLMProvider.OPENAI:
@@ -134,6 +241,8 @@ class LLMManager:
                 api_key=config.api_key,
                 temperature=config.temperature,
                 max_tokens=config.max_tokens,
+                http_client=self._pools.httpx_client(LLMProvider.OPENAI.value),
+                http_async_client=self._pools.httpx_client(LLMProvider.OPENAI.value, asynchronous=True),
                 **config.extra_params,
             )
 
@@ -159,9 +268,169 @@ class LLMManager:
                 **config.extra_params,
             )
 
+        elif config.provider == LLMProvider.FAKE:
+            from .fake_llm import BenchmarkLLM
+
+            return BenchmarkLLM(model_name=config.model_name, **config.extra_params)
+
         else:
             raise ValueError(f"Provider non supporté: {config.provider}")
 
+    def router_endpoints(self) -> List[str]:
+        """LLM interchangeables avec le LLM par défaut (même fournisseur et même modèle)."""
+        if not self.default_llm:
+            return []
+        default = self.llms[self.default_llm]
+        return [
+            name
+            for name, config in self.llms.items()
+            if config.provider == default.provider and config.model_name == default.model_name
+        ]
+
+    def get_router(self) -> Optional[LLMRouter]:
+        """Routeur sur les endpoints du LLM par défaut (None si un seul endpoint ou routage désactivé)."""
+        if not settings.llm_router_enabled:
+            return None
+        endpoints = self.router_endpoints()
+        if len(endpoints) < 2:
+            return None
+        if self._router is None or self._router.endpoints != endpoints:
+            self._router = LLMRouter(
+                endpoints,
+                failure_threshold=settings.llm_circuit_failure_threshold,
+                open_seconds=settings.llm_circuit_open_seconds,
+                hedge_enabled=settings.llm_hedge_enabled,
+                hedge_percentile=settings.llm_hedge_percentile,
+            )
+            logger.info(f"🔀 Routage LLM sur {len(endpoints)} endpoints: {', '.join(endpoints)}")
+        return self._router
+
+    def get_cascade(self) -> Optional[CascadePolicy]:
+        """Politique de cascade petit / grand modèle (None si désactivée ou sans petit modèle enregistré)."""
+        if not settings.cascade_enabled or "ollama_small" not in self.llms:
+            return None
+        if self._cascade is None:
+            self._cascade = CascadePolicy("ollama_small")
+            logger.info(f"🪜 Cascade de modèles: questions simples vers {self.llms['ollama_small'].model_name}")
+        return self._cascade
+
+    def _invalidate_clients(self, name: str) -> None:
+        """Oublie les clients construits pour un LLM dont la configuration a changé."""
+        with self._clients_lock:
+            for key in [key for key in self._clients if key[0] == name]:
+                del self._clients[key]
+
+    def evict_idle(self) -> int:
+        """
+        Oublie les clients inutilisés depuis plus de LLM_CLIENT_IDLE_TIMEOUT secondes
+        et ferme les connexions keep-alive inactives.
+
+        Returns:
+            Nombre de clients évincés
+        """
+        deadline = time.time() - self._pools.idle_timeout
+        with self._clients_lock:
+            idle = [key for key, (_, last_used) in self._clients.items() if last_used < deadline]
+            for key in idle:
+                del self._clients[key]
+        self._pools.evict_idle()
+        return len(idle)
+
+    def keep_alive_for(self, name: str) -> Union[int, str]:
+        """
+        Durée de maintien en mémoire d'un modèle Ollama (politique par LLM, sinon OLLAMA_KEEP_ALIVE).
+
+        Une valeur sans unité est renvoyée en entier (secondes, -1 = toujours) : en chaîne,
+        Ollama la refuse (« -1 » n'est pas une durée valide pour `time.ParseDuration`).
+        """
+        config = self.llms.get(name)
+        if config is not None and "keep_alive" in config.extra_params:
+            value = config.extra_params["keep_alive"]
+        else:
+            value = settings.ollama_keep_alive_policy.get(name, settings.ollama_keep_alive)
+        if isinstance(value, int):
+            return value
+        value = str(value).strip()
+        return int(value) if _KEEP_ALIVE_SECONDS.fullmatch(value) else value
+
+    def keep_warm(self, idle_seconds: Optional[float] = None) -> List[str]:
+        """
+        Ping des modèles Ollama sans réponse depuis `idle_seconds` : une requête sans prompt
+        recharge le modèle si besoin et repousse son déchargement (keep_alive).
+
+        Returns:
+            Noms des LLM pingés
+        """
+        idle_seconds = settings.ollama_keep_warm_interval if idle_seconds is None else idle_seconds
+        pinged: List[str] = []
+        seen = set()
+        for name, config in list(self.llms.items()):
+            target = (config.base_url, config.model_name)
+            if config.provider != LLMProvider.OLLAMA or target in seen:
+                continue
+            seen.add(target)
+            keep_alive = self.keep_alive_for(name)
+            if keep_alive == 0 or _KEEP_ALIVE_ZERO.fullmatch(str(keep_alive)):
+                # Modèle déchargé après chaque réponse : rien à maintenir
+                continue
+            last_activity = last_model_activity(*target)
+            if last_activity is not None and time.time() - last_activity < idle_seconds:
+                continue
+            try:
+                response = self._pools.requests_session(LLMProvider.OLLAMA.value).post(
+                    f"{config.base_url}/api/generate",
+                    json={"model": config.model_name, "keep_alive": keep_alive, "stream": False},
+                    timeout=60,
+                )
+                response.raise_for_status()
+                load_ns = response.json().get("load_duration")
+                record_model_response(*target, load_ns / 1e6 if load_ns is not None else None)
+                pinged.append(name)
+            except Exception as e:
+                logger.warning(f"Keep-warm impossible pour {name} ({config.model_name}): {e}")
+        if pinged:
+            logger.debug(f"🔥 Modèles maintenus en mémoire: {', '.join(pinged)}")
+        return pinged
+
+    def start_keep_warm(self) -> None:
+        """Démarre le ping périodique des modèles inactifs (OLLAMA_KEEP_WARM_INTERVAL secondes)."""
+        interval = settings.ollama_keep_warm_interval
+        if interval <= 0 or (self._keep_warm_thread is not None and self._keep_warm_thread.is_alive()):
+            return
+        default = self.llms.get(self.default_llm)
+        if default is not None and default.provider == LLMProvider.FAKE:
+            # Benchmark avec le LLM factice : pas de ping vers un Ollama absent ou hors mesure
+            logger.info("🔥 Keep-warm Ollama désactivé (LLM factice par défaut)")
+            return
+        self._keep_warm_stop.clear()
+
+        def _run() -> None:
+            while not self._keep_warm_stop.wait(interval):
+                self.keep_warm(interval)
+
+        self._keep_warm_thread = threading.Thread(target=_run, name="llm-keep-warm", daemon=True)
+        self._keep_warm_thread.start()
+
+    def stop_keep_warm(self) -> None:
+        self._keep_warm_stop.set()
+        if self._keep_warm_thread is not None:
+            self._keep_warm_thread.join(timeout=5)
+            self._keep_warm_thread = None
+
+    def connection_stats(self) -> Dict[str, Any]:
+        """Statistiques de réutilisation des clients et des connexions HTTP (exposées dans /health)."""
+        with self._clients_lock:
+            clients = len(self._clients)
+            hits, misses = self._client_hits, self._client_misses
+        router = self.get_router()
+        return {
+            "cached_clients": clients,
+            "client_hits": hits,
+            "client_misses": misses,
+            "pools": self._pools.stats(),
+            "router": router.stats() if router is not None else None,
+        }
+
     def list_llms(self) -> List[Dict[str, Any]]:
         """Liste tous les LLM disponibles."""
         return [
@@ -0,0 +1,357 @@
+"""
+Routage des appels LLM sur plusieurs endpoints interchangeables (ex: plusieurs hôtes Ollama).
+
+Pour chaque endpoint on suit les requêtes en cours, la latence (EWMA), le taux
+d'erreur (EWMA) et un disjoncteur (circuit breaker). Chaque appel part vers
+l'endpoint sain le moins chargé ; en cas d'échec avant le premier token, on
+bascule sur le suivant. En streaming asynchrone, une requête de couverture
+(hedging) peut être envoyée à un second endpoint si le premier token tarde
+au-delà d'un percentile des temps au premier token observés : le premier
+endpoint qui répond l'emporte, l'autre flux est annulé.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from .admission import AdmissionRejected, aadmitted, admitted, tier_from_config
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_END = object()
+
+
+class EndpointState:
+    """Charge, latence, taux d'erreur et disjoncteur d'un endpoint."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.in_flight = 0
+        self.latency_ms: Optional[float] = None
+        self.ttft_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.circuit = CLOSED
+        self.opened_at = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "latency_ms": round(self.latency_ms, 2) if self.latency_ms is not None else None,
+            "ttft_ms": round(self.ttft_ms, 2) if self.ttft_ms is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "circuit": self.circuit,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class LLMRouter:
+    """Sélection de l'endpoint le moins chargé parmi les endpoints sains."""
+
+    def __init__(
+        self,
+        endpoints: Sequence[str],
+        ewma_alpha: float = 0.2,
+        failure_threshold: int = 3,
+        open_seconds: float = 30.0,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20,
+    ):
+        """
+        Args:
+            endpoints: Noms des LLM interchangeables (enregistrés dans LLMManager)
+            ewma_alpha: Poids d'une nouvelle mesure dans les moyennes mobiles
+            failure_threshold: Échecs consécutifs avant ouverture du disjoncteur
+            open_seconds: Durée d'ouverture avant un essai (demi-ouvert)
+            hedge_enabled: Envoyer une requête de couverture quand le premier token tarde
+            hedge_percentile: Percentile des temps au premier token déclenchant la couverture
+            hedge_min_samples: Mesures nécessaires avant d'activer la couverture
+        """
+        self.states: Dict[str, EndpointState] = {name: EndpointState(name) for name in endpoints}
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._ttft_samples: deque = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    @property
+    def endpoints(self) -> List[str]:
+        return list(self.states)
+
+    def _available(self, state: EndpointState, now: float) -> bool:
+        if state.circuit == CLOSED:
+            return True
+        if state.circuit == OPEN and now - state.opened_at >= self.open_seconds:
+            # Demi-ouvert : un seul appel d'essai à la fois
+            state.circuit = HALF_OPEN
+        return state.circuit == HALF_OPEN and state.in_flight == 0
+
+    def _cost(self, state: EndpointState) -> float:
+        # Endpoint jamais mesuré : coût nul pour qu'il soit essayé
+        latency = state.latency_ms or 0.0
+        return (latency + 1.0) * (state.in_flight + 1) * (1.0 + state.error_rate)
+
+    def acquire(self, exclude: Sequence[str] = ()) -> Optional[str]:
+        """Choisit l'endpoint sain le moins chargé et le marque occupé (None si aucun)."""
+        now = time.time()
+        with self._lock:
+            candidates = [
+                state for name, state in self.states.items() if name not in exclude and self._available(state, now)
+            ]
+            if not candidates:
+                return None
+            state = min(candidates, key=self._cost)
+            state.in_flight += 1
+            state.requests += 1
+            return state.name
+
+    def release(self, name: str) -> None:
+        with self._lock:
+            self.states[name].in_flight -= 1
+
+    def record_ttft(self, name: str, ttft_ms: float) -> None:
+        with self._lock:
+            state = self.states[name]
+            state.ttft_ms = ttft_ms if state.ttft_ms is None else self._ewma(state.ttft_ms, ttft_ms)
+            self._ttft_samples.append(ttft_ms)
+        get_metrics_collector().record_histogram("llm.ttft_ms", ttft_ms, tags={"endpoint": name})
+
+    def record_success(self, name: str, latency_ms: float) -> None:
+        with self._lock:
+            state = self.states[name]
+            state.latency_ms = latency_ms if state.latency_ms is None else self._ewma(state.latency_ms, latency_ms)
+            state.error_rate = self._ewma(state.error_rate, 0.0)
+            state.consecutive_failures = 0
+            if state.circuit != CLOSED:
+                logger.info(f"🟢 Endpoint LLM {name} rétabli")
+            state.circuit = CLOSED
+
+    def record_failure(self, name: str) -> None:
+        with self._lock:
+            state = self.states[name]
+            state.failures += 1
+            state.error_rate = self._ewma(state.error_rate, 1.0)
+            state.consecutive_failures += 1
+            if state.circuit == HALF_OPEN or state.consecutive_failures >= self.failure_threshold:
+                if state.circuit != OPEN:
+                    logger.warning(f"🔴 Disjoncteur ouvert pour l'endpoint LLM {name} ({self.open_seconds:.0f}s)")
+                state.circuit = OPEN
+                state.opened_at = time.time()
+        get_metrics_collector().increment("llm.endpoint_failures", tags={"endpoint": name})
+
+    def _ewma(self, previous: float, value: float) -> float:
+        return (1 - self.ewma_alpha) * previous + self.ewma_alpha * value
+
+    def hedge_delay(self) -> Optional[float]:
+        """Délai (secondes) avant la requête de couverture : percentile des temps au premier token."""
+        with self._lock:
+            if not self.hedge_enabled or len(self.states) < 2 or len(self._ttft_samples) < self.hedge_min_samples:
+                return None
+            samples = sorted(self._ttft_samples)
+        index = min(len(samples) - 1, int(round((len(samples) - 1) * self.hedge_percentile / 100)))
+        return samples[index] / 1000
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "endpoints": {name: state.snapshot() for name, state in self.states.items()},
+                "hedge_enabled": self.hedge_enabled,
+            }
+
+
+class RoutedLLM(Runnable):
+    """
+    LLM LangChain routé : chaque appel choisit un endpoint via `LLMRouter`.
+
+    `invoke`/`ainvoke` passent par le streaming (agrégation des chunks) pour
+    mesurer le temps au premier token et partager la bascule en cas d'échec.
+    """
+
+    def __init__(self, router: LLMRouter, manager: Any):
+        self.router = router
+        self.manager = manager
+
+    def _tracked_stream(self, name: str, input: Any, config: Optional[RunnableConfig], **kwargs) -> Iterator[Any]:
+        first = True
+        try:
+            # Place de génération prise pour cet endpoint (tier de la requête dans les métadonnées)
+            with admitted(name, tier_from_config(config)):
+                start = time.perf_counter()
+                for chunk in self.manager.get_llm(name).stream(input, config, **kwargs):
+                    if first:
+                        self.router.record_ttft(name, (time.perf_counter() - start) * 1000)
+                        first = False
+                    yield chunk
+        except AdmissionRejected:
+            raise
+        except Exception:
+            self.router.record_failure(name)
+            raise
+        else:
+            self.router.record_success(name, (time.perf_counter() - start) * 1000)
+        finally:
+            self.router.release(name)
+
+    async def _tracked_astream(
+        self, name: str, input: Any, config: Optional[RunnableConfig], **kwargs
+    ) -> AsyncIterator[Any]:
+        first = True
+        try:
+            async with aadmitted(name, tier_from_config(config)):
+                start = time.perf_counter()
+                async for chunk in self.manager.get_llm(name).astream(input, config, **kwargs):
+                    if first:
+                        self.router.record_ttft(name, (time.perf_counter() - start) * 1000)
+                        first = False
+                    yield chunk
+        except AdmissionRejected:
+            raise
+        except Exception:
+            self.router.record_failure(name)
+            raise
+        else:
+            self.router.record_success(name, (time.perf_counter() - start) * 1000)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        tried: List[str] = []
+        last_error: Optional[Exception] = None
+        while True:
+            name = self.router.acquire(exclude=tried)
+            if name is None:
+                _raise_unavailable(last_error)
+            tried.append(name)
+            started = False
+            try:
+                for chunk in self._tracked_stream(name, input, config, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started:
+                    raise
+                last_error = e
+                logger.warning(f"Endpoint LLM {name} en échec, bascule: {e}")
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        tried: List[str] = []
+        last_error: Optional[Exception] = None
+        while True:
+            started = False
+            try:
+                async for chunk in self._hedged_astream(tried, input, config, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except _NoEndpoint:
+                _raise_unavailable(last_error)
+            except Exception as e:
+                if started:
+                    raise
+                last_error = e
+                logger.warning(f"Endpoint LLM en échec, bascule: {e}")
+
+    async def _hedged_astream(
+        self, tried: List[str], input: Any, config: Optional[RunnableConfig], **kwargs
+    ) -> AsyncIterator[Any]:
+        """Flux d'un endpoint, doublé par un second si le premier token dépasse le délai de couverture."""
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def pump(name: str) -> None:
+            try:
+                async for chunk in self._tracked_astream(name, input, config, **kwargs):
+                    await queue.put((name, chunk, None))
+                await queue.put((name, _END, None))
+            except Exception as e:
+                await queue.put((name, _END, e))
+
+        def launch() -> bool:
+            name = self.router.acquire(exclude=tried)
+            if name is None:
+                return False
+            tried.append(name)
+            tasks[name] = asyncio.get_running_loop().create_task(pump(name))
+            # Libéré même si la tâche est annulée avant d'avoir démarré
+            tasks[name].add_done_callback(lambda _, name=name: self.router.release(name))
+            return True
+
+        if not launch():
+            raise _NoEndpoint()
+        hedge_delay = self.router.hedge_delay()
+        winner: Optional[str] = None
+        error: Optional[Exception] = None
+        try:
+            while True:
+                try:
+                    timeout = hedge_delay if winner is None else None
+                    name, chunk, chunk_error = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    hedge_delay = None
+                    if launch():
+                        get_metrics_collector().increment("llm.hedged_requests")
+                        logger.info(f"⏱️ Premier token en retard, requête de couverture vers {tried[-1]}")
+                    continue
+
+                if winner is None:
+                    if chunk is _END and chunk_error is not None:
+                        # Cet endpoint a échoué avant le premier token : attendre les autres
+                        tasks.pop(name, None)
+                        error = chunk_error
+                        if not tasks:
+                            raise error
+                        continue
+                    winner = name
+                    for other, task in tasks.items():
+                        if other != name:
+                            task.cancel()
+                            get_metrics_collector().increment("llm.hedge_cancelled", tags={"endpoint": other})
+                if name != winner:
+                    continue
+                if chunk is _END:
+                    if chunk_error is not None:
+                        raise chunk_error
+                    return
+                yield chunk
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        output = None
+        for chunk in self.stream(input, config, **kwargs):
+            output = chunk if output is None else output + chunk
+        return output if output is not None else ""
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        output = None
+        async for chunk in self.astream(input, config, **kwargs):
+            output = chunk if output is None else output + chunk
+        return output if output is not None else ""
+
+
+class _NoEndpoint(Exception):
+    """Aucun endpoint disponible (tous essayés ou disjoncteurs ouverts)."""
+
+
+def _raise_unavailable(last_error: Optional[Exception]) -> None:
+    # Tous les endpoints saturés : le refus d'admission (429/503 avec Retry-After) est transmis tel quel
+    if isinstance(last_error, AdmissionRejected):
+        raise last_error
+    raise RuntimeError("Aucun endpoint LLM disponible") from last_error
@@ -0,0 +1,81 @@
+"""
+Mesure du retard de la boucle d'événements (event-loop lag).
+
+Une tâche se réveille toutes les `interval` secondes et mesure de combien son
+réveil a été retardé : tout appel bloquant exécuté sur la boucle (encodage,
+recherche FAISS, lecture synchrone du LLM...) apparaît directement dans ce retard.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopLagMonitor:
+    """Échantillonne le retard de la boucle d'événements dans les métriques."""
+
+    def __init__(self, interval: float = 0.1):
+        """
+        Args:
+            interval: Période d'échantillonnage en secondes
+        """
+        self.interval = interval
+        self.max_lag_ms = 0.0
+        self.samples = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics_collector()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000)
+            self.samples += 1
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            metrics.record_histogram("event_loop.lag_ms", lag_ms)
+            metrics.set_gauge("event_loop.lag_ms", lag_ms)
+
+    def start(self) -> None:
+        """Démarre l'échantillonnage sur la boucle courante (à appeler depuis une coroutine)."""
+        if not self.running:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"⏱️ Mesure du retard de la boucle d'événements (toutes les {self.interval * 1000:.0f}ms)")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiques du retard (p50/p95/p99 en ms) exposées dans les diagnostics."""
+        return {
+            "running": self.running,
+            "samples": self.samples,
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            **get_metrics_collector().get_histogram_stats("event_loop.lag_ms"),
+        }
+
+
+# Instance globale
+_loop_monitor: Optional[EventLoopLagMonitor] = None
+
+
+def get_loop_monitor() -> EventLoopLagMonitor:
+    """Récupère l'instance globale du moniteur de boucle."""
+    global _loop_monitor
+    if _loop_monitor is None:
+        _loop_monitor = EventLoopLagMonitor()
+    return _loop_monitor
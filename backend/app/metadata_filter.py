@@ -0,0 +1,158 @@
+"""
+Index de métadonnées des chunks pour la recherche filtrée.
+
+Chaque valeur de métadonnée (document source, type de section) est associée à un
+bitmap sur les positions FAISS. Un filtre se traduit en un masque booléen appliqué
+directement dans la recherche ANN (IDSelectorBitmap) et dans le BM25, sans
+sur-échantillonnage ni filtrage a posteriori en Python.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METADATA_INDEX_FILENAME = "metadata_index.json"
+
+
+@dataclass(frozen=True)
+class RetrievalFilters:
+    """Filtres optionnels de retrieval (une liste vide ou None = pas de filtre)."""
+
+    source_documents: Optional[Tuple[str, ...]] = None
+    section_types: Optional[Tuple[str, ...]] = None
+    min_confidence_ocr: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> Optional["RetrievalFilters"]:
+        """Construit des filtres depuis un dict (ex: requête API). Retourne None si aucun filtre."""
+        if not data:
+            return None
+        filters = cls(
+            source_documents=tuple(data.get("source_document") or ()) or None,
+            section_types=tuple(data.get("section_type") or ()) or None,
+            min_confidence_ocr=data.get("min_confidence_ocr"),
+        )
+        return None if filters.is_empty() else filters
+
+    def is_empty(self) -> bool:
+        return not self.source_documents and not self.section_types and self.min_confidence_ocr is None
+
+    def cache_key(self) -> str:
+        """Représentation stable pour les clés de cache."""
+        return json.dumps(
+            {
+                "source_document": sorted(self.source_documents or ()),
+                "section_type": sorted(self.section_types or ()),
+                "min_confidence_ocr": self.min_confidence_ocr,
+            },
+            sort_keys=True,
+        )
+
+
+class MetadataIndex:
+    """Bitmaps par valeur de métadonnée, alignés sur les positions FAISS."""
+
+    FIELDS = ("source_document", "section_type")
+
+    def __init__(self) -> None:
+        self.doc_ids: List[str] = []
+        self.values: Dict[str, Dict[str, List[int]]] = {field: {} for field in self.FIELDS}
+        self.confidence_ocr: List[float] = []
+        self._bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+        self._confidence = np.empty(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(cls, metadatas: Sequence[Dict[str, Any]], doc_ids: Sequence[str]) -> "MetadataIndex":
+        """
+        Construit l'index à partir des métadonnées des chunks.
+
+        Args:
+            metadatas: Métadonnées des chunks, dans l'ordre des positions FAISS
+            doc_ids: Identifiants docstore correspondants (même ordre)
+        """
+        index = cls()
+        index.doc_ids = list(doc_ids)
+        for position, metadata in enumerate(metadatas):
+            for field in cls.FIELDS:
+                value = metadata.get(field)
+                if value is not None:
+                    index.values[field].setdefault(str(value), []).append(position)
+            confidence = metadata.get("confidence_ocr")
+            index.confidence_ocr.append(float(confidence) if confidence is not None else 1.0)
+        if len(index.confidence_ocr) != len(index.doc_ids):
+            raise ValueError("Le nombre d'identifiants ne correspond pas au nombre de métadonnées")
+        index._finalize()
+        return index
+
+    def _finalize(self) -> None:
+        n_docs = len(self.doc_ids)
+        self._bitmaps = {}
+        for field, values in self.values.items():
+            self._bitmaps[field] = {}
+            for value, positions in values.items():
+                bitmap = np.zeros(n_docs, dtype=bool)
+                bitmap[positions] = True
+                self._bitmaps[field][value] = bitmap
+        self._confidence = np.asarray(self.confidence_ocr, dtype=np.float32)
+
+    def mask(self, filters: Optional[RetrievalFilters]) -> Optional[np.ndarray]:
+        """
+        Calcule le masque des positions autorisées (OU entre valeurs, ET entre champs).
+
+        Returns:
+            Tableau booléen de taille len(index), ou None si aucun filtre
+        """
+        if filters is None or filters.is_empty():
+            return None
+
+        allowed = np.ones(len(self.doc_ids), dtype=bool)
+        for field, wanted in (("source_document", filters.source_documents), ("section_type", filters.section_types)):
+            if not wanted:
+                continue
+            field_mask = np.zeros(len(self.doc_ids), dtype=bool)
+            for value in wanted:
+                bitmap = self._bitmaps[field].get(str(value))
+                if bitmap is not None:
+                    field_mask |= bitmap
+            allowed &= field_mask
+        if filters.min_confidence_ocr is not None:
+            allowed &= self._confidence >= filters.min_confidence_ocr
+        return allowed
+
+    def list_values(self, field: str) -> List[str]:
+        """Valeurs connues d'un champ (utile pour exposer les filtres disponibles)."""
+        return sorted(self.values.get(field, {}))
+
+    # ---------- Persistance ----------
+
+    def save(self, storage_dir: Path) -> Path:
+        """Sauvegarde l'index au format JSON à côté de l'index FAISS."""
+        path = Path(storage_dir) / METADATA_INDEX_FILENAME
+        payload = {"doc_ids": self.doc_ids, "values": self.values, "confidence_ocr": self.confidence_ocr}
+        path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        logger.info(f"Index de métadonnées sauvegardé ({len(self)} chunks)")
+        return path
+
+    @classmethod
+    def load(cls, storage_dir: Path) -> "MetadataIndex":
+        """Charge un index précédemment sauvegardé avec `save`."""
+        payload = json.loads((Path(storage_dir) / METADATA_INDEX_FILENAME).read_text(encoding="utf-8"))
+        index = cls()
+        index.doc_ids = payload["doc_ids"]
+        index.values = {field: payload["values"].get(field, {}) for field in cls.FIELDS}
+        index.confidence_ocr = payload["confidence_ocr"]
+        index._finalize()
+        return index
+
+    @staticmethod
+    def exists(storage_dir: Path) -> bool:
+        return (Path(storage_dir) / METADATA_INDEX_FILENAME).exists()
@@ -0,0 +1,141 @@
+"""
+Cascade de modèles : les questions simples vont à un petit modèle rapide.
+
+Une question de définition (« Qu'est-ce que l'ISO ? ») est aussi bien traitée par
+un modèle de 1 à 3B paramètres, en une fraction du temps du modèle par défaut.
+La classification est volontairement peu coûteuse (aucun appel LLM) :
+
+- heuristiques sur la question : longueur, marqueurs de raisonnement
+  (pourquoi, comparer, calculer...) ou de définition ;
+- marge du retrieval : un meilleur chunk net (score élevé, écart avec le
+  second) signale une question non ambiguë.
+
+Les questions difficiles ou ambiguës restent sur le grand modèle. Une réponse
+du petit modèle vide ou évasive (« je ne sais pas ») est régénérée par le grand
+modèle (escalade). Latence par tier et taux d'escalade sont suivis en métriques.
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from .config import settings
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+SMALL = "small"
+LARGE = "large"
+# Latence d'une question escaladée (petit puis grand modèle), suivie à part des deux tiers
+ESCALATED = "escalated"
+
+# Questions demandant du raisonnement, une comparaison ou plusieurs étapes
+_HARD_MARKERS = re.compile(
+    r"\b(pourquoi|comment|compar\w*|différen\w*|avantages?|inconvénients?|expliqu\w*|calcul\w*|"
+    r"étapes?|conseils?|meilleur\w*|choisir|quand|why|how|compare|difference|versus|vs)\b",
+    re.IGNORECASE,
+)
+# Questions de définition
+_DEFINITION_MARKERS = re.compile(
+    r"(qu['’]est[- ]ce qu|c['’]est quoi|\bdéfini\w*|que signifie|que veut dire|\bwhat is\b|\bdefine\b)",
+    re.IGNORECASE,
+)
+# Réponses évasives du petit modèle : escalade vers le grand
+_EVASIVE_ANSWER = re.compile(
+    r"(je ne sais pas|je n['’]ai pas (assez|suffisamment)|pas d['’]information|ne permet(tent)? pas de répondre|"
+    r"i don['’]t know|not enough information)",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class CascadeDecision:
+    """Tier choisi pour une question et raison (journalisée)."""
+
+    tier: str
+    llm_name: Optional[str]
+    reason: str
+
+
+class CascadePolicy:
+    """Choix du modèle (petit ou grand) pour une question, à partir de la question et du retrieval."""
+
+    def __init__(
+        self,
+        small_llm: str,
+        large_llm: Optional[str] = None,
+        max_words: Optional[int] = None,
+        min_score: Optional[float] = None,
+        min_margin: Optional[float] = None,
+    ):
+        """
+        Args:
+            small_llm: Nom du petit modèle enregistré dans LLMManager
+            large_llm: Nom du grand modèle (None = LLM par défaut)
+            max_words: Longueur maximale (mots) d'une question simple
+            min_score: Pertinence minimale du meilleur chunk
+            min_margin: Écart minimal entre les deux meilleurs chunks (hors questions de définition)
+        """
+        self.small_llm = small_llm
+        self.large_llm = large_llm
+        self.max_words = max_words if max_words is not None else settings.cascade_max_words
+        self.min_score = min_score if min_score is not None else settings.cascade_min_score
+        self.min_margin = min_margin if min_margin is not None else settings.cascade_min_margin
+
+    def _large(self, reason: str) -> CascadeDecision:
+        return CascadeDecision(LARGE, self.large_llm, reason)
+
+    def classify(self, question: str, retrieval: Optional[Any] = None) -> CascadeDecision:
+        """Petit modèle si la question est courte, sans raisonnement, et le retrieval sans ambiguïté."""
+        words = len(question.split())
+        if words > self.max_words:
+            return self._large("question longue")
+        if _HARD_MARKERS.search(question) or question.count("?") > 1:
+            return self._large("raisonnement demandé")
+
+        chunks = retrieval.chunks if retrieval is not None else []
+        if not chunks:
+            return self._large("aucun contexte pertinent")
+        scores = sorted((chunk.relevance for chunk in chunks), reverse=True)
+        if scores[0] < self.min_score:
+            return self._large("contexte peu pertinent")
+
+        if _DEFINITION_MARKERS.search(question):
+            return CascadeDecision(SMALL, self.small_llm, "définition")
+        if len(scores) > 1 and scores[0] - scores[1] < self.min_margin:
+            return self._large("retrieval ambigu")
+        return CascadeDecision(SMALL, self.small_llm, "question simple")
+
+    @staticmethod
+    def needs_escalation(answer: str) -> bool:
+        """Réponse du petit modèle vide ou évasive : à régénérer par le grand modèle."""
+        text = answer.strip()
+        return len(text) < 10 or bool(_EVASIVE_ANSWER.search(text))
+
+    @staticmethod
+    def record(decision: CascadeDecision, latency_ms: float, escalated: bool = False) -> None:
+        """Métriques : routage par tier, latence par tier (escalades à part), escalades."""
+        metrics = get_metrics_collector()
+        metrics.increment("cascade.routed", tags={"tier": decision.tier})
+        # Une escalade cumule petit et grand modèle : la compter dans le tier « small » fausserait sa latence
+        latency_tier = ESCALATED if escalated else decision.tier
+        metrics.record_histogram("cascade.latency_ms", latency_ms, tags={"tier": latency_tier})
+        if escalated:
+            metrics.increment("cascade.escalated")
+            logger.info(f"🪜 Escalade vers le grand modèle (question classée « {decision.reason} »)")
+
+    def stats(self) -> Dict[str, Any]:
+        metrics = get_metrics_collector()
+        small = metrics.get_counter("cascade.routed", tags={"tier": SMALL})
+        large = metrics.get_counter("cascade.routed", tags={"tier": LARGE})
+        escalated = metrics.get_counter("cascade.escalated")
+        return {
+            "small_llm": self.small_llm,
+            "routed": {SMALL: small, LARGE: large},
+            "escalation_rate": round(escalated / small, 4) if small else 0.0,
+            "latency_ms": {
+                tier: metrics.get_histogram_stats("cascade.latency_ms", tags={"tier": tier})
+                for tier in (SMALL, LARGE, ESCALATED)
+            },
+        }
@@ -0,0 +1,416 @@
+"""
+Calculs d'exposition et de réglages sans LLM (voie rapide devant le RAG).
+
+Beaucoup de questions sont de l'arithmétique sur le triangle d'exposition :
+expositions équivalentes, EV d'un réglage, écart en stops, distance
+hyperfocale. Passer par le retrieval et une génération de plusieurs secondes
+est lent, et le LLM se trompe souvent dans les calculs. Ici, un détecteur
+d'intention reconnaît ces questions et un calculateur donne une réponse
+exacte et immédiate.
+
+Le détecteur est volontairement prudent : si l'intention ou les valeurs sont
+ambiguës (valeur manquante, trop de valeurs), si la question porte sur un choix
+(« f/8 ou f/11 », « entre f/1.8 et f/2.8 pour... ») ou sur un rendu (bokeh,
+flou, portrait...), si la grandeur demandée n'est pas celle que le calcul
+donnerait, ou si rien n'indique quel réglage est l'actuel et lequel est visé
+(« si je suis à... », « de X à Y », « si je passe à... »), `calculate` renvoie
+None et la question suit le pipeline RAG habituel. Réponses et replis sont
+comptés en métriques (`calculator.hits`, `calculator.fallbacks`).
+"""
+
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+EV = "ev"
+EQUIVALENT = "equivalent"
+STOPS = "stops"
+HYPERFOCAL = "hyperfocal"
+
+# Valeurs normalisées au tiers de stop (affichage de la valeur la plus proche)
+STANDARD_APERTURES = [
+    1.0, 1.1, 1.2, 1.4, 1.6, 1.8, 2.0, 2.2, 2.5, 2.8, 3.2, 3.5, 4.0, 4.5, 5.0, 5.6, 6.3, 7.1, 8.0,
+    9.0, 10.0, 11.0, 13.0, 14.0, 16.0, 18.0, 20.0, 22.0, 25.0, 29.0, 32.0,
+]
+STANDARD_SHUTTERS = [1 / d for d in (
+    8000, 6400, 5000, 4000, 3200, 2500, 2000, 1600, 1250, 1000, 800, 640, 500, 400, 320, 250, 200, 160,
+    125, 100, 80, 60, 50, 40, 30, 25, 20, 15, 13, 10, 8, 6, 5, 4,
+)] + [0.3, 0.4, 0.5, 0.6, 0.8, 1, 1.3, 1.6, 2, 2.5, 3.2, 4, 5, 6, 8, 10, 13, 15, 20, 25, 30]
+
+# Cercle de confusion (mm) par format de capteur ; plein format par défaut
+_CIRCLES_OF_CONFUSION = [
+    (re.compile(r"micro\s?4/3|\bm4/3\b|\bmft\b|four thirds", re.IGNORECASE), 0.015, "Micro 4/3"),
+    (re.compile(r"aps-?c|\bdx\b", re.IGNORECASE), 0.02, "APS-C"),
+    (re.compile(r"moyen format|medium format", re.IGNORECASE), 0.05, "moyen format"),
+]
+_DEFAULT_COC = (0.03, "plein format")
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_APERTURE = re.compile(r"(?<![\w/])f\s?/\s?" + _NUMBER + r"|(?<![\w/])f" + _NUMBER + r"(?![\w/])", re.IGNORECASE)
+_FRACTION_SHUTTER = re.compile(r"(?<![\w/.,])1\s?/\s?(\d+)(?:\s?(?:s|sec|e|ème)\b)?", re.IGNORECASE)
+_SECONDS_SHUTTER = re.compile(
+    r"(?<![\w/.,])" + _NUMBER + r"\s?(?:s|sec|secondes?|\"|″)(?!\w)", re.IGNORECASE
+)
+_ISO = re.compile(r"\biso\s?(\d{2,6})\b|(?<![\w/.,])(\d{2,6})\s?iso\b", re.IGNORECASE)
+_FOCAL = re.compile(_NUMBER + r"\s?mm\b", re.IGNORECASE)
+
+_HYPERFOCAL_MARKERS = re.compile(r"hyperfocal", re.IGNORECASE)
+# « IL » (indice de lumination) seulement en majuscules : « il » est aussi un pronom
+_STOP_UNITS = r"(stops?|diaph\w*|(?-i:IL)|ev|crans?)"
+# Unité exigée : « différence entre f/2.8 et f/4 » peut porter sur le rendu, pas sur l'écart en stops
+_STOPS_MARKERS = re.compile(
+    r"combien d[e'’]\s?" + _STOP_UNITS + r"\b|\b" + _STOP_UNITS + r"\s+(d['’]écart|de différence|entre)"
+    r"|\b(écart|différence)\s+(en|de)\s+" + _STOP_UNITS + r"\b|how many stops",
+    re.IGNORECASE,
+)
+_EV_MARKERS = re.compile(
+    r"\bev\b|\b(?-i:IL)\b|indice de lumination|valeur d['’]exposition|exposure value", re.IGNORECASE
+)
+# Grandeur demandée (« quelle vitesse », « what aperture »...) : le calcul doit donner celle-là
+_ASKED_QUANTITIES = [
+    ("shutter", re.compile(r"quelle vitesse|quel temps de pose|what (shutter|speed)", re.IGNORECASE)),
+    ("aperture", re.compile(r"quelle ouverture|quel diaph\w*|what aperture", re.IGNORECASE)),
+    ("iso", re.compile(r"quel(le)? (iso|sensibilité)|what iso", re.IGNORECASE)),
+]
+# Choix entre plusieurs réglages ou question de rendu : affaire de jugement, pas d'arithmétique
+_CHOICE_MARKERS = re.compile(r"\bou\b|\bor\b|\bentre\b.+\bpour\b|\bchoisir\b|\bvaut[- ]il mieux\b", re.IGNORECASE)
+_RENDERING_MARKERS = re.compile(
+    r"\b(bokeh|portraits?|flous?|floue?s?|filés?|netteté|profondeur de champ|rendu|ambiance|diffraction|bougé)\b",
+    re.IGNORECASE,
+)
+# Réglage actuel ou visé : indices explicites précédant une valeur (le dernier indice avant la valeur l'emporte)
+_SETTING_ROLE_CUES = re.compile(
+    r"(?P<current>je suis|j['’]étais|actuellement|au départ|au lieu de|en partant de|i['’]m at|currently)"
+    r"|(?P<target>quel(le)?s? (vitesse|ouverture|iso|sensibilité|temps de pose|diaph\w*)"
+    r"|si je (passe|ferme|ouvre|monte|descends|change)\b[^,;?]*?(?<!\w)(à|a|en)(?!\w)"
+    r"|(passer|fermer|ouvrir|monter|descendre) (à|a|en)(?!\w)|what (shutter|speed|aperture|iso))",
+    re.IGNORECASE,
+)
+# « de X à Y » : X est le réglage actuel, Y le réglage visé
+_FROM_BEFORE = re.compile(r"(?<!\w)(de|d['’]|depuis)\s*$", re.IGNORECASE)
+_FROM_TO_BETWEEN = re.compile(r"\s*(à|a|vers|jusqu['’]à|->|→)\s*", re.IGNORECASE)
+_EQUIVALENT_MARKERS = re.compile(
+    r"équivalen\w*|equivalent|même exposition|same exposure|si je (passe|ferme|ouvre|monte|descends|change)"
+    r"|quelle vitesse|quelle ouverture|quel iso|quelle sensibilité|what (shutter|speed|aperture|iso)",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class ExposureValues:
+    """Valeurs relevées dans une question, dans l'ordre d'apparition."""
+
+    apertures: List[float] = field(default_factory=list)
+    shutters: List[float] = field(default_factory=list)  # Secondes
+    isos: List[int] = field(default_factory=list)
+    focals: List[float] = field(default_factory=list)  # mm
+    # Positions (début, fin) dans la question, parallèles aux listes ci-dessus
+    aperture_spans: List[Tuple[int, int]] = field(default_factory=list)
+    shutter_spans: List[Tuple[int, int]] = field(default_factory=list)
+    iso_spans: List[Tuple[int, int]] = field(default_factory=list)
+
+
+@dataclass
+class Calculation:
+    """Réponse du calculateur : intention reconnue, texte de la réponse et valeurs calculées."""
+
+    intent: str
+    answer: str
+    values: Dict[str, float] = field(default_factory=dict)
+
+    def as_result(self) -> dict:
+        """Résultat au format de `answer_question` (aucune source : la réponse est calculée)."""
+        return {
+            "answer": self.answer,
+            "sources": [],
+            "num_sources": 0,
+            "context_tokens": 0,
+            "fast_path": self.intent,
+        }
+
+
+def _number(text: str) -> float:
+    return float(text.replace(",", "."))
+
+
+def parse_values(question: str) -> ExposureValues:
+    """Relève ouvertures, vitesses, sensibilités ISO et focales d'une question."""
+    values = ExposureValues()
+    apertures = [(m.span(), _number(m.group(1) or m.group(2))) for m in _APERTURE.finditer(question)]
+    apertures = [(span, aperture) for span, aperture in apertures if aperture >= 0.7]
+    values.aperture_spans = [span for span, _ in apertures]
+    values.apertures = [aperture for _, aperture in apertures]
+    shutters = [(m.span(), 1 / int(m.group(1))) for m in _FRACTION_SHUTTER.finditer(question) if int(m.group(1))]
+    shutters += [(m.span(), _number(m.group(1))) for m in _SECONDS_SHUTTER.finditer(question)]
+    shutters = [(span, seconds) for span, seconds in sorted(shutters) if seconds > 0]
+    values.shutter_spans = [span for span, _ in shutters]
+    values.shutters = [seconds for _, seconds in shutters]
+    isos = [(m.span(), int(m.group(1) or m.group(2))) for m in _ISO.finditer(question)]
+    values.iso_spans = [span for span, _ in isos]
+    values.isos = [iso for _, iso in isos]
+    # Focales plausibles uniquement (pas un cercle de confusion « 0,03 mm »)
+    values.focals = [focal for focal in (_number(f) for f in _FOCAL.findall(question)) if focal >= 4]
+    return values
+
+
+def _nearest(value: float, scale: List[float]) -> Optional[float]:
+    """Valeur normalisée la plus proche, ou None hors de l'échelle (au-delà d'un tiers de stop des bornes)."""
+    if not scale[0] / 2 ** (1 / 3) <= value <= scale[-1] * 2 ** (1 / 3):
+        return None
+    return min(scale, key=lambda standard: abs(math.log2(standard / value)))
+
+
+def format_aperture(aperture: float) -> str:
+    return f"f/{aperture:.1f}".replace(".0", "") if aperture < 10 else f"f/{aperture:.0f}"
+
+
+def format_shutter(seconds: float) -> str:
+    if seconds < 0.3:
+        return f"1/{round(1 / seconds)} s"
+    return f"{seconds:.1f}".rstrip("0").rstrip(".") + " s"
+
+
+def format_stops(stops: float) -> str:
+    thirds = round(stops * 3) / 3
+    if abs(thirds - round(thirds)) < 1e-9:
+        text = f"{round(thirds):.0f}"
+    else:
+        text = f"{thirds:.1f}"
+    return f"{text} stop" + ("s" if abs(thirds) >= 2 else "")
+
+
+def _stops(values: ExposureValues) -> Optional[Calculation]:
+    """Écart en stops entre deux valeurs de même nature."""
+    if [len(values.apertures), len(values.shutters), len(values.isos)].count(2) != 1:
+        return None
+    if len(values.apertures) == 2:
+        first, second = values.apertures
+        stops = 2 * math.log2(second / first)
+        labels = (format_aperture(first), format_aperture(second))
+        effect = "moins de lumière" if stops > 0 else "plus de lumière"
+    elif len(values.shutters) == 2:
+        first, second = values.shutters
+        stops = math.log2(first / second)
+        labels = (format_shutter(first), format_shutter(second))
+        effect = "moins de lumière" if stops > 0 else "plus de lumière"
+    else:
+        first, second = values.isos
+        stops = math.log2(second / first)
+        labels = (f"ISO {first}", f"ISO {second}")
+        effect = "image plus claire (et plus de bruit)" if stops > 0 else "image plus sombre (et moins de bruit)"
+    if abs(stops) < 1e-9:
+        return Calculation(STOPS, f"{labels[0]} et {labels[1]} : même exposition (0 stop d'écart).", {"stops": 0.0})
+    return Calculation(
+        STOPS,
+        f"De {labels[0]} à {labels[1]} : {format_stops(abs(stops))} d'écart ({abs(stops):.2f} exactement), {effect}.",
+        {"stops": stops},
+    )
+
+
+def _ev(values: ExposureValues) -> Optional[Calculation]:
+    """EV d'un réglage (ouverture + vitesse) et luminosité de scène correspondante à l'ISO donné."""
+    if len(values.apertures) != 1 or len(values.shutters) != 1 or len(values.isos) > 1:
+        return None
+    aperture, shutter = values.apertures[0], values.shutters[0]
+    ev = math.log2(aperture**2 / shutter)
+    answer = f"{format_aperture(aperture)} à {format_shutter(shutter)} : EV = log2(N²/t) = {ev:.1f}."
+    result = {"ev": ev}
+    if values.isos:
+        iso = values.isos[0]
+        scene_ev = ev - math.log2(iso / 100)
+        result["ev100"] = scene_ev
+        answer += f" À ISO {iso}, cela correspond à une scène de EV {scene_ev:.1f} (ramené à ISO 100)."
+    return Calculation(EV, answer, result)
+
+
+def _equivalent(question: str, values: ExposureValues) -> Optional[Calculation]:
+    """Exposition équivalente : une seule valeur change, la valeur à compenser est calculée."""
+    apertures, shutters, isos = values.apertures, values.shutters, values.isos
+    if len(isos) > 2:
+        return None
+    # Un seul ISO : inchangé ; deux ISO : passage de l'ISO actuel à l'ISO visé
+    iso_factor, target_iso = 1.0, None
+    if len(isos) == 2:
+        order = _current_and_target(question, values.iso_spans)
+        if order is None:
+            return None
+        iso_factor, target_iso = isos[order[1]] / isos[order[0]], isos[order[1]]
+
+    asked = _asked_quantity(question)
+    if len(apertures) == 2 and len(shutters) == 1 and asked in (None, "shutter"):
+        # Nouvelle ouverture (et éventuellement nouvel ISO) : compenser par la vitesse
+        order = _current_and_target(question, values.aperture_spans)
+        if order is None:
+            return None
+        current, target = apertures[order[0]], apertures[order[1]]
+        shutter = shutters[0] * (target / current) ** 2 / iso_factor
+        return _shutter_answer(shutter, f"à {format_aperture(target)}", target_iso)
+    if len(shutters) == 2 and len(apertures) == 1 and asked in (None, "aperture"):
+        # Nouvelle vitesse : compenser par l'ouverture
+        order = _current_and_target(question, values.shutter_spans)
+        if order is None:
+            return None
+        current, target = shutters[order[0]], shutters[order[1]]
+        aperture = apertures[0] * math.sqrt(target / current * iso_factor)
+        return _aperture_answer(aperture, f"à {format_shutter(target)}", target_iso)
+    if len(isos) == 2 and len(apertures) == 1 and len(shutters) == 1:
+        # Nouvel ISO seul : compenser par la vitesse, ou par l'ouverture si elle est demandée
+        if asked == "aperture":
+            return _aperture_answer(apertures[0] * math.sqrt(iso_factor), "", target_iso)
+        if asked in (None, "shutter"):
+            return _shutter_answer(shutters[0] / iso_factor, "", target_iso)
+    # Grandeur demandée différente de celle que les valeurs permettent de calculer
+    return None
+
+
+def _current_and_target(question: str, spans: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """
+    Indices (réglage actuel, réglage visé) de deux valeurs de même nature, d'après les
+    indices de la question ; None si le sens n'est pas explicite.
+    """
+    (first_start, first_end), (second_start, _) = spans
+    if _FROM_BEFORE.search(question[:first_start]) and _FROM_TO_BETWEEN.fullmatch(question[first_end:second_start]):
+        return 0, 1
+    # Texte précédant chaque valeur, depuis la valeur précédente de même nature
+    roles = [_setting_role(question[:first_start]), _setting_role(question[first_end:second_start])]
+    if roles[0] == roles[1]:
+        # Aucun indice, ou deux indices identiques : sens ambigu
+        return None
+    if "target" in roles:
+        target = roles.index("target")
+        return 1 - target, target
+    current = roles.index("current")
+    return current, 1 - current
+
+
+def _setting_role(text: str) -> Optional[str]:
+    """Rôle (« current », « target ») indiqué par le dernier indice du texte, ou None."""
+    cues = list(_SETTING_ROLE_CUES.finditer(text))
+    if not cues:
+        return None
+    return "current" if cues[-1].group("current") else "target"
+
+
+def _asked_quantity(question: str) -> Optional[str]:
+    """Grandeur explicitement demandée (« shutter », « aperture », « iso ») ou None."""
+    for quantity, pattern in _ASKED_QUANTITIES:
+        if pattern.search(question):
+            return quantity
+    return None
+
+
+def _where(setting: str, target_iso: Optional[int]) -> str:
+    iso = f"à ISO {target_iso}" if target_iso is not None else ""
+    where = " ".join(part for part in (setting, iso) if part)
+    return " " + where if where else ""
+
+
+def _shutter_answer(shutter: float, setting: str, target_iso: Optional[int]) -> Calculation:
+    standard = _nearest(shutter, STANDARD_SHUTTERS)
+    answer = f"Exposition équivalente{_where(setting, target_iso)} : {format_shutter(shutter)}"
+    result = {"shutter": shutter}
+    if standard is None:
+        # Hors échelle : pas de valeur standard à proposer
+        if shutter > STANDARD_SHUTTERS[-1]:
+            answer += " (pose longue au-delà de 30 s : mode B ou télécommande)"
+    else:
+        result["standard_shutter"] = standard
+        if abs(math.log2(standard / shutter)) > 0.05:
+            answer += f" (valeur standard la plus proche : {format_shutter(standard)})"
+    return Calculation(EQUIVALENT, answer + ".", result)
+
+
+def _aperture_answer(aperture: float, setting: str, target_iso: Optional[int]) -> Calculation:
+    standard = _nearest(aperture, STANDARD_APERTURES)
+    exact = f"{aperture:.2f}".rstrip("0").rstrip(".")
+    answer = f"Exposition équivalente{_where(setting, target_iso)} : f/{exact}"
+    result = {"aperture": aperture}
+    if standard is not None:
+        result["standard_aperture"] = standard
+        if abs(math.log2(standard / aperture)) > 0.05:
+            answer += f" (valeur standard la plus proche : {format_aperture(standard)})"
+        elif abs(standard - aperture) > 1e-9:
+            answer += f", soit {format_aperture(standard)}"
+    return Calculation(EQUIVALENT, answer + ".", result)
+
+
+def _hyperfocal(question: str, values: ExposureValues) -> Optional[Calculation]:
+    """Distance hyperfocale H = f² / (N·c) + f, netteté de H/2 à l'infini."""
+    if len(values.focals) != 1 or len(values.apertures) != 1:
+        return None
+    focal, aperture = values.focals[0], values.apertures[0]
+    coc, sensor = _DEFAULT_COC
+    for pattern, circle, name in _CIRCLES_OF_CONFUSION:
+        if pattern.search(question):
+            coc, sensor = circle, name
+            break
+    hyperfocal_m = (focal**2 / (aperture * coc) + focal) / 1000
+    return Calculation(
+        HYPERFOCAL,
+        f"Hyperfocale à {focal:g} mm et {format_aperture(aperture)} ({sensor}, cercle de confusion {coc:g} mm) : "
+        f"{hyperfocal_m:.2f} m. En faisant la mise au point à cette distance, la netteté s'étend "
+        f"de {hyperfocal_m / 2:.2f} m à l'infini.",
+        {"hyperfocal_m": hyperfocal_m, "near_limit_m": hyperfocal_m / 2, "coc_mm": coc},
+    )
+
+
+def detect_intent(question: str) -> Optional[str]:
+    """Intention de calcul reconnue dans la question (None = question ordinaire)."""
+    if _HYPERFOCAL_MARKERS.search(question):
+        return HYPERFOCAL
+    if _STOPS_MARKERS.search(question):
+        return STOPS
+    if _EQUIVALENT_MARKERS.search(question):
+        return EQUIVALENT
+    if _EV_MARKERS.search(question):
+        return EV
+    return None
+
+
+def calculate(question: str) -> Optional[Calculation]:
+    """
+    Réponse calculée à une question d'exposition, ou None si la question n'en est pas
+    une ou si les valeurs sont insuffisantes ou ambiguës (la question suit alors le RAG).
+    """
+    intent = detect_intent(question)
+    if intent is None:
+        return None
+    values = parse_values(question)
+    if _CHOICE_MARKERS.search(question) or (intent != HYPERFOCAL and _RENDERING_MARKERS.search(question)):
+        # L'hyperfocale porte par nature sur la netteté : seuls les choix la renvoient au RAG
+        calculation = None
+    elif intent == HYPERFOCAL:
+        calculation = _hyperfocal(question, values)
+    elif intent == STOPS:
+        calculation = _stops(values)
+    elif intent == EQUIVALENT:
+        calculation = _equivalent(question, values)
+    else:
+        calculation = _ev(values)
+
+    metrics = get_metrics_collector()
+    if calculation is None:
+        metrics.increment("calculator.fallbacks", tags={"intent": intent})
+        logger.debug(f"🧮 Intention {intent} non calculable, passage au RAG: {question[:80]}")
+        return None
+    metrics.increment("calculator.hits", tags={"intent": intent})
+    logger.info(f"🧮 Réponse calculée ({intent}) sans LLM")
+    return calculation
+
+
+def calculator_stats() -> Dict[str, Dict[str, int]]:
+    """Réponses calculées et replis vers le RAG, par intention (exposé dans /health/detailed)."""
+    metrics = get_metrics_collector()
+    intents = (EV, EQUIVALENT, STOPS, HYPERFOCAL)
+    return {
+        "hits": {intent: metrics.get_counter("calculator.hits", tags={"intent": intent}) for intent in intents},
+        "fallbacks": {
+            intent: metrics.get_counter("calculator.fallbacks", tags={"intent": intent}) for intent in intents
+        },
+    }
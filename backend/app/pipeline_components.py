@@ -3,7 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
@@ -16,10 +16,18 @@ from langchain_community.vectorstores import FAISS
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 
 from .config import settings
+from .context_packer import get_context_packer
+from .hybrid_retrieval import HybridRetriever
+from .lexical_index import BM25Index
 from .llm_manager import get_llm_manager
+from .metadata_filter import MetadataIndex
+from .query_batcher import get_query_batcher
+from .sharded_index import DEFAULT_COLLECTION, ShardedVectorStore, get_shard_executor
 from .ocr_pipeline import ocr_any
+from .vector_search import docstore_ids, documents_at
 
 
 # ---------- Phase 1 : collecte & OCR ----------
@@ -34,6 +42,11 @@ class DocumentCollector:
         exts = {".txt", ".md", ".pdf", ".csv", ".jpg", ".jpeg", ".png", ".tif", ".tiff"}
         return [p for p in self.root_dir.rglob("*") if p.is_file() and p.suffix.lower() in exts]
 
+    def collection_of(self, path: Path) -> str:
+        """Collection d'un document = premier sous-dossier de `root_dir` (shard de l'index)."""
+        parts = path.relative_to(self.root_dir).parts
+        return parts[0] if len(parts) > 1 else DEFAULT_COLLECTION
+
 
 class OCREngine:
     """Moteur OCR simple avec fallback (ici Tesseract uniquement, extensible)."""
@@ -92,11 +105,15 @@ class SmartChunker:
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             separators=["\n## ", "\n### ", "\n", ". ", "! ", "? ", " "],
+            add_start_index=True,
         )
 
     def create_chunks(self, structured_doc: Dict[str, Any], metadata: Dict[str, Any]) -> List[Any]:
         full_text = "\n\n".join(structured_doc.get("paragraphes", []))
         docs = self.splitter.create_documents([full_text], metadatas=[metadata])
+        # Position du chunk dans le document (détection des chunks voisins au retrieval)
+        for chunk_index, doc in enumerate(docs):
+            doc.metadata["chunk_index"] = chunk_index
         return docs
 
 
@@ -111,51 +128,183 @@ class EmbeddingGenerator:
         return FAISS.from_documents(list(docs), self.embedding_model)
 
 
+def build_lexical_index(vs: FAISS) -> BM25Index:
+    """Construit l'index BM25 aligné sur les positions de l'index FAISS."""
+    doc_ids = docstore_ids(vs)
+    texts = (doc.page_content for doc in documents_at(vs, range(len(doc_ids))))
+    return BM25Index.build(texts, doc_ids, k1=settings.bm25_k1, b=settings.bm25_b)
+
+
+def load_or_build_lexical_index(vs: FAISS, storage_dir: Path) -> BM25Index:
+    """
+    Charge l'index BM25 sauvegardé ; le (re)construit s'il est absent ou désaligné
+    avec FAISS (vector store créé avant l'ajout de la recherche hybride).
+    """
+    if BM25Index.exists(storage_dir):
+        index = BM25Index.load(storage_dir)
+        if index.doc_ids == docstore_ids(vs):
+            return index
+    index = build_lexical_index(vs)
+    index.save(storage_dir)
+    return index
+
+
+def build_metadata_index(vs: FAISS) -> MetadataIndex:
+    """Construit les bitmaps de métadonnées alignés sur les positions de l'index FAISS."""
+    doc_ids = docstore_ids(vs)
+    metadatas = [doc.metadata for doc in documents_at(vs, range(len(doc_ids)))]
+    return MetadataIndex.build(metadatas, doc_ids)
+
+
+def load_or_build_metadata_index(vs: FAISS, storage_dir: Path) -> MetadataIndex:
+    """Charge l'index de métadonnées sauvegardé ; le (re)construit s'il est absent ou désaligné."""
+    if MetadataIndex.exists(storage_dir):
+        index = MetadataIndex.load(storage_dir)
+        if index.doc_ids == docstore_ids(vs):
+            return index
+    index = build_metadata_index(vs)
+    index.save(storage_dir)
+    return index
+
+
 class VectorStoreManager:
-    def __init__(self, storage_dir: Path) -> None:
+    SHARDS_DIRNAME = "shards"
+
+    def __init__(self, storage_dir: Path, embedding_model: Optional[Any] = None) -> None:
         self.storage_dir = storage_dir
         self.storage_dir.mkdir(parents=True, exist_ok=True)
-        self.embedding_model = HuggingFaceEmbeddings(model_name=settings.embedding_model_name)
+        self.embedding_model = embedding_model or HuggingFaceEmbeddings(model_name=settings.embedding_model_name)
+
+    @property
+    def shards_dir(self) -> Path:
+        return self.storage_dir / self.SHARDS_DIRNAME
 
     def save(self, vs: FAISS) -> None:
-        vs.save_local(str(self.storage_dir))
+        # Les shards d'une construction précédente ne doivent pas masquer le nouvel index
+        keep = set(vs.shards) if isinstance(vs, ShardedVectorStore) else set()
+        for name in self.list_shards():
+            if name not in keep:
+                self.delete_shard(name)
+        if isinstance(vs, ShardedVectorStore):
+            for name, shard in vs.shards.items():
+                self.save_shard(name, shard)
+        else:
+            vs.save_local(str(self.storage_dir))
+        # L'index inversé BM25 et les bitmaps de métadonnées sont construits à l'ingestion
+        build_lexical_index(vs).save(self.storage_dir)
+        build_metadata_index(vs).save(self.storage_dir)
 
     def load(self) -> FAISS:
+        if self.list_shards():
+            return self.load_sharded()
         return FAISS.load_local(
             str(self.storage_dir),
             self.embedding_model,
             allow_dangerous_deserialization=True,
         )
 
+    # --- Index shardé : un vector store FAISS par collection ---
+
+    def list_shards(self) -> List[str]:
+        if not self.shards_dir.exists():
+            return []
+        return sorted(p.name for p in self.shards_dir.iterdir() if (p / "index.faiss").exists())
+
+    def save_shard(self, name: str, vs: FAISS) -> None:
+        """Sauvegarde un seul shard ; les autres shards ne sont pas touchés."""
+        vs.save_local(str(self.shards_dir / name))
+
+    def delete_shard(self, name: str) -> None:
+        import shutil
+
+        shutil.rmtree(self.shards_dir / name, ignore_errors=True)
+
+    def load_shard(self, name: str) -> FAISS:
+        return FAISS.load_local(
+            str(self.shards_dir / name),
+            self.embedding_model,
+            allow_dangerous_deserialization=True,
+        )
+
+    def load_sharded(self) -> ShardedVectorStore:
+        """Charge tous les shards en parallèle et les assemble."""
+        names = self.list_shards()
+        executor = get_shard_executor()
+        shards = dict(zip(names, executor.map(self.load_shard, names)))
+        return ShardedVectorStore(shards, executor=executor)
+
 
 # ---------- Phase 4 : retrieval & génération RAG ----------
 
 
 class RetrievalEngine:
-    def __init__(self, vector_store: FAISS) -> None:
-        self.retriever = vector_store.as_retriever(search_kwargs={"k": 4})
+    def __init__(
+        self,
+        vector_store: FAISS,
+        lexical_index: Optional[BM25Index] = None,
+        k: int = 4,
+        mask: Optional[Any] = None,
+    ) -> None:
+        if not settings.hybrid_search_enabled:
+            lexical_index = None
+        self.retriever = HybridRetriever(
+            vector_store=vector_store,
+            lexical_index=lexical_index,
+            mask=mask,
+            k=k,
+            vector_k=settings.hybrid_vector_k,
+            lexical_k=settings.hybrid_lexical_k,
+            rrf_k=settings.rrf_k,
+            batcher=get_query_batcher() if settings.query_batching_enabled else None,
+        )
 
     def get_retriever(self):
         return self.retriever
 
 
-class RAGGenerator:
-    def __init__(self, retriever) -> None:
-        # OPTIMISATION: Prompt plus court et concis pour réduire la latence
-        system_prompt = """Expert photo. Réponds en français avec conseils concrets et réglages (ISO, ouverture, vitesse).
-Contexte peut contenir des erreurs OCR. Cite les sources. Si info manquante, dis-le.
+# OPTIMISATION: Prompt plus court et concis pour réduire la latence
+# Parties fixes en tête, parties variables ensuite : le message système est identique
+# d'une requête à l'autre, son préfixe reste dans le cache KV d'Ollama (modèle chargé)
+RAG_SYSTEM_PROMPT = """Expert photo. Réponds en français avec conseils concrets et réglages (ISO, ouverture, vitesse).
+Contexte peut contenir des erreurs OCR. Cite les sources. Si info manquante, dis-le."""
+
+RAG_HUMAN_PROMPT = """Contexte: {context}
+
+Question: {input}"""
+
 
-Contexte: {context}"""
-        prompt = ChatPromptTemplate.from_messages([("system", system_prompt), ("human", "{input}")])
+def build_rag_prompt() -> ChatPromptTemplate:
+    """Prompt RAG partagé par toutes les générations (même préfixe pour le cache d'Ollama)."""
+    return ChatPromptTemplate.from_messages([("system", RAG_SYSTEM_PROMPT), ("human", RAG_HUMAN_PROMPT)])
+
+
+class RAGGenerator:
+    def __init__(self, retriever=None) -> None:
+        prompt = build_rag_prompt()
         # Utiliser le gestionnaire LLM pour obtenir le LLM configuré (Ollama, OpenAI, etc.)
         llm_manager = get_llm_manager()
         llm = llm_manager.get_llm()  # Utilise le LLM par défaut
-        qa_chain = create_stuff_documents_chain(llm, prompt)
-        self.rag_chain = create_retrieval_chain(retriever, qa_chain)
+        # Contexte limité au budget de tokens du modèle (phrases entières)
+        self.packer = get_context_packer(llm_manager.llms[llm_manager.default_llm].model_name)
+        self.qa_chain = create_stuff_documents_chain(llm, prompt)
+        self.rag_chain = None
+        if retriever is not None:
+            # Chaîne qui n'est pas un BaseRetriever : elle reçoit l'entrée complète
+            packed_retriever = RunnableLambda(lambda inputs: inputs["input"]) | retriever | RunnableLambda(self._pack)
+            self.rag_chain = create_retrieval_chain(packed_retriever, self.qa_chain)
+
+    def _pack(self, documents: List[Any]) -> List[Any]:
+        return self.packer.pack(documents).documents
 
     def generate_answer(self, question: str) -> Dict[str, Any]:
+        if self.rag_chain is None:
+            raise ValueError("Aucun retriever configuré : utiliser generate_answer_from_documents")
         return self.rag_chain.invoke({"input": question})
 
+    def generate_answer_from_documents(self, question: str, documents: List[Any]) -> str:
+        """Génère la réponse à partir de documents déjà récupérés (pas de second retrieval)."""
+        return self.qa_chain.invoke({"input": question, "context": self._pack(documents)})
+
 
 # ---------- Phase 5 : monitoring (version légère) ----------
 
@@ -0,0 +1,164 @@
+"""
+Micro-batching des requêtes de retrieval concurrentes.
+
+Au lieu d'un encodage et d'un `index.search` par requête (batch de 1), les
+questions arrivant dans une petite fenêtre (ex: 5 ms, 32 max) sont encodées en
+un seul batch et recherchées en un seul appel FAISS, puis les résultats sont
+redistribués aux appelants.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+from .metrics import get_metrics_collector
+from .vector_search import embed_queries, search_vectors
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class VectorHits:
+    """Résultat d'une recherche vectorielle pour une question."""
+
+    distances: np.ndarray
+    positions: np.ndarray
+    query_vector: np.ndarray
+
+
+@dataclass
+class _PendingQuery:
+    vector_store: Any
+    question: str
+    k: int
+    mask: Optional[np.ndarray]
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class QueryBatcher:
+    """Regroupe les requêtes concurrentes en batchs d'encodage et de recherche FAISS."""
+
+    def __init__(self, window_ms: float = 5.0, max_batch: int = 32):
+        """
+        Args:
+            window_ms: Fenêtre d'attente après la première requête d'un batch (millisecondes)
+            max_batch: Taille maximale d'un batch
+        """
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue[_PendingQuery]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def search(
+        self, vector_store: Any, question: str, k: int, mask: Optional[np.ndarray] = None
+    ) -> VectorHits:
+        """Soumet une question et attend son résultat (bloquant)."""
+        return self.submit(vector_store, question, k, mask).result()
+
+    def submit(self, vector_store: Any, question: str, k: int, mask: Optional[np.ndarray] = None) -> Future:
+        """Soumet une question ; le Future est résolu avec un `VectorHits`."""
+        self._ensure_worker()
+        pending = _PendingQuery(vector_store=vector_store, question=question, k=k, mask=mask)
+        self._queue.put(pending)
+        return pending.future
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:  # Ne jamais tuer le worker
+                logger.error(f"Erreur dans le micro-batch de retrieval: {e}")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+
+    def _process(self, batch: List[_PendingQuery]) -> None:
+        metrics = get_metrics_collector()
+        started = time.perf_counter()
+        metrics.record_histogram("retrieval.batch_size", len(batch))
+        for pending in batch:
+            metrics.record_timer("retrieval.batch_queue_delay", started - pending.enqueued_at)
+
+        # Un batch d'encodage par vector store (en pratique un seul)
+        by_store: Dict[int, List[_PendingQuery]] = {}
+        for pending in batch:
+            by_store.setdefault(id(pending.vector_store), []).append(pending)
+
+        for group in by_store.values():
+            vector_store = group[0].vector_store
+            try:
+                vectors = embed_queries(vector_store, [p.question for p in group])
+            except Exception as e:
+                for pending in group:
+                    pending.future.set_exception(e)
+                continue
+
+            # Une recherche matricielle par filtre distinct (toutes les requêtes non filtrées ensemble) ;
+            # chaque requête filtrée a son propre tableau : regroupement par contenu du masque
+            by_mask: Dict[Any, List[Tuple[int, _PendingQuery]]] = {}
+            for row, pending in enumerate(group):
+                by_mask.setdefault(_mask_key(pending.mask), []).append((row, pending))
+
+            for items in by_mask.values():
+                rows = [row for row, _ in items]
+                k = max(pending.k for _, pending in items)
+                try:
+                    distances, positions = search_vectors(vector_store, vectors[rows], k, mask=items[0][1].mask)
+                except Exception as e:
+                    for _, pending in items:
+                        pending.future.set_exception(e)
+                    continue
+                for i, (row, pending) in enumerate(items):
+                    pending.future.set_result(
+                        VectorHits(
+                            distances=distances[i, : pending.k],
+                            positions=positions[i, : pending.k],
+                            query_vector=vectors[row],
+                        )
+                    )
+
+
+def _mask_key(mask: Optional[np.ndarray]) -> Optional[Tuple[str, Tuple[int, ...], bytes]]:
+    """Clé de regroupement d'un masque : masques de même contenu, même recherche FAISS."""
+    if mask is None:
+        return None
+    return mask.dtype.str, mask.shape, mask.tobytes()
+
+
+# Instance globale
+_query_batcher: Optional[QueryBatcher] = None
+
+
+def get_query_batcher() -> QueryBatcher:
+    """Récupère l'instance globale du micro-batcher."""
+    global _query_batcher
+    if _query_batcher is None:
+        _query_batcher = QueryBatcher(
+            window_ms=settings.query_batch_window_ms, max_batch=settings.query_batch_max_size
+        )
+    return _query_batcher
@@ -0,0 +1,286 @@
+"""
+Moteur RAG réutilisable : prompt, chaîne, retriever et client LLM construits une
+seule fois par (version de l'index, LLM, k) puis mis en cache.
+
+Les réponses bloquantes et en streaming partagent le même résultat de retrieval
+(pas de second retrieval pour le fallback du streaming).
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain.chains.combine_documents import create_stuff_documents_chain
+
+from .admission import aadmitted, admitted, tier_config
+from .config import settings
+from .context_packer import PackedContext, get_context_packer
+from .diversity import diversify
+from .hybrid_retrieval import HybridRetriever, ScoredChunk, select_by_score
+from .llm_manager import get_llm_manager
+from .llm_router import RoutedLLM
+from .metrics import get_metrics_collector
+from .pipeline_components import RetrievalEngine, build_rag_prompt
+from .query_batcher import VectorHits
+from .reranker import get_reranker
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de moteurs gardés en mémoire (combinaisons LLM / k)
+MAX_CACHED_ENGINES = 16
+
+
+def format_source(doc, score: Optional[float] = None) -> dict:
+    """Informations de source renvoyées au client pour un chunk."""
+    source = {
+        "document": doc.metadata.get("source_document", "Inconnu"),
+        "path": doc.metadata.get("path", ""),
+        "page": doc.metadata.get("page", ""),
+        "preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+    }
+    if score is not None:
+        source["score"] = round(score, 4)
+    return source
+
+
+def select_chunks(
+    retriever: HybridRetriever,
+    question: str,
+    max_k: int,
+    hits: Optional[VectorHits] = None,
+    timings: Optional[dict] = None,
+) -> List[ScoredChunk]:
+    """
+    Retrieval avec scores : évalue les N meilleurs candidats fusionnés, les reranke
+    (cross-encoder, si activé), les diversifie (MMR + fusion des chunks voisins) puis
+    applique le seuil de pertinence et la politique de k dynamique.
+
+    `timings` (optionnel) est complété avec `rerank_ms`.
+    """
+    if hits is None:
+        hits = retriever.vector_hits(question)
+    candidates = retriever.score_candidates(
+        hits, retriever.fuse(question, hits)[: max(max_k, settings.retrieval_candidates)]
+    )
+    reranker = get_reranker()
+    if reranker.enabled:
+        rerank_start = time.perf_counter()
+        candidates = reranker.rerank(question, candidates)
+        if timings is not None:
+            timings["rerank_ms"] = timings.get("rerank_ms", 0.0) + (time.perf_counter() - rerank_start) * 1000
+    if settings.mmr_enabled:
+        candidates = diversify(candidates, max_k, lambda_mult=settings.mmr_lambda)
+    if settings.dynamic_k_enabled:
+        selected = select_by_score(
+            candidates,
+            threshold=settings.retrieval_score_threshold,
+            min_k=min(settings.dynamic_k_min, max_k),
+            max_k=max_k,
+            dominance_margin=settings.dynamic_k_dominance_margin,
+            score_band=settings.dynamic_k_score_band,
+        )
+    else:
+        # k fixe : seul le seuil de pertinence s'applique
+        selected = select_by_score(
+            candidates[:max_k],
+            threshold=settings.retrieval_score_threshold,
+            min_k=1,
+            max_k=max_k,
+            dominance_margin=float("inf"),
+            score_band=float("inf"),
+        )
+    get_metrics_collector().record_histogram("retrieval.selected_k", len(selected))
+    return selected
+
+
+def _token_text(chunk: Any) -> str:
+    """Extrait le texte d'un chunk de streaming (AIMessageChunk, str, dict...)."""
+    if hasattr(chunk, "content"):
+        return chunk.content
+    if hasattr(chunk, "text"):
+        return chunk.text
+    if isinstance(chunk, str):
+        return chunk
+    if isinstance(chunk, dict):
+        return chunk.get("content", chunk.get("text", chunk.get("token", "")))
+    return str(chunk) if chunk else ""
+
+
+@dataclass
+class RetrievalResult:
+    """Résultat d'un retrieval, partagé entre génération bloquante et streaming."""
+
+    question: str
+    chunks: List[ScoredChunk]
+    retrieval_ms: float = 0.0
+    rerank_ms: float = 0.0
+    # Embedding de la question (réutilisé par le cache sémantique)
+    query_vector: Optional[Any] = None
+    # Contexte assemblé pour le prompt (calculé une fois, voir `RAGEngine.pack_context`)
+    context: Optional[PackedContext] = None
+
+    @property
+    def documents(self) -> List[Any]:
+        return [chunk.document for chunk in self.chunks]
+
+    @property
+    def sources(self) -> List[dict]:
+        return [format_source(chunk.document, chunk.score) for chunk in self.chunks]
+
+
+class RAGEngine:
+    """
+    Moteur RAG construit une fois : retriever hybride, client LLM, prompt compilé
+    et chaîne « stuff documents ».
+    """
+
+    def __init__(
+        self,
+        vector_store: Any,
+        lexical_index: Optional[Any] = None,
+        llm_name: Optional[str] = None,
+        k: int = 3,
+    ) -> None:
+        self.vector_store = vector_store
+        self.llm_name = llm_name
+        self.k = k
+        self.retriever: HybridRetriever = RetrievalEngine(vector_store, lexical_index, k=k).get_retriever()
+        llm_manager = get_llm_manager()
+        self.llm = llm_manager.get_llm(llm_name)
+        # LLM routé : la place de génération est prise par le routeur, pour l'endpoint choisi
+        self.routed = isinstance(self.llm, RoutedLLM)
+        self.model_name = llm_manager.llms[llm_name or llm_manager.default_llm].model_name
+        self.packer = get_context_packer(self.model_name)
+        self.prompt = build_rag_prompt()
+        self.qa_chain = create_stuff_documents_chain(self.llm, self.prompt)
+
+    def _retriever_for(self, mask: Optional[Any]) -> HybridRetriever:
+        if mask is None:
+            return self.retriever
+        return self.retriever.model_copy(update={"mask": mask})
+
+    def vector_hits(self, question: str, mask: Optional[Any] = None) -> VectorHits:
+        """Encodage de la question et recherche vectorielle seuls (réutilisables par `retrieve`)."""
+        return self._retriever_for(mask).vector_hits(question)
+
+    def retrieve(self, question: str, mask: Optional[Any] = None, hits: Optional[VectorHits] = None) -> RetrievalResult:
+        """Retrieval avec scores ; `mask` = positions autorisées par les filtres de métadonnées."""
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        retriever = self._retriever_for(mask)
+        if hits is None:
+            hits = retriever.vector_hits(question)
+        chunks = select_chunks(retriever, question, self.k, hits=hits, timings=timings)
+        rerank_ms = timings.get("rerank_ms", 0.0)
+        return RetrievalResult(
+            question=question,
+            chunks=chunks,
+            retrieval_ms=(time.perf_counter() - start) * 1000 - rerank_ms,
+            rerank_ms=rerank_ms,
+            query_vector=hits.query_vector,
+        )
+
+    def retrieve_batch(
+        self, questions: Sequence[str], mask: Optional[Any] = None, timings: Optional[Dict[str, float]] = None
+    ) -> List[RetrievalResult]:
+        """Retrieval de plusieurs questions : un encodage batch et une recherche matricielle FAISS."""
+        retriever = self._retriever_for(mask)
+        all_hits = retriever.vector_hits_batch(questions, timings=timings)
+        return [self.retrieve(question, mask=mask, hits=hits) for question, hits in zip(questions, all_hits)]
+
+    def pack_context(self, retrieval: RetrievalResult) -> PackedContext:
+        """Contexte du prompt : phrases entières des chunks, dans le budget de tokens du modèle."""
+        # Recalculé si le retrieval est réutilisé par un moteur d'un autre budget (cascade de modèles)
+        if retrieval.context is None or retrieval.context.budget != self.packer.budget:
+            retrieval.context = self.packer.pack(retrieval.documents)
+        return retrieval.context
+
+    def _admitted(self, tier: Optional[str]):
+        return admitted(None if self.routed else self.llm_name, None if self.routed else tier)
+
+    def _aadmitted(self, tier: Optional[str]):
+        return aadmitted(None if self.routed else self.llm_name, None if self.routed else tier)
+
+    def generate(self, question: str, retrieval: RetrievalResult, tier: Optional[str] = None) -> str:
+        """
+        Réponse complète (bloquante) à partir du résultat de retrieval.
+
+        `tier` : tier d'admission de la requête ; la place de génération est prise pour
+        ce LLM le temps de l'appel (aucune si None).
+        """
+        inputs = {"input": question, "context": self.pack_context(retrieval).documents}
+        with self._admitted(tier):
+            return self.qa_chain.invoke(inputs, config=tier_config(tier))
+
+    async def agenerate(self, question: str, retrieval: RetrievalResult, tier: Optional[str] = None) -> str:
+        """Version asynchrone de `generate` (client HTTP asynchrone du LLM)."""
+        inputs = {"input": question, "context": self.pack_context(retrieval).documents}
+        async with self._aadmitted(tier):
+            return await self.qa_chain.ainvoke(inputs, config=tier_config(tier))
+
+    def stream(self, question: str, retrieval: RetrievalResult, tier: Optional[str] = None) -> Iterator[str]:
+        """Stream la réponse token par token à partir du résultat de retrieval."""
+        messages = self.prompt.format_messages(context=self.pack_context(retrieval).text, input=question)
+        with self._admitted(tier):
+            for chunk in self.llm.stream(messages, config=tier_config(tier)):
+                token = _token_text(chunk)
+                if token:
+                    yield token
+
+    async def astream(
+        self, question: str, retrieval: RetrievalResult, tier: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Version asynchrone de `stream` : les tokens sont lus sans bloquer la boucle d'événements."""
+        messages = self.prompt.format_messages(context=self.pack_context(retrieval).text, input=question)
+        async with self._aadmitted(tier):
+            async for chunk in self.llm.astream(messages, config=tier_config(tier)):
+                token = _token_text(chunk)
+                if token:
+                    yield token
+
+
+# Cache des moteurs par (version de l'index, LLM, k)
+_engines: "OrderedDict[Tuple[Any, Optional[str], int], RAGEngine]" = OrderedDict()
+_engines_lock = threading.Lock()
+
+
+def get_rag_engine(
+    vector_store: Any,
+    index_version: Any,
+    lexical_index: Optional[Any] = None,
+    llm_name: Optional[str] = None,
+    k: int = 3,
+) -> RAGEngine:
+    """
+    Récupère (ou construit) le moteur RAG pour (version de l'index, LLM, k).
+
+    Args:
+        vector_store: Vector store chargé
+        index_version: Version du vector store (change à chaque rechargement)
+        lexical_index: Index BM25 aligné sur le vector store
+        llm_name: Nom du LLM (None = LLM par défaut)
+        k: Nombre maximal de chunks par réponse
+    """
+    key = (index_version, llm_name or get_llm_manager().default_llm, k)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is not None and engine.vector_store is vector_store:
+            _engines.move_to_end(key)
+            return engine
+
+        start = time.time()
+        engine = RAGEngine(vector_store, lexical_index, llm_name=llm_name, k=k)
+        _engines[key] = engine
+        while len(_engines) > MAX_CACHED_ENGINES:
+            _engines.popitem(last=False)
+    logger.info(f"⚙️ Moteur RAG construit en {(time.time() - start) * 1000:.2f}ms (LLM: {key[1]}, k={k})")
+    return engine
+
+
+def clear_rag_engines() -> None:
+    """Vide le cache des moteurs (ex: après rechargement du vector store ou changement de LLM)."""
+    with _engines_lock:
+        _engines.clear()
@@ -1,5 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import asyncio
 import time
 import threading
 
@@ -12,15 +14,26 @@ from .pipeline_components import (
     OCRCorrector,
     OCREngine,
     OCRQualityMonitor,
-    RAGGenerator,
-    RetrievalEngine,
     SmartChunker,
     VectorStoreManager,
     analyze_document_structure,
+    load_or_build_lexical_index,
+    load_or_build_metadata_index,
 )
+from .lexical_index import BM25Index
+from .sharded_index import ShardedVectorStore, get_shard_executor
+from .hybrid_retrieval import ScoredChunk
+from .rag_engine import RAGEngine, RetrievalResult, clear_rag_engines, get_rag_engine
+from .metadata_filter import MetadataIndex, RetrievalFilters
 from .monitoring_phoenix import get_phoenix_monitor
 from .cache import get_cache_manager
+from .admission import AdmissionRejected
+from .semantic_cache import get_semantic_cache
+from .single_flight import get_single_flight, normalize_question
 from .llm_manager import get_llm_manager
+from .metrics import get_metrics_collector
+from .model_cascade import SMALL, CascadeDecision, CascadePolicy
+from .photo_calculator import calculate
 import hashlib
 import logging
 
@@ -31,25 +44,29 @@ _vector_store_cache: Optional[FAISS] = None
 _vector_store_lock = threading.Lock()
 _vector_store_loading = False
 
+# Index BM25 et bitmaps de métadonnées associés au vector store en cache
+_lexical_index_cache: Optional[BM25Index] = None
+_metadata_index_cache: Optional[MetadataIndex] = None
 
-def _build_vector_store_from_raw_documents(data_dir: Path) -> FAISS:
-    """
-    Implémente ton pipeline MLOps OCR -> correction -> structuration -> chunking -> embeddings.
-    """
-    collector = DocumentCollector(root_dir=data_dir)
+# Version du vector store en cache (incrémentée à chaque vidage du cache)
+_vector_store_version = 0
+
+
+def _collect_chunks(collector: DocumentCollector, paths: List[Path]) -> list:
+    """OCR -> correction -> structuration -> chunking pour une liste de fichiers."""
     ocr_engine = OCREngine()
     corrector = OCRCorrector()
     chunker = SmartChunker()
-    embedder = EmbeddingGenerator()
     monitor = OCRQualityMonitor()
 
     docs = []
 
-    for path in collector.get_documents():
+    for path in paths:
         suffix = path.suffix.lower()
         base_metadata = {
             "source_document": path.name,
             "path": str(path),
+            "collection": collector.collection_of(path),
             "date_extraction": None,
             "section_type": "texte",
         }
@@ -74,10 +91,30 @@ def _build_vector_store_from_raw_documents(data_dir: Path) -> FAISS:
 
         docs.extend(chunker.create_chunks(structured, metadata))
 
+    return docs
+
+
+def _build_vector_store_from_raw_documents(data_dir: Path) -> FAISS:
+    """
+    Implémente ton pipeline MLOps OCR -> correction -> structuration -> chunking -> embeddings.
+    Avec VECTOR_STORE_SHARDED, un shard FAISS est construit par collection (sous-dossier de data_dir).
+    """
+    collector = DocumentCollector(root_dir=data_dir)
+    embedder = EmbeddingGenerator()
+
+    docs = _collect_chunks(collector, collector.get_documents())
+
     if not docs:
         raise RuntimeError("Aucun document exploitable n'a été trouvé pour construire le vector store.")
 
-    vector_store = embedder.generate_vectors(docs)
+    if settings.vector_store_sharded:
+        by_collection = {}
+        for doc in docs:
+            by_collection.setdefault(doc.metadata["collection"], []).append(doc)
+        shards = {name: embedder.generate_vectors(chunks) for name, chunks in by_collection.items()}
+        vector_store = ShardedVectorStore(shards, executor=get_shard_executor())
+    else:
+        vector_store = embedder.generate_vectors(docs)
 
     vs_manager = VectorStoreManager(storage_dir=settings.vector_store_dir)
     vs_manager.save(vector_store)
@@ -85,6 +122,31 @@ def _build_vector_store_from_raw_documents(data_dir: Path) -> FAISS:
     return vector_store
 
 
+def rebuild_shard(collection: str, data_dir: Optional[Path] = None) -> int:
+    """
+    Reconstruit un seul shard (une collection) sans toucher aux autres shards.
+
+    Le vector store en cache est ensuite réassemblé depuis le disque au prochain
+    chargement ; les index BM25 et de métadonnées (peu coûteux) sont alors
+    reconstruits car désalignés.
+
+    Returns:
+        Nombre de chunks du shard reconstruit (0 = shard supprimé)
+    """
+    collector = DocumentCollector(root_dir=data_dir or settings.data_dir)
+    paths = [path for path in collector.get_documents() if collector.collection_of(path) == collection]
+    docs = _collect_chunks(collector, paths)
+
+    vs_manager = VectorStoreManager(storage_dir=settings.vector_store_dir)
+    if docs:
+        vs_manager.save_shard(collection, EmbeddingGenerator().generate_vectors(docs))
+    else:
+        vs_manager.delete_shard(collection)
+    clear_vector_store_cache()
+    logger.info(f"✅ Shard '{collection}' reconstruit ({len(docs)} chunks)")
+    return len(docs)
+
+
 def _load_or_build_vector_store(force_rebuild: bool = False) -> FAISS:
     """
     Charge ou construit le vector store avec cache en mémoire pour améliorer les performances.
@@ -94,8 +156,7 @@ def _load_or_build_vector_store(force_rebuild: bool = False) -> FAISS:
 
     # Si on force la reconstruction, vider le cache
     if force_rebuild:
-        with _vector_store_lock:
-            _vector_store_cache = None
+        clear_vector_store_cache()
 
     # Si le cache existe, le retourner immédiatement (OPTIMISATION MAJEURE)
     if _vector_store_cache is not None:
@@ -146,16 +207,140 @@ def _load_or_build_vector_store(force_rebuild: bool = False) -> FAISS:
         _vector_store_loading = False
 
 
+def _load_lexical_index(vector_store: FAISS) -> BM25Index:
+    """Charge (ou construit) l'index BM25 aligné sur le vector store, avec cache en mémoire."""
+    global _lexical_index_cache
+
+    if _lexical_index_cache is not None:
+        return _lexical_index_cache
+
+    with _vector_store_lock:
+        if _lexical_index_cache is None:
+            start_time = time.time()
+            _lexical_index_cache = load_or_build_lexical_index(vector_store, settings.vector_store_dir)
+            logger.info(
+                f"✅ Index BM25 chargé en {time.time() - start_time:.2f}s ({len(_lexical_index_cache)} chunks)"
+            )
+        return _lexical_index_cache
+
+
+def _load_metadata_index(vector_store: FAISS) -> MetadataIndex:
+    """Charge (ou construit) les bitmaps de métadonnées alignés sur le vector store, avec cache en mémoire."""
+    global _metadata_index_cache
+
+    if _metadata_index_cache is not None:
+        return _metadata_index_cache
+
+    with _vector_store_lock:
+        if _metadata_index_cache is None:
+            _metadata_index_cache = load_or_build_metadata_index(vector_store, settings.vector_store_dir)
+        return _metadata_index_cache
+
+
+def _retrieval_mask(vector_store: FAISS, filters: Optional[RetrievalFilters]):
+    """Masque des positions autorisées par les filtres (None = pas de filtre)."""
+    if filters is None or filters.is_empty():
+        return None
+    return _load_metadata_index(vector_store).mask(filters)
+
+
+def _answer_cache_key(question: str, filters: Optional[RetrievalFilters] = None) -> str:
+    key = question if filters is None else f"{question}|{filters.cache_key()}"
+    return f"rag:answer:{hashlib.md5(key.encode()).hexdigest()}"
+
+
+def _semantic_namespace(filters: Optional[RetrievalFilters], max_docs: int) -> tuple:
+    """Contexte d'une réponse pour le cache sémantique (une réponse filtrée ne sert pas une question non filtrée)."""
+    return (filters.cache_key() if filters is not None else None, max_docs)
+
+
+def _semantic_cache_store(
+    question: str, retrieval: RetrievalResult, result: dict, filters: Optional[RetrievalFilters], max_docs: int
+) -> None:
+    if retrieval.query_vector is not None and result.get("answer"):
+        get_semantic_cache().store(
+            question, retrieval.query_vector, result, _vector_store_version, _semantic_namespace(filters, max_docs)
+        )
+
+
+def _flight_key(question: str, num_docs: Optional[int], filters: Optional[RetrievalFilters]) -> tuple:
+    """Clé de coalescence : question normalisée, version de l'index, modèle, filtres et k."""
+    return (
+        normalize_question(question),
+        _vector_store_version,
+        get_llm_manager().default_llm,
+        filters.cache_key() if filters is not None else None,
+        _max_retrieval_docs(num_docs),
+    )
+
+
+def _max_retrieval_docs(num_docs: Optional[int]) -> int:
+    """Nombre maximal de chunks envoyés au LLM (num_docs explicite, sinon borne du k dynamique)."""
+    if num_docs is not None:
+        return num_docs
+    return settings.dynamic_k_max if settings.dynamic_k_enabled else settings.num_retrieval_docs
+
+
+def _trace_scored_retrieval(monitor, question: str, chunks: List[ScoredChunk]) -> None:
+    if monitor and monitor.enabled:
+        sources_preview = [
+            {
+                "document": chunk.document.metadata.get("source_document", "Inconnu"),
+                "preview": chunk.document.page_content[:100],
+            }
+            for chunk in chunks[:5]
+        ]
+        monitor.trace_retrieval(question, sources_preview, [chunk.relevance for chunk in chunks[:5]])
+
+
+def _get_engine(vector_store: FAISS, max_docs: int, llm_name: Optional[str] = None) -> RAGEngine:
+    """Moteur RAG en cache pour la version courante du vector store."""
+    return get_rag_engine(
+        vector_store, _vector_store_version, _load_lexical_index(vector_store), llm_name=llm_name, k=max_docs
+    )
+
+
+def _cascade_engine(
+    engine: RAGEngine, question: str, retrieval: RetrievalResult
+) -> Tuple[RAGEngine, Optional[CascadeDecision]]:
+    """Moteur du modèle choisi par la cascade : petit modèle pour les questions simples, sinon `engine`."""
+    cascade = get_llm_manager().get_cascade()
+    if cascade is None:
+        return engine, None
+    decision = cascade.classify(question, retrieval)
+    logger.debug(f"🪜 Cascade: tier {decision.tier} ({decision.reason})")
+    if decision.tier == SMALL:
+        return _get_engine(engine.vector_store, engine.k, llm_name=decision.llm_name), decision
+    return engine, decision
+
+
+def _calculated_answer(question: str) -> Optional[dict]:
+    """Réponse du calculateur d'exposition (None = question à traiter par le RAG)."""
+    if not settings.calculator_enabled:
+        return None
+    calculation = calculate(question)
+    return calculation.as_result() if calculation is not None else None
+
+
 def clear_vector_store_cache():
     """Vide le cache du vector store. Utile pour forcer un rechargement."""
-    global _vector_store_cache
+    global _vector_store_cache, _lexical_index_cache, _metadata_index_cache, _vector_store_version
     with _vector_store_lock:
         _vector_store_cache = None
+        _lexical_index_cache = None
+        _metadata_index_cache = None
+        _vector_store_version += 1
+    clear_rag_engines()
     logger.info("🗑️ Cache du vector store vidé")
 
 
-def answer_question(
-    question: str, show_sources: bool = True, force_rebuild: bool = False, num_docs: Optional[int] = None
+def _answer_question(
+    question: str,
+    show_sources: bool = True,
+    force_rebuild: bool = False,
+    num_docs: Optional[int] = None,
+    filters: Optional[RetrievalFilters] = None,
+    tier: Optional[str] = None,
 ) -> dict:
     """
     Fonction utilitaire de haut niveau alignée sur ton schéma MLOps :
@@ -167,19 +352,20 @@ def answer_question(
         question: La question à poser
         show_sources: Afficher les sources
         force_rebuild: Forcer la reconstruction du vector store
-        num_docs: Nombre de documents à récupérer (None = utiliser la valeur de la config, défaut optimisé: 3)
+        num_docs: Nombre maximal de documents à récupérer (None = k dynamique borné par DYNAMIC_K_MAX)
+        filters: Filtres de métadonnées appliqués dans la recherche (document source, section, confiance OCR)
+        tier: Tier d'admission (place de génération prise pour le LLM qui génère ; None = sans admission)
 
     Returns:
         dict avec 'answer' (réponse) et 'sources' (documents utilisés)
     """
-    # Utiliser la valeur de la config si non spécifiée
-    if num_docs is None:
-        num_docs = settings.num_retrieval_docs
+    # Borne du nombre de chunks (k dynamique jusqu'à DYNAMIC_K_MAX si non spécifié)
+    max_docs = _max_retrieval_docs(num_docs)
 
     # Vérifier le cache si pas de force_rebuild
     cache = get_cache_manager()
     if not force_rebuild and cache.enabled:
-        cache_key = f"rag:answer:{hashlib.md5(question.encode()).hexdigest()}"
+        cache_key = _answer_cache_key(question, filters)
         cached_result = cache.get(cache_key)
         if cached_result:
             logger.debug(f"Cache hit pour question: {question[:50]}...")
@@ -196,59 +382,59 @@ def answer_question(
     vs_duration = (time.time() - vs_start) * 1000
     logger.debug(f"📦 Vector store chargé en {vs_duration:.2f}ms")
     
-    retriever_engine = RetrievalEngine(vector_store)
-
-    # Récupérer les documents pertinents AVANT de générer la réponse
-    retriever = retriever_engine.get_retriever()
-    # OPTIMISATION: Réduire le nombre de documents récupérés pour plus de rapidité (2 au lieu de 3)
-    if hasattr(retriever, "search_kwargs"):
-        retriever.search_kwargs["k"] = num_docs
-    else:
-        retriever = vector_store.as_retriever(search_kwargs={"k": num_docs})
+    # Moteur RAG en cache (retriever hybride BM25 + FAISS, prompt, chaîne et client LLM)
+    engine = _get_engine(vector_store, max_docs)
+
+    # Encodage + recherche vectorielle, puis cache sémantique (question proche déjà répondue)
+    mask = _retrieval_mask(vector_store, filters)
+    hits = engine.vector_hits(question, mask=mask)
+    if not force_rebuild:
+        cached = get_semantic_cache().lookup(
+            question, hits.query_vector, _vector_store_version, _semantic_namespace(filters, max_docs)
+        )
+        if cached is not None:
+            return cached[0]
 
-    retrieval_start = time.time()
-    retrieved_docs = retriever.invoke(question)
-    retrieval_duration = (time.time() - retrieval_start) * 1000  # ms
+    # Récupérer les documents pertinents (avec scores) AVANT de générer la réponse
+    retrieval = engine.retrieve(question, mask=mask, hits=hits)
+    chunks = retrieval.chunks
+    rerank_duration = retrieval.rerank_ms
+    retrieval_duration = retrieval.retrieval_ms
 
     # Monitor retrieval
-    if monitor and monitor.enabled:
-        sources_preview = []
-        for doc in retrieved_docs[:5]:
-            sources_preview.append(
-                {"document": doc.metadata.get("source_document", "Inconnu"), "preview": doc.page_content[:100]}
-            )
-        monitor.trace_retrieval(question, sources_preview)
+    _trace_scored_retrieval(monitor, question, chunks)
 
-    # Générer la réponse avec le RAG
-    rag_generator = RAGGenerator(retriever)
+    # Générer la réponse avec le RAG (petit modèle si la cascade classe la question comme simple)
     generation_start = time.time()
-    result = rag_generator.generate_answer(question)
+    generation_engine, decision = _cascade_engine(engine, question, retrieval)
+    answer = generation_engine.generate(question, retrieval, tier)
+    escalated = decision is not None and decision.tier == SMALL and CascadePolicy.needs_escalation(answer)
+    if escalated:
+        # Réponse évasive du petit modèle : régénérer avec le grand modèle
+        generation_engine = engine
+        answer = engine.generate(question, retrieval, tier)
     generation_duration = (time.time() - generation_start) * 1000  # ms
+    if decision is not None:
+        CascadePolicy.record(decision, generation_duration, escalated)
 
     # Extraire les sources réelles utilisées
-    sources = []
-    for doc in retrieved_docs:
-        source_info = {
-            "document": doc.metadata.get("source_document", "Inconnu"),
-            "path": doc.metadata.get("path", ""),
-            "page": doc.metadata.get("page", ""),
-            "preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-        }
-        sources.append(source_info)
+    sources = retrieval.sources
 
-    answer = result.get("answer", "")
     total_duration = (time.time() - start_time) * 1000  # ms
 
     # OPTIMISATION: Logging détaillé avec timing complet
     logger.info(
         f"⚡ RAG réponse générée en {total_duration:.2f}ms "
         f"(vector_store: {vs_duration:.2f}ms, retrieval: {retrieval_duration:.2f}ms, "
-        f"generation: {generation_duration:.2f}ms)"
+        f"rerank: {rerank_duration:.2f}ms, generation: {generation_duration:.2f}ms, "
+        f"contexte: {engine.pack_context(retrieval).tokens} tokens)"
     )
 
     # Monitor génération et pipeline complet
     if monitor and monitor.enabled:
-        monitor.trace_generation(question, answer, model=settings.llm_model_name, duration_ms=generation_duration)
+        monitor.trace_generation(
+            question, answer, model=generation_engine.model_name, duration_ms=generation_duration
+        )
 
         monitor.trace_rag_pipeline(
             query=question,
@@ -256,9 +442,11 @@ def answer_question(
             documents_used=sources,
             metadata={
                 "retrieval_duration_ms": retrieval_duration,
+                "rerank_duration_ms": rerank_duration,
                 "generation_duration_ms": generation_duration,
                 "total_duration_ms": total_duration,
                 "num_sources": len(sources),
+                "context_tokens": engine.pack_context(retrieval).tokens,
             },
         )
 
@@ -266,162 +454,507 @@ def answer_question(
         "answer": answer,
         "sources": sources,
         "num_sources": len(sources),
+        "context_tokens": engine.pack_context(retrieval).tokens,
     }
 
     # Mettre en cache le résultat
     cache = get_cache_manager()  # Récupérer le cache manager
     if cache.enabled and not force_rebuild:
-        cache_key = f"rag:answer:{hashlib.md5(question.encode()).hexdigest()}"
+        cache_key = _answer_cache_key(question, filters)
         cache.set(cache_key, result, ttl=3600)  # Cache 1h
         logger.debug(f"Résultat mis en cache: {cache_key}")
+    _semantic_cache_store(question, retrieval, result, filters, max_docs)
 
     return result
 
 
-def answer_question_stream(
-    question: str, force_rebuild: bool = False, num_docs: Optional[int] = None, streaming_delay: Optional[float] = None
-):
+def answer_questions(
+    questions: List[str],
+    force_rebuild: bool = False,
+    num_docs: Optional[int] = None,
+    filters: Optional[RetrievalFilters] = None,
+    max_concurrency: Optional[int] = None,
+    tier: Optional[str] = None,
+) -> dict:
     """
-    Version streaming optimisée de answer_question qui génère la réponse token par token.
-    Yields chaque token au fur et à mesure pour permettre à l'utilisateur de suivre le raisonnement.
+    Version batch de answer_question (évaluation offline, validation du pipeline).
+
+    Toutes les questions sont encodées en un seul batch et recherchées en une seule
+    recherche matricielle FAISS ; les chunks partagés ne sont récupérés qu'une fois,
+    puis les générations tournent avec une concurrence bornée.
 
     Args:
-        question: La question à poser
+        questions: Liste des questions
         force_rebuild: Forcer la reconstruction du vector store
-        num_docs: Nombre de documents à récupérer (None = utiliser la valeur de la config, défaut optimisé: 2)
-        streaming_delay: Délai entre les tokens (None = utiliser la valeur optimisée)
+        num_docs: Nombre maximal de documents par question (None = k dynamique de la config)
+        filters: Filtres de métadonnées appliqués à toutes les questions
+        max_concurrency: Générations simultanées (None = BATCH_GENERATION_CONCURRENCY)
+        tier: Tier d'admission de chaque génération (None = sans admission)
+
+    Returns:
+        dict avec 'results' (un résultat par question, dans l'ordre), 'timings' (ms, par étape)
+        et 'num_unique_chunks' (chunks distincts après déduplication). Une génération en échec
+        ne fait pas échouer le batch : son résultat porte une clé 'error' (réponse vide).
+
+    Raises:
+        AdmissionRejected: Génération refusée par le contrôle d'admission (le batch entier
+            est refusé et les générations pas encore lancées sont annulées)
     """
-    start_time = time.time()  # OPTIMISATION: Timing pour le streaming
-    from langchain_core.prompts import ChatPromptTemplate
+    max_docs = _max_retrieval_docs(num_docs)
+    if max_concurrency is None:
+        max_concurrency = settings.batch_generation_concurrency
 
-    # Utiliser la valeur de la config si non spécifiée
-    if num_docs is None:
-        num_docs = settings.num_retrieval_docs
+    start_time = time.time()
+    timings = {}
+    results: List[Optional[dict]] = [None] * len(questions)
+    num_unique_chunks = 0
 
-    # OPTIMISATION: Utiliser un délai de streaming réduit (0ms pour plus de rapidité)
-    if streaming_delay is None:
-        streaming_delay = 0.0  # OPTIMISATION: Pas de délai pour plus de rapidité
+    # Réponses calculées sans LLM, puis réponses déjà en cache
+    cache = get_cache_manager()
+    pending = []
+    for i, question in enumerate(questions):
+        calculated = _calculated_answer(question)
+        if calculated is not None:
+            results[i] = {"question": question, **calculated, "cached": False}
+            continue
+        cached_result = cache.get(_answer_cache_key(question, filters)) if cache.enabled and not force_rebuild else None
+        if cached_result:
+            results[i] = {"question": question, **cached_result, "cached": True}
+        else:
+            pending.append(i)
+
+    if pending:
+        vs_start = time.time()
+        vector_store = _load_or_build_vector_store(force_rebuild=force_rebuild)
+        engine = _get_engine(vector_store, max_docs)
+        timings["vector_store_ms"] = (time.time() - vs_start) * 1000
+
+        # Un seul encodage batch + une seule recherche matricielle
+        pending_questions = [questions[i] for i in pending]
+        retrieval_start = time.time()
+        retrievals = engine.retrieve_batch(
+            pending_questions, mask=_retrieval_mask(vector_store, filters), timings=timings
+        )
+        timings["rerank_ms"] = sum(retrieval.rerank_ms for retrieval in retrievals)
+        retrieval_ms = (time.time() - retrieval_start) * 1000
+        timings["fusion_ms"] = retrieval_ms - timings["embedding_ms"] - timings["search_ms"] - timings["rerank_ms"]
+        # Déduplication des chunks partagés entre questions
+        unique_positions = {chunk.position for retrieval in retrievals for chunk in retrieval.chunks}
+
+        def generate(question: str, retrieval: RetrievalResult) -> Tuple[str, Optional[str]]:
+            try:
+                return engine.generate(question, retrieval, tier), None
+            except AdmissionRejected:
+                # Surcharge : refus du batch entier (429/503), pas une erreur par question
+                raise
+            except Exception as e:
+                logger.warning(f"Génération en échec dans le batch pour « {question[:50]} »: {e}")
+                return "", str(e)
+
+        generation_start = time.time()
+        executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+        try:
+            answers = list(executor.map(generate, pending_questions, retrievals))
+        finally:
+            # Après un refus d'admission, les générations pas encore lancées ne le sont pas
+            executor.shutdown(wait=True, cancel_futures=True)
+        timings["generation_ms"] = (time.time() - generation_start) * 1000
+
+        for i, (answer, error), retrieval in zip(pending, answers, retrievals):
+            if error is not None:
+                results[i] = {
+                    "question": questions[i],
+                    "answer": "",
+                    "sources": [],
+                    "num_sources": 0,
+                    "cached": False,
+                    "error": error,
+                }
+                continue
+            sources = retrieval.sources
+            result = {
+                "answer": answer,
+                "sources": sources,
+                "num_sources": len(sources),
+                "context_tokens": engine.pack_context(retrieval).tokens,
+            }
+            if cache.enabled and not force_rebuild:
+                cache.set(_answer_cache_key(questions[i], filters), result, ttl=3600)
+            results[i] = {"question": questions[i], **result, "cached": False}
+        num_unique_chunks = len(unique_positions)
+
+    timings["total_ms"] = (time.time() - start_time) * 1000
+    logger.info(
+        f"⚡ Batch RAG de {len(questions)} questions en {timings['total_ms']:.2f}ms "
+        f"({len(questions) - len(pending)} depuis le cache)"
+    )
+
+    return {
+        "results": results,
+        "timings": timings,
+        "num_questions": len(questions),
+        "num_unique_chunks": num_unique_chunks,
+        "num_errors": sum(1 for result in results if "error" in result),
+    }
+
+
+def _prepare_stream(
+    question: str, force_rebuild: bool, max_docs: int, filters: Optional[RetrievalFilters]
+) -> Tuple[RAGEngine, Optional[RetrievalResult], float, Optional[dict]]:
+    """
+    Partie CPU du streaming : chargement du vector store, moteur RAG, cache sémantique et retrieval.
 
+    Returns:
+        (moteur, résultat du retrieval, durée de chargement du vector store en ms, réponse en cache).
+        Si une question proche a déjà été répondue, le retrieval est None et la réponse en cache est renvoyée.
+    """
     vs_start = time.time()
     vector_store = _load_or_build_vector_store(force_rebuild=force_rebuild)
     vs_duration = (time.time() - vs_start) * 1000
     logger.debug(f"📦 Vector store chargé en {vs_duration:.2f}ms")
-    
-    retriever_engine = RetrievalEngine(vector_store)
 
-    # Récupérer les documents pertinents AVANT de générer la réponse
-    retriever = retriever_engine.get_retriever()
-    # OPTIMISATION: Réduire le nombre de documents pour plus de rapidité (2 par défaut)
-    if hasattr(retriever, "search_kwargs"):
-        retriever.search_kwargs["k"] = num_docs
-    else:
-        retriever = vector_store.as_retriever(search_kwargs={"k": num_docs})
-
-    retrieval_start = time.time()
-    retrieved_docs = retriever.invoke(question)
-    retrieval_duration = (time.time() - retrieval_start) * 1000
-    logger.debug(f"🔍 Recherche vectorielle en {retrieval_duration:.2f}ms")
-
-    # Préparer les sources
-    sources = []
-    for doc in retrieved_docs:
-        source_info = {
-            "document": doc.metadata.get("source_document", "Inconnu"),
-            "path": doc.metadata.get("path", ""),
-            "page": doc.metadata.get("page", ""),
-            "preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-        }
-        sources.append(source_info)
-
-    # OPTIMISATION: Tronquer intelligemment le contexte pour réduire la latence
-    max_context_chars = getattr(settings, 'max_context_length', 1500)
-    context_parts = []
-    current_length = 0
-    for doc in retrieved_docs:
-        content = doc.page_content[:500]  # Limiter chaque doc à 500 caractères
-        if current_length + len(content) <= max_context_chars:
-            context_parts.append(content)
-            current_length += len(content)
-        else:
-            # Ajouter le reste jusqu'à la limite
-            remaining = max_context_chars - current_length
-            if remaining > 100:  # Ne pas ajouter de trop petits fragments
-                context_parts.append(content[:remaining])
-            break
-    context = "\n\n".join(context_parts)
+    # Moteur RAG en cache : prompt compilé et client LLM réutilisés d'une requête à l'autre
+    engine = _get_engine(vector_store, max_docs)
+
+    mask = _retrieval_mask(vector_store, filters)
+    hits = engine.vector_hits(question, mask=mask)
+    if not force_rebuild:
+        cached = get_semantic_cache().lookup(
+            question, hits.query_vector, _vector_store_version, _semantic_namespace(filters, max_docs)
+        )
+        if cached is not None:
+            return engine, None, vs_duration, cached[0]
+
+    # Un seul retrieval (avec scores), partagé par le streaming et son fallback
+    retrieval = engine.retrieve(question, mask=mask, hits=hits)
+    logger.debug(
+        f"🔍 Recherche en {retrieval.retrieval_ms:.2f}ms, rerank en {retrieval.rerank_ms:.2f}ms "
+        f"({len(retrieval.chunks)} chunks retenus)"
+    )
+    _trace_scored_retrieval(get_phoenix_monitor(), question, retrieval.chunks)
+    return engine, retrieval, vs_duration, None
+
+
+class _StreamTimings:
+    """
+    Jalons d'une réponse en streaming, en ms depuis la réception de la question :
+    sources prêtes (retrieval terminé), premier token, dernier token. La latence
+    perçue (sources, premier token) est suivie séparément de la latence totale.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.marks: dict = {}
+
+    def mark(self, name: str) -> None:
+        # Seul le premier passage compte (premier token)
+        self.marks.setdefault(name, (time.perf_counter() - self.start) * 1000)
+
+    def record(self, cached: bool) -> dict:
+        metrics = get_metrics_collector()
+        tags = {"cached": str(cached).lower()}
+        for name, value in self.marks.items():
+            metrics.record_histogram(f"rag.stream.{name}_ms", value, tags=tags)
+        return {name: round(value, 2) for name, value in self.marks.items()}
+
+
+def _answer_question_stream(
+    question: str,
+    force_rebuild: bool = False,
+    num_docs: Optional[int] = None,
+    streaming_delay: Optional[float] = None,
+    filters: Optional[RetrievalFilters] = None,
+    tier: Optional[str] = None,
+):
+    """
+    Version streaming optimisée de answer_question qui génère la réponse token par token.
+    Yields chaque token au fur et à mesure pour permettre à l'utilisateur de suivre le raisonnement.
+
+    Format du flux : `{"early_sources": [...]}` dès la fin du retrieval, puis les tokens (str),
+    puis `{"sources", "full_answer", "context_tokens", "timings"}` à la fin.
 
-    # OPTIMISATION: Prompt plus court et concis
-    system_prompt = """Expert photo. Réponds en français avec conseils concrets et réglages (ISO, ouverture, vitesse).
-Contexte peut contenir des erreurs OCR. Cite les sources. Si info manquante, dis-le.
+    Args:
+        question: La question à poser
+        force_rebuild: Forcer la reconstruction du vector store
+        num_docs: Nombre maximal de documents à récupérer (None = k dynamique borné par DYNAMIC_K_MAX)
+        streaming_delay: Délai entre les tokens (None = utiliser la valeur optimisée)
+        filters: Filtres de métadonnées appliqués dans la recherche
+        tier: Tier d'admission (place de génération prise pour le LLM qui génère ; None = sans admission)
+    """
+    start_time = time.time()  # OPTIMISATION: Timing pour le streaming
+    timings = _StreamTimings()
 
-Contexte: {context}"""
-    prompt = ChatPromptTemplate.from_messages([("system", system_prompt), ("human", "{input}")])
+    # OPTIMISATION: Utiliser un délai de streaming réduit (0ms pour plus de rapidité)
+    if streaming_delay is None:
+        streaming_delay = 0.0  # OPTIMISATION: Pas de délai pour plus de rapidité
 
-    # Formater le prompt avec le contexte et la question
-    formatted_prompt = prompt.format_messages(context=context, input=question)
+    # Borne du nombre de chunks (k dynamique jusqu'à DYNAMIC_K_MAX si non spécifié)
+    max_docs = _max_retrieval_docs(num_docs)
+    engine, retrieval, vs_duration, cached = _prepare_stream(question, force_rebuild, max_docs, filters)
+    if cached is not None:
+        yield from _cached_stream(cached, timings)
+        return
 
-    # OPTIMISATION: Utiliser le gestionnaire LLM pour obtenir le LLM configuré (Ollama, OpenAI, etc.)
-    llm_manager = get_llm_manager()
-    llm = llm_manager.get_llm()  # Utilise le LLM par défaut
+    # Sources envoyées dès la fin du retrieval, avant le premier token
+    timings.mark("sources")
+    yield {"early_sources": retrieval.sources}
 
     full_answer = ""
+    generation_engine, decision = _cascade_engine(engine, question, retrieval)
+    generation_start = time.perf_counter()
+    escalated = False
 
     try:
         # Streamer directement depuis le LLM pour avoir les tokens un par un
-        # Le streaming retourne des chunks (peut contenir un ou plusieurs tokens)
-        for chunk in llm.stream(formatted_prompt):
-            # Extraire le contenu du chunk
-            token = None
-
-            if hasattr(chunk, "content"):
-                # AIMessageChunk ou similaire
-                token = chunk.content
-            elif hasattr(chunk, "text"):
-                # Chunk avec attribut text
-                token = chunk.text
-            elif isinstance(chunk, str):
-                # Chunk est directement une string
-                token = chunk
-            elif isinstance(chunk, dict):
-                # Chunk est un dictionnaire
-                token = chunk.get("content", chunk.get("text", chunk.get("token", "")))
-            else:
-                # Essayer de convertir en string
-                token = str(chunk) if chunk else ""
-
-            if token:
-                full_answer += token
-                yield token
-                # OPTIMISATION: Délai réduit pour plus de rapidité et fluidité
-                if streaming_delay > 0:
-                    time.sleep(streaming_delay)
+        for token in generation_engine.stream(question, retrieval, tier):
+            timings.mark("first_token")
+            full_answer += token
+            yield token
+            # OPTIMISATION: Délai réduit pour plus de rapidité et fluidité
+            if streaming_delay > 0:
+                time.sleep(streaming_delay)
 
     except Exception as e:
+        if full_answer:
+            # Des tokens ont déjà été envoyés : ne pas les renvoyer une seconde fois
+            raise RuntimeError(f"Erreur lors de la génération: {str(e)}") from e
         # Si le streaming échoue, générer la réponse normalement et la streamer caractère par caractère
         print(f"Streaming direct échoué, utilisation du fallback: {e}")
         import traceback
 
         traceback.print_exc()
         try:
-            # Fallback : générer la réponse complète puis la streamer
-            rag_generator = RAGGenerator(retriever)
-            result = rag_generator.generate_answer(question)
-            full_answer = result.get("answer", "")
-
-            # Streamer caractère par caractère pour simuler le streaming
-            for char in full_answer:
-                yield char
-                if streaming_delay > 0:
+            # Fallback : générer la réponse complète (même retrieval, grand modèle) puis la streamer
+            escalated = generation_engine is not engine
+            full_answer = engine.generate(question, retrieval, tier)
+
+            timings.mark("first_token")
+
+            # Sans délai demandé : la réponse part en un seul morceau (une trame SSE)
+            if streaming_delay <= 0:
+                yield full_answer
+            # Sinon streamer caractère par caractère pour simuler le streaming
+            else:
+                for char in full_answer:
+                    yield char
                     time.sleep(streaming_delay)
         except Exception as e2:
             raise RuntimeError(f"Erreur lors de la génération: {str(e2)}") from e2
 
+    timings.mark("last_token")
+    if decision is not None:
+        CascadePolicy.record(decision, (time.perf_counter() - generation_start) * 1000, escalated)
+
     # OPTIMISATION: Logging du temps total de streaming
     total_duration = (time.time() - start_time) * 1000
     logger.info(
         f"⚡ Streaming RAG terminé en {total_duration:.2f}ms "
-        f"(vector_store: {vs_duration:.2f}ms, retrieval: {retrieval_duration:.2f}ms)"
+        f"(vector_store: {vs_duration:.2f}ms, retrieval: {retrieval.retrieval_ms:.2f}ms, "
+        f"rerank: {retrieval.rerank_ms:.2f}ms, sources: {timings.marks['sources']:.2f}ms, "
+        f"premier token: {timings.marks.get('first_token', 0):.2f}ms, "
+        f"contexte: {engine.pack_context(retrieval).tokens} tokens)"
     )
-    
+
+    sources = retrieval.sources
+    result = {
+        "answer": full_answer,
+        "sources": sources,
+        "num_sources": len(sources),
+        "context_tokens": engine.pack_context(retrieval).tokens,
+    }
+    _semantic_cache_store(question, retrieval, result, filters, max_docs)
+
     # Retourner les sources à la fin
-    yield {"sources": sources, "full_answer": full_answer}
+    yield {
+        "sources": sources,
+        "full_answer": full_answer,
+        "context_tokens": result["context_tokens"],
+        "timings": timings.record(cached=False),
+    }
+
+
+def _cached_stream(cached: dict, timings: _StreamTimings):
+    """Réponse en cache au format du streaming (sources d'abord, puis la réponse en un morceau)."""
+    timings.mark("sources")
+    yield {"early_sources": cached["sources"]}
+    timings.mark("first_token")
+    yield cached["answer"]
+    timings.mark("last_token")
+    yield {"sources": cached["sources"], "full_answer": cached["answer"], "timings": timings.record(cached=True)}
+
+
+def _calculated_stream(result: dict):
+    """Réponse calculée au format du streaming (aucune source, réponse en un morceau)."""
+    yield {"early_sources": []}
+    yield result["answer"]
+    yield {"sources": [], "full_answer": result["answer"], "context_tokens": 0, "fast_path": result["fast_path"]}
+
+
+async def _acalculated_stream(result: dict):
+    for item in _calculated_stream(result):
+        yield item
+
+
+async def _answer_question_stream_async(
+    question: str,
+    force_rebuild: bool = False,
+    num_docs: Optional[int] = None,
+    streaming_delay: Optional[float] = None,
+    filters: Optional[RetrievalFilters] = None,
+    tier: Optional[str] = None,
+):
+    """
+    Version asynchrone de `answer_question_stream`, pour les endpoints FastAPI.
+
+    Le chargement du vector store, l'encodage et la recherche FAISS (CPU, bloquants)
+    s'exécutent dans un thread ; les tokens sont lus via `astream` du LLM. La boucle
+    d'événements n'est jamais bloquée pendant la génération.
+
+    Mêmes arguments et même format de sortie que `answer_question_stream`.
+    """
+    start_time = time.time()
+    timings = _StreamTimings()
+    if streaming_delay is None:
+        streaming_delay = 0.0
+
+    max_docs = _max_retrieval_docs(num_docs)
+    engine, retrieval, vs_duration, cached = await asyncio.to_thread(
+        _prepare_stream, question, force_rebuild, max_docs, filters
+    )
+    if cached is not None:
+        for item in _cached_stream(cached, timings):
+            yield item
+        return
+
+    timings.mark("sources")
+    yield {"early_sources": retrieval.sources}
+
+    full_answer = ""
+    generation_engine, decision = _cascade_engine(engine, question, retrieval)
+    generation_start = time.perf_counter()
+    escalated = False
+    try:
+        async for token in generation_engine.astream(question, retrieval, tier):
+            timings.mark("first_token")
+            full_answer += token
+            yield token
+            if streaming_delay > 0:
+                await asyncio.sleep(streaming_delay)
+    except Exception as e:
+        if full_answer:
+            # Des tokens ont déjà été envoyés : ne pas les renvoyer une seconde fois
+            raise RuntimeError(f"Erreur lors de la génération: {str(e)}") from e
+        logger.warning(f"Streaming asynchrone échoué, utilisation du fallback: {e}", exc_info=True)
+        try:
+            # Grand modèle (escalade si le petit modèle de la cascade a échoué)
+            escalated = generation_engine is not engine
+            full_answer = await engine.agenerate(question, retrieval, tier)
+            timings.mark("first_token")
+            if streaming_delay <= 0:
+                yield full_answer
+            else:
+                for char in full_answer:
+                    yield char
+                    await asyncio.sleep(streaming_delay)
+        except Exception as e2:
+            raise RuntimeError(f"Erreur lors de la génération: {str(e2)}") from e2
+
+    timings.mark("last_token")
+    if decision is not None:
+        CascadePolicy.record(decision, (time.perf_counter() - generation_start) * 1000, escalated)
+    total_duration = (time.time() - start_time) * 1000
+    logger.info(
+        f"⚡ Streaming RAG (async) terminé en {total_duration:.2f}ms "
+        f"(vector_store: {vs_duration:.2f}ms, retrieval: {retrieval.retrieval_ms:.2f}ms, "
+        f"rerank: {retrieval.rerank_ms:.2f}ms, sources: {timings.marks['sources']:.2f}ms, "
+        f"premier token: {timings.marks.get('first_token', 0):.2f}ms, "
+        f"contexte: {engine.pack_context(retrieval).tokens} tokens)"
+    )
+
+    sources = retrieval.sources
+    result = {
+        "answer": full_answer,
+        "sources": sources,
+        "num_sources": len(sources),
+        "context_tokens": engine.pack_context(retrieval).tokens,
+    }
+    _semantic_cache_store(question, retrieval, result, filters, max_docs)
+    yield {
+        "sources": sources,
+        "full_answer": full_answer,
+        "context_tokens": result["context_tokens"],
+        "timings": timings.record(cached=False),
+    }
+
+
+# ---------- Coalescence des questions identiques en cours ----------
+
+
+def answer_question(
+    question: str,
+    show_sources: bool = True,
+    force_rebuild: bool = False,
+    num_docs: Optional[int] = None,
+    filters: Optional[RetrievalFilters] = None,
+    tier: Optional[str] = None,
+) -> dict:
+    """
+    Répond à une question (voir `_answer_question`). Les questions de calcul d'exposition
+    sont répondues par le calculateur, sans retrieval ni LLM. Les appels concurrents pour
+    la même question normalisée partagent une seule génération (et une seule place d'admission).
+    """
+    calculated = _calculated_answer(question)
+    if calculated is not None:
+        return calculated
+    if force_rebuild or not settings.single_flight_enabled:
+        return _answer_question(question, show_sources, force_rebuild, num_docs, filters, tier)
+    return get_single_flight().do(
+        _flight_key(question, num_docs, filters),
+        lambda: _answer_question(question, show_sources, force_rebuild, num_docs, filters, tier),
+    )
+
+
+def answer_question_stream(
+    question: str,
+    force_rebuild: bool = False,
+    num_docs: Optional[int] = None,
+    streaming_delay: Optional[float] = None,
+    filters: Optional[RetrievalFilters] = None,
+    tier: Optional[str] = None,
+):
+    """
+    Répond en streaming (voir `_answer_question_stream`). Les requêtes concurrentes pour
+    la même question s'abonnent à une seule génération et reçoivent le flux depuis le début.
+    """
+    calculated = _calculated_answer(question)
+    if calculated is not None:
+        return _calculated_stream(calculated)
+    if force_rebuild or not settings.single_flight_enabled:
+        return _answer_question_stream(question, force_rebuild, num_docs, streaming_delay, filters, tier)
+    return get_single_flight().stream(
+        ("stream", *_flight_key(question, num_docs, filters)),
+        lambda: _answer_question_stream(question, force_rebuild, num_docs, streaming_delay, filters, tier),
+    )
+
+
+def answer_question_stream_async(
+    question: str,
+    force_rebuild: bool = False,
+    num_docs: Optional[int] = None,
+    streaming_delay: Optional[float] = None,
+    filters: Optional[RetrievalFilters] = None,
+    tier: Optional[str] = None,
+):
+    """
+    Version asynchrone de `answer_question_stream` (voir `_answer_question_stream_async`),
+    avec la même coalescence et la même voie rapide de calcul. À appeler depuis la boucle d'événements.
+    """
+    calculated = _calculated_answer(question)
+    if calculated is not None:
+        return _acalculated_stream(calculated)
+    if force_rebuild or not settings.single_flight_enabled:
+        return _answer_question_stream_async(question, force_rebuild, num_docs, streaming_delay, filters, tier)
+    return get_single_flight().astream(
+        ("stream", *_flight_key(question, num_docs, filters)),
+        lambda: _answer_question_stream_async(question, force_rebuild, num_docs, streaming_delay, filters, tier),
+    )
@@ -0,0 +1,141 @@
+"""
+Reranking des candidats par cross-encoder (CPU).
+
+Un petit cross-encoder évalue les N meilleurs candidats en un seul passage
+batché ; les scores sont mis en cache par (hash de la question, id du chunk)
+pour que les questions répétées ne repassent pas par le modèle.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+from .config import settings
+from .hybrid_retrieval import ScoredChunk
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+# Tentative d'import du cross-encoder
+try:
+    from sentence_transformers import CrossEncoder
+
+    CROSS_ENCODER_AVAILABLE = True
+except ImportError:
+    CROSS_ENCODER_AVAILABLE = False
+    logger.warning("sentence-transformers non installé. Le reranking sera désactivé.")
+
+
+class CrossEncoderReranker:
+    """Reranker cross-encoder avec cache LRU borné et prédiction batchée."""
+
+    def __init__(
+        self,
+        model_name: str,
+        enabled: bool = True,
+        cache_size: int = 4096,
+        batch_size: int = 16,
+        max_length: int = 512,
+    ):
+        """
+        Args:
+            model_name: Modèle cross-encoder (HuggingFace)
+            enabled: Activer le reranking
+            cache_size: Nombre maximal de scores (question, chunk) en cache
+            batch_size: Taille des batchs de prédiction
+            max_length: Longueur maximale (tokens) d'une paire question/chunk
+        """
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.enabled = enabled and CROSS_ENCODER_AVAILABLE
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        if enabled and not CROSS_ENCODER_AVAILABLE:
+            logger.warning("Cross-encoder non disponible. Reranking désactivé.")
+
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    start = time.time()
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+                    logger.info(f"✅ Cross-encoder {self.model_name} chargé en {time.time() - start:.2f}s")
+        return self._model
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _cache_set(self, key: Tuple[str, str], score: float) -> None:
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def score(self, question: str, chunks: Sequence[ScoredChunk]) -> List[float]:
+        """
+        Score de pertinence (0-1) de chaque chunk pour la question.
+        Les paires absentes du cache sont évaluées en un seul appel `predict`.
+        """
+        question_hash = hashlib.md5(question.encode()).hexdigest()
+        keys = [(question_hash, chunk.chunk_id) for chunk in chunks]
+        scores = [self._cache_get(key) for key in keys]
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        metrics = get_metrics_collector()
+        metrics.increment("retrieval.rerank_cache_hits", len(chunks) - len(missing))
+        if missing:
+            pairs = [(question, chunks[i].document.page_content) for i in missing]
+            predictions = self._get_model().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            for i, prediction in zip(missing, predictions):
+                scores[i] = float(prediction)
+                self._cache_set(keys[i], scores[i])
+        return scores
+
+    def rerank(self, question: str, chunks: Sequence[ScoredChunk]) -> List[ScoredChunk]:
+        """
+        Renseigne `rerank_score` sur chaque chunk et les trie par score décroissant.
+        La latence est enregistrée séparément (`retrieval.rerank_latency`).
+        """
+        if not self.enabled or not chunks:
+            return list(chunks)
+
+        start = time.perf_counter()
+        for chunk, score in zip(chunks, self.score(question, chunks)):
+            chunk.rerank_score = score
+        get_metrics_collector().record_timer("retrieval.rerank_latency", time.perf_counter() - start)
+        return sorted(chunks, key=lambda chunk: chunk.rerank_score, reverse=True)
+
+    def clear_cache(self) -> None:
+        """Vide le cache des scores (ex: après reconstruction du vector store)."""
+        with self._cache_lock:
+            self._cache.clear()
+
+
+# Instance globale
+_reranker: Optional[CrossEncoderReranker] = None
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """Récupère l'instance globale du reranker."""
+    global _reranker
+    if _reranker is None:
+        _reranker = CrossEncoderReranker(
+            model_name=settings.rerank_model_name,
+            enabled=settings.rerank_enabled,
+            cache_size=settings.rerank_cache_size,
+            batch_size=settings.rerank_batch_size,
+        )
+    return _reranker
@@ -0,0 +1,229 @@
+"""
+Cache sémantique des réponses : plus proche voisin parmi les questions déjà traitées.
+
+Le cache Redis est indexé par `md5(question)` : deux formulations d'une même
+question (« c'est quoi l'ISO ? » / « qu'est-ce que l'ISO ? ») passent toutes deux
+par le LLM. Ici on garde l'embedding des questions répondues ; au-dessus d'un
+seuil de similarité cosinus, la réponse et les sources en cache sont renvoyées.
+
+Les entrées sont rangées par espace de noms (version de l'index, filtres, k) :
+un rechargement du vector store invalide tout le cache. L'embedding de la
+question est celui du retrieval (pas d'encodage supplémentaire).
+
+Pour régler le seuil : taux de hit, distribution des similarités (histogramme
+`semantic_cache.similarity`) et échantillons de hits / quasi-hits à relire.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Namespace:
+    """Questions en cache d'un espace de noms : matrice d'embeddings normalisés + résultats."""
+
+    vectors: np.ndarray
+    questions: List[str] = field(default_factory=list)
+    results: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: List[float] = field(default_factory=list)
+
+
+class SemanticCache:
+    """Cache de réponses par similarité des questions (recherche exacte sur une petite matrice)."""
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        max_entries: int = 2048,
+        ttl: float = 3600.0,
+        sample_rate: float = 0.05,
+        max_samples: int = 100,
+        enabled: bool = True,
+    ):
+        """
+        Args:
+            threshold: Similarité cosinus minimale pour réutiliser une réponse
+            max_entries: Nombre maximal de questions en cache (toutes versions confondues)
+            ttl: Durée de vie d'une entrée en secondes
+            sample_rate: Proportion des hits (et quasi-hits) échantillonnés pour relecture
+            max_samples: Nombre d'échantillons conservés
+            enabled: Activer le cache
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.samples: deque = deque(maxlen=max_samples)
+        self._version: Optional[Hashable] = None
+        self._namespaces: "OrderedDict[Hashable, _Namespace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _size(self) -> int:
+        return sum(len(namespace.questions) for namespace in self._namespaces.values())
+
+    def _check_version(self, version: Hashable) -> None:
+        # Nouvelle version de l'index : les réponses en cache peuvent citer des chunks disparus
+        if version != self._version:
+            if self._namespaces:
+                logger.info(f"🧠 Cache sémantique invalidé (version de l'index: {version})")
+            self._namespaces.clear()
+            self._version = version
+
+    def _sample(self, kind: str, question: str, cached_question: str, similarity: float) -> None:
+        if random.random() < self.sample_rate:
+            self.samples.append(
+                {
+                    "kind": kind,
+                    "question": question,
+                    "cached_question": cached_question,
+                    "similarity": round(similarity, 4),
+                    "timestamp": time.time(),
+                }
+            )
+
+    def lookup(
+        self, question: str, vector: np.ndarray, version: Hashable, namespace: Hashable = None
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Cherche une question similaire déjà répondue.
+
+        Args:
+            question: Question posée (pour les échantillons)
+            vector: Embedding de la question
+            version: Version de l'index (les entrées d'une autre version sont invalidées)
+            namespace: Contexte de la réponse (filtres, k...)
+
+        Returns:
+            (résultat en cache, similarité) ou None
+        """
+        if not self.enabled:
+            return None
+        metrics = get_metrics_collector()
+        query = self._normalize(vector)
+
+        with self._lock:
+            self._check_version(version)
+            entries = self._namespaces.get(namespace)
+            best, similarity = -1, 0.0
+            if entries is not None and entries.questions:
+                similarities = entries.vectors @ query
+                best = int(np.argmax(similarities))
+                similarity = float(similarities[best])
+                if time.time() - entries.created_at[best] > self.ttl:
+                    best = -1
+
+            if best >= 0:
+                metrics.record_histogram("semantic_cache.similarity", similarity)
+            if best >= 0 and similarity >= self.threshold:
+                self.hits += 1
+                self._namespaces.move_to_end(namespace)
+                self._sample("hit", question, entries.questions[best], similarity)
+                result = entries.results[best]
+            else:
+                self.misses += 1
+                # Quasi-hit : candidat juste sous le seuil, utile pour savoir si on peut l'abaisser
+                if best >= 0 and similarity >= self.threshold - 0.05:
+                    self._sample("near_miss", question, entries.questions[best], similarity)
+                result = None
+
+        metrics.increment("semantic_cache.hits" if result is not None else "semantic_cache.misses")
+        if result is None:
+            return None
+        logger.debug(f"🧠 Cache sémantique: hit (similarité {similarity:.3f}) pour {question[:50]}...")
+        return result, similarity
+
+    def store(
+        self, question: str, vector: np.ndarray, result: Dict[str, Any], version: Hashable, namespace: Hashable = None
+    ) -> None:
+        """Ajoute une question répondue au cache."""
+        if not self.enabled:
+            return
+        query = self._normalize(vector)
+        now = time.time()
+
+        with self._lock:
+            self._check_version(version)
+            entries = self._namespaces.get(namespace)
+            if entries is None:
+                entries = self._namespaces[namespace] = _Namespace(vectors=np.empty((0, len(query)), dtype=np.float32))
+            self._namespaces.move_to_end(namespace)
+
+            # Purge des entrées expirées de cet espace de noms
+            fresh = [i for i, created in enumerate(entries.created_at) if now - created <= self.ttl]
+            if len(fresh) < len(entries.created_at):
+                entries.vectors = entries.vectors[fresh]
+                entries.questions = [entries.questions[i] for i in fresh]
+                entries.results = [entries.results[i] for i in fresh]
+                entries.created_at = [entries.created_at[i] for i in fresh]
+
+            entries.vectors = np.vstack([entries.vectors, query[None, :]])
+            entries.questions.append(question)
+            entries.results.append(result)
+            entries.created_at.append(now)
+
+            # Éviction : les plus anciennes entrées de l'espace de noms le moins récemment utilisé
+            while self._size() > self.max_entries:
+                oldest_name, oldest = next(iter(self._namespaces.items()))
+                if len(oldest.questions) <= 1:
+                    del self._namespaces[oldest_name]
+                    continue
+                oldest.vectors = oldest.vectors[1:]
+                del oldest.questions[0], oldest.results[0], oldest.created_at[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._namespaces.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Taux de hit, distribution des similarités et échantillons pour régler le seuil."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "entries": self._size(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "similarity": get_metrics_collector().get_histogram_stats("semantic_cache.similarity"),
+                "samples": list(self.samples),
+            }
+
+
+# Instance globale
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Récupère l'instance globale du cache sémantique."""
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(
+            threshold=settings.semantic_cache_threshold,
+            max_entries=settings.semantic_cache_max_entries,
+            ttl=settings.semantic_cache_ttl,
+            sample_rate=settings.semantic_cache_sample_rate,
+            enabled=settings.semantic_cache_enabled,
+        )
+    return _semantic_cache
@@ -0,0 +1,238 @@
+"""
+Index vectoriel shardé par collection de documents (cours, manuels, magazines...).
+
+Chaque shard est un vector store FAISS indépendant, sauvegardé et reconstruit
+séparément. `ShardedVectorStore` les expose comme un seul vector store avec des
+positions globales (décalage par shard), ce qui permet de réutiliser tel quel le
+retrieval hybride, les filtres de métadonnées et le micro-batching. La recherche
+est distribuée sur les shards dans des threads (FAISS libère le GIL) puis les
+top-k sont fusionnés par distance.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from .config import settings
+from .vector_search import search_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "general"
+
+_shard_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_shard_executor() -> ThreadPoolExecutor:
+    """Pool de threads partagé pour la recherche distribuée sur les shards."""
+    global _shard_executor
+    if _shard_executor is None:
+        _shard_executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.shard_search_workers), thread_name_prefix="shard-search"
+        )
+    return _shard_executor
+
+
+class ShardedIndex:
+    """
+    Sous-ensemble de l'API `faiss.Index` (`ntotal`, `d`, `search`, `reconstruct_batch`)
+    au-dessus de plusieurs index FAISS, avec des positions globales.
+    """
+
+    is_sharded = True
+
+    def __init__(self, indexes: List, executor: Optional[ThreadPoolExecutor] = None):
+        if not indexes:
+            raise ValueError("Un index shardé nécessite au moins un shard")
+        import faiss
+
+        self.indexes = list(indexes)
+        self.executor = executor
+        self.offsets = np.cumsum([0] + [index.ntotal for index in self.indexes])
+        self.d = self.indexes[0].d
+        self.metric_type = self.indexes[0].metric_type
+        self._higher_is_better = self.metric_type == faiss.METRIC_INNER_PRODUCT
+
+    @property
+    def ntotal(self) -> int:
+        return int(self.offsets[-1])
+
+    def _search_shard(
+        self, shard: int, query_vectors: np.ndarray, k: int, mask: Optional[np.ndarray]
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        start, end = int(self.offsets[shard]), int(self.offsets[shard + 1])
+        local_mask = None if mask is None else mask[start:end]
+        if end == start or (local_mask is not None and not local_mask.any()):
+            return None
+        distances, positions = search_index(self.indexes[shard], query_vectors, min(k, end - start), local_mask)
+        return distances, np.where(positions >= 0, positions + start, -1)
+
+    def search(self, query_vectors: np.ndarray, k: int, params=None, mask: Optional[np.ndarray] = None):
+        """
+        Recherche dans tous les shards en parallèle puis fusion des top-k par distance.
+
+        Args:
+            query_vectors: Matrice des requêtes (n_queries, d)
+            k: Nombre de voisins par requête
+            params: Non supporté (les filtres passent par `mask`, en positions globales)
+            mask: Masque booléen optionnel des positions globales autorisées
+        """
+        if params is not None:
+            raise ValueError("ShardedIndex: utiliser `mask` plutôt que des SearchParameters")
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+        n_queries = len(query_vectors)
+
+        shards = range(len(self.indexes))
+        if self.executor is None or len(self.indexes) == 1:
+            results = [self._search_shard(i, query_vectors, k, mask) for i in shards]
+        else:
+            results = list(self.executor.map(lambda i: self._search_shard(i, query_vectors, k, mask), shards))
+        results = [result for result in results if result is not None]
+
+        merged_distances = np.full((n_queries, k), -np.inf if self._higher_is_better else np.inf, dtype=np.float32)
+        merged_positions = np.full((n_queries, k), -1, dtype=np.int64)
+        if not results:
+            return merged_distances, merged_positions
+
+        distances = np.hstack([d for d, _ in results])
+        positions = np.hstack([p for _, p in results])
+        # Les trous (-1) passent en dernier
+        distances = np.where(positions >= 0, distances, -np.inf if self._higher_is_better else np.inf)
+        order = np.argsort(-distances if self._higher_is_better else distances, axis=1, kind="stable")[:, :k]
+        width = order.shape[1]
+        merged_distances[:, :width] = np.take_along_axis(distances, order, axis=1)
+        merged_positions[:, :width] = np.take_along_axis(positions, order, axis=1)
+        return merged_distances, merged_positions
+
+    def reconstruct_batch(self, positions) -> np.ndarray:
+        positions = np.asarray(positions, dtype=np.int64)
+        vectors = np.empty((len(positions), self.d), dtype=np.float32)
+        shard_ids = np.searchsorted(self.offsets, positions, side="right") - 1
+        for shard in np.unique(shard_ids):
+            rows = np.nonzero(shard_ids == shard)[0]
+            local = positions[rows] - self.offsets[shard]
+            vectors[rows] = self.indexes[shard].reconstruct_batch(local)
+        return vectors
+
+    def reconstruct(self, position: int) -> np.ndarray:
+        return self.reconstruct_batch([position])[0]
+
+
+class ShardedVectorStore(FAISS):
+    """
+    Vector store composé de plusieurs shards FAISS (un par collection).
+
+    Les shards sont ordonnés par nom ; les positions globales suivent cet ordre.
+    Les ajouts (`add_texts`, `add_embeddings`) vont au shard de leur collection
+    (métadonnée `collection`), puis la vue globale est réassemblée. La sauvegarde
+    reste shard par shard (voir `VectorStoreManager.save_shard`).
+    """
+
+    def __init__(self, shards: Dict[str, FAISS], executor: Optional[ThreadPoolExecutor] = None):
+        shards = {name: shard for name, shard in sorted(shards.items()) if shard.index.ntotal > 0}
+        if not shards:
+            raise ValueError("Aucun shard non vide")
+        self._assemble(shards, executor)
+
+    def _assemble(self, shards: Dict[str, FAISS], executor: Optional[ThreadPoolExecutor]) -> None:
+        """Construit la vue globale (index, docstore, positions) à partir des shards."""
+        first = next(iter(shards.values()))
+
+        documents = {}
+        index_to_docstore_id = {}
+        offset = 0
+        for shard in shards.values():
+            for position in range(shard.index.ntotal):
+                doc_id = shard.index_to_docstore_id[position]
+                index_to_docstore_id[offset + position] = doc_id
+                documents[doc_id] = shard.docstore.search(doc_id)
+            offset += shard.index.ntotal
+
+        super().__init__(
+            first.embedding_function,
+            ShardedIndex([shard.index for shard in shards.values()], executor=executor),
+            InMemoryDocstore(documents),
+            index_to_docstore_id,
+            normalize_L2=first._normalize_L2,
+            distance_strategy=first.distance_strategy,
+        )
+        self.shards = shards
+
+    def shard_ranges(self) -> Dict[str, Tuple[int, int]]:
+        """Plage de positions globales [début, fin) de chaque shard."""
+        offsets = self.index.offsets
+        return {name: (int(offsets[i]), int(offsets[i + 1])) for i, name in enumerate(self.shards)}
+
+    def _empty_shard(self) -> FAISS:
+        import faiss
+
+        index = faiss.IndexFlatIP(self.index.d) if self.index._higher_is_better else faiss.IndexFlatL2(self.index.d)
+        return FAISS(
+            self.embedding_function,
+            index,
+            InMemoryDocstore(),
+            {},
+            normalize_L2=self._normalize_L2,
+            distance_strategy=self.distance_strategy,
+        )
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Encode les textes puis les ajoute au shard de leur collection (voir `add_embeddings`)."""
+        texts = list(texts)
+        return self.add_embeddings(zip(texts, self._embed_documents(texts)), metadatas=metadatas, ids=ids, **kwargs)
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """
+        Ajoute des vecteurs au shard de leur collection (`DEFAULT_COLLECTION` sans métadonnée),
+        en créant le shard si besoin, puis réassemble la vue globale.
+
+        Les positions globales des shards suivants sont décalées : les index dérivés des
+        positions (BM25, métadonnées) sont à reconstruire.
+
+        Returns:
+            Identifiants des documents ajoutés, dans l'ordre des textes
+        """
+        text_embeddings = list(text_embeddings)
+        metadatas = metadatas or [{} for _ in text_embeddings]
+        ids = ids or [None] * len(text_embeddings)
+
+        groups: Dict[str, list] = {}
+        for position, (item, metadata, doc_id) in enumerate(zip(text_embeddings, metadatas, ids)):
+            groups.setdefault(metadata.get("collection") or DEFAULT_COLLECTION, []).append(
+                (position, item, metadata, doc_id)
+            )
+
+        added: List[Optional[str]] = [None] * len(text_embeddings)
+        shards = dict(self.shards)
+        for name, items in groups.items():
+            shard = shards.get(name) or self._empty_shard()
+            group_ids = [doc_id for _, _, _, doc_id in items]
+            new_ids = shard.add_embeddings(
+                [item for _, item, _, _ in items],
+                metadatas=[metadata for _, _, metadata, _ in items],
+                ids=group_ids if all(group_ids) else None,
+                **kwargs,
+            )
+            for (position, _, _, _), doc_id in zip(items, new_ids):
+                added[position] = doc_id
+            shards[name] = shard
+
+        self._assemble(dict(sorted(shards.items())), self.index.executor)
+        logger.debug(f"➕ {len(text_embeddings)} vecteurs ajoutés aux shards {sorted(groups)}")
+        return added
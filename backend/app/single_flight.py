@@ -0,0 +1,264 @@
+"""
+Coalescence des questions identiques en cours de traitement (single-flight).
+
+Quand une classe entière pose la même question au même moment, toutes les
+requêtes ratent le cache de réponses (la première réponse n'y est écrite qu'à la
+fin) et lancent chacune une génération LLM. Ici les requêtes concurrentes de même
+clé (question normalisée, version de l'index, modèle...) s'attachent à une seule
+génération en cours :
+
+- bloquant : les suiveurs attendent le résultat du premier appel ;
+- streaming : la génération tourne dans son propre thread (ou sa propre tâche) et
+  chaque abonné reçoit le flux de tokens depuis le début (tampon partagé) ; elle
+  est arrêtée quand le dernier abonné se déconnecte.
+
+La clé est libérée dès la fin de la génération : les requêtes suivantes passent
+par les caches habituels.
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Iterator, List, Optional
+
+from .metrics import get_metrics_collector
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Forme canonique d'une question : casse, espaces et ponctuation finale ignorés."""
+    text = unicodedata.normalize("NFKC", question).lower()
+    return _WHITESPACE.sub(" ", text).strip().rstrip("?!. ").strip()
+
+
+class _StreamBroadcast:
+    """Flux produit dans un thread, relu depuis le début par chaque abonné."""
+
+    def __init__(self) -> None:
+        self.items: List[Any] = []
+        self.done = False
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+        self.subscribers = 0
+
+    def join(self) -> bool:
+        """Ajoute un abonné ; False si la génération est déjà abandonnée."""
+        with self.condition:
+            if self.cancelled:
+                return False
+            self.subscribers += 1
+            return True
+
+    def leave(self) -> None:
+        with self.condition:
+            self.subscribers -= 1
+            # Tous les abonnés sont partis (clients déconnectés) : arrêter la génération
+            if self.subscribers == 0 and not self.done:
+                self.cancelled = True
+                get_metrics_collector().increment("single_flight.abandoned")
+
+    def run(self, iterator: Iterator[Any], on_done: Callable[[], None]) -> None:
+        try:
+            for item in iterator:
+                # Arrêt vérifié entre deux éléments (un appel en cours ne peut pas être interrompu)
+                with self.condition:
+                    if self.cancelled:
+                        break
+                    self.items.append(item)
+                    self.condition.notify_all()
+        except BaseException as e:  # Transmis à tous les abonnés
+            self.error = e
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    # Générateur : ses blocs finally s'exécutent (flux LLM fermé)
+                    close()
+                except Exception as e:
+                    logger.debug(f"Fermeture du flux partagé: {e}")
+            on_done()
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def subscribe(self) -> Iterator[Any]:
+        position = 0
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: position < len(self.items) or self.done)
+                    batch = self.items[position:]
+                    finished, error = self.done, self.error
+                for item in batch:
+                    yield item
+                position += len(batch)
+                if finished and position == len(self.items):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self.leave()
+
+
+class _AsyncStreamBroadcast:
+    """Flux asynchrone produit dans une tâche, relu depuis le début par chaque abonné."""
+
+    def __init__(self) -> None:
+        self.items: List[Any] = []
+        self.done = False
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+
+    def join(self) -> bool:
+        """Ajoute un abonné ; False si la génération est déjà abandonnée."""
+        if self.cancelled:
+            return False
+        self.subscribers += 1
+        return True
+
+    def leave(self) -> None:
+        self.subscribers -= 1
+        # Tous les abonnés sont partis (clients déconnectés) : arrêter la génération
+        if self.subscribers == 0 and not self.done and self.task is not None:
+            self.cancelled = True
+            self.task.cancel()
+            get_metrics_collector().increment("single_flight.abandoned")
+
+    async def run(self, iterator: AsyncIterator[Any], on_done: Callable[[], None]) -> None:
+        try:
+            async for item in iterator:
+                async with self.condition:
+                    self.items.append(item)
+                    self.condition.notify_all()
+        except BaseException as e:  # Transmis à tous les abonnés
+            self.error = e
+        finally:
+            on_done()
+            async with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        position = 0
+        try:
+            while True:
+                async with self.condition:
+                    await self.condition.wait_for(lambda: position < len(self.items) or self.done)
+                    batch = self.items[position:]
+                    finished, error = self.done, self.error
+                for item in batch:
+                    yield item
+                position += len(batch)
+                if finished and position == len(self.items):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self.leave()
+
+
+class SingleFlight:
+    """Regroupe les appels concurrents de même clé sur une seule exécution."""
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, Future] = {}
+        self._streams: Dict[Hashable, _StreamBroadcast] = {}
+        self._async_streams: Dict[Hashable, _AsyncStreamBroadcast] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, kind: str, coalesced: bool) -> None:
+        metrics = get_metrics_collector()
+        metrics.increment("single_flight.coalesced" if coalesced else "single_flight.leaders", tags={"kind": kind})
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Exécute `fn` une seule fois pour tous les appels concurrents de même clé."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        self._record("call", coalesced=not leader)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stream(self, key: Hashable, factory: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """
+        Partage un flux : le premier appel lance `factory()` dans un thread,
+        chaque appel (y compris le premier) relit le flux depuis le début.
+        Le thread s'arrête (entre deux éléments) quand le dernier abonné ferme son flux.
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            leader = broadcast is None or not broadcast.join()
+            if leader:
+                broadcast = self._streams[key] = _StreamBroadcast()
+                broadcast.join()
+        self._record("stream", coalesced=not leader)
+        if leader:
+
+            def _release() -> None:
+                with self._lock:
+                    if self._streams.get(key) is broadcast:
+                        del self._streams[key]
+
+            threading.Thread(
+                target=broadcast.run, args=(factory(), _release), name="single-flight-stream", daemon=True
+            ).start()
+        return broadcast.subscribe()
+
+    def astream(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Version asynchrone de `stream` : la génération tourne dans une tâche de la boucle courante."""
+        with self._lock:
+            broadcast = self._async_streams.get(key)
+            leader = broadcast is None or not broadcast.join()
+            if leader:
+                broadcast = self._async_streams[key] = _AsyncStreamBroadcast()
+                broadcast.join()
+        self._record("async_stream", coalesced=not leader)
+        if leader:
+
+            def _release() -> None:
+                with self._lock:
+                    if self._async_streams.get(key) is broadcast:
+                        del self._async_streams[key]
+
+            broadcast.task = asyncio.get_running_loop().create_task(broadcast.run(factory(), _release))
+        return broadcast.subscribe()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._streams) + len(self._async_streams)
+
+
+# Instance globale
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """Récupère l'instance globale de coalescence des requêtes."""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
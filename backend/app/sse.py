@@ -0,0 +1,156 @@
+"""
+Trames Server-Sent Events pour le streaming des réponses.
+
+Une trame par token (un `json.dumps` et un envoi réseau chacun) coûte cher à
+plusieurs centaines de tokens par réponse et de nombreux flux simultanés. Les
+tokens sont ici regroupés et envoyés toutes les N millisecondes ou dès M octets
+accumulés, avec un gabarit de trame pré-sérialisé. Le protocole ne change pas :
+événements `chunk`, `sources`, `done` et `error`, le client concatène les `chunk`.
+
+Le premier token part immédiatement (temps au premier token inchangé).
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Union
+
+from .config import settings
+from .context_packer import approximate_token_count
+from .metrics import get_metrics_collector
+
+# Gabarit pré-sérialisé : identique à json.dumps({"type": "chunk", "content": ...})
+_CHUNK_PREFIX = 'data: {"type": "chunk", "content": '
+_CHUNK_SUFFIX = "}\n\n"
+_END = object()
+
+
+def sse_event(payload: Dict[str, Any]) -> str:
+    """Trame SSE d'un événement JSON."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def chunk_frame(text: str) -> str:
+    """Trame SSE d'un événement `chunk` (seul le contenu est sérialisé)."""
+    return _CHUNK_PREFIX + json.dumps(text) + _CHUNK_SUFFIX
+
+
+class ChunkCoalescer:
+    """Accumule les tokens et produit une trame `chunk` par lot."""
+
+    def __init__(self, flush_interval_ms: Optional[float] = None, flush_bytes: Optional[int] = None):
+        """
+        Args:
+            flush_interval_ms: Délai maximal (ms) avant l'envoi des tokens accumulés
+            flush_bytes: Taille (octets UTF-8) déclenchant l'envoi ; 0 = une trame par token
+        """
+        self.flush_interval = (
+            flush_interval_ms if flush_interval_ms is not None else settings.sse_flush_interval_ms
+        ) / 1000
+        self.flush_bytes = flush_bytes if flush_bytes is not None else settings.sse_flush_bytes
+        self._parts: list = []
+        self._size = 0
+        self._first = True
+        self._deadline: Optional[float] = None
+
+    def time_left(self) -> Optional[float]:
+        """Secondes avant l'échéance d'envoi du lot en cours (None si rien en attente)."""
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    def add(self, token: str) -> Optional[str]:
+        """Ajoute un token ; retourne une trame si le lot doit partir."""
+        if not token:
+            return None
+        self._parts.append(token)
+        self._size += len(token.encode("utf-8"))
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.flush_interval
+        if self._first or self._size >= self.flush_bytes or self.time_left() == 0:
+            self._first = False
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Trame des tokens accumulés (None si le lot est vide)."""
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._deadline = None
+        return chunk_frame(text)
+
+
+async def coalesce_chunks(
+    stream: AsyncIterator[Union[str, Any]], coalescer: Optional[ChunkCoalescer] = None
+) -> AsyncIterator[Union[str, Any]]:
+    """
+    Regroupe les tokens texte d'un flux en trames `chunk`.
+
+    Produit des trames SSE (str) prêtes à envoyer pour le texte ; les autres éléments
+    (dict de sources...) sont transmis tels quels, après envoi du texte en attente.
+    Le lot en cours part à l'échéance même si le LLM marque une pause.
+
+    Le flux source est lu dans une tâche annulée à la fermeture de ce générateur
+    (client déconnecté) : l'annulation remonte jusqu'au flux du LLM.
+    """
+    coalescer = coalescer or ChunkCoalescer()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            async for item in stream:
+                await queue.put((item, None))
+            await queue.put((_END, None))
+        except Exception as e:
+            await queue.put((_END, e))
+
+    producer = asyncio.ensure_future(pump())
+    try:
+        while True:
+            try:
+                item, error = await asyncio.wait_for(queue.get(), coalescer.time_left())
+            except asyncio.TimeoutError:
+                # Échéance atteinte sans nouveau token : envoyer le lot
+                yield coalescer.flush()
+                continue
+            if item is _END:
+                # Envoyer le texte déjà reçu avant une éventuelle erreur
+                frame = coalescer.flush()
+                if frame is not None:
+                    yield frame
+                if error is not None:
+                    raise error
+                return
+            if isinstance(item, str):
+                frame = coalescer.add(item)
+                if frame is not None:
+                    yield frame
+            else:
+                frame = coalescer.flush()
+                if frame is not None:
+                    yield frame
+                yield item
+    finally:
+        producer.cancel()
+
+
+def record_stream_outcome(answer: str, truncated: bool) -> None:
+    """
+    Métriques de fin de flux. Pour un flux interrompu, estime les tokens économisés
+    (longueur moyenne des réponses complètes moins les tokens déjà générés).
+    """
+    metrics = get_metrics_collector()
+    tokens = approximate_token_count(answer)
+    if not truncated:
+        if tokens:
+            metrics.record_histogram("stream.answer_tokens", tokens)
+        return
+    metrics.increment("stream.cancelled")
+    metrics.record_histogram("stream.cancelled_tokens_generated", tokens)
+    average = metrics.get_histogram_stats("stream.answer_tokens").get("mean", 0.0)
+    saved = max(0, int(average) - tokens)
+    if saved:
+        metrics.increment("stream.cancelled_tokens_saved", saved)
@@ -0,0 +1,149 @@
+"""
+Accès bas niveau à l'index FAISS du vector store.
+
+LangChain ne renvoie que des Documents ; ici on travaille directement avec les
+positions FAISS pour pouvoir fusionner les candidats vectoriels et lexicaux.
+"""
+
+import logging
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+from .compute_threads import limit_current_thread
+
+logger = logging.getLogger(__name__)
+
+
+def _batch_query_encoder(embedding) -> Optional[Callable[[List[str]], List[List[float]]]]:
+    """
+    Encodage batch équivalent à `embed_query` pour les embedders connus, sinon None.
+
+    `embed_documents` ne convient pas en général : certains modèles préfixent
+    différemment questions et documents (instructions, kwargs d'encodage).
+    """
+    # langchain_huggingface : embed_query = _embed([q], query_encode_kwargs ou encode_kwargs)
+    if hasattr(embedding, "query_encode_kwargs") and callable(getattr(embedding, "_embed", None)):
+        kwargs = embedding.query_encode_kwargs or embedding.encode_kwargs
+        return lambda texts: embedding._embed(texts, kwargs)
+    # HuggingFaceEmbeddings de langchain_community : embed_query = embed_documents([q])[0]
+    try:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+    except ImportError:
+        return None
+    if type(embedding).embed_query is HuggingFaceEmbeddings.embed_query:
+        return embedding.embed_documents
+    return None
+
+
+def embed_queries(vector_store: FAISS, questions: Sequence[str]) -> np.ndarray:
+    """
+    Encode une ou plusieurs questions, avec la sémantique de `embed_query` quelle que
+    soit la taille du lot (une seule passe du modèle quand l'embedder le permet).
+
+    Returns:
+        Matrice float32 de forme (len(questions), dimension)
+    """
+    limit_current_thread()
+    embedding = vector_store.embedding_function
+    encoder = _batch_query_encoder(embedding) if len(questions) > 1 else None
+    if encoder is not None:
+        vectors = encoder(list(questions))
+    else:
+        vectors = [embedding.embed_query(question) for question in questions]
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if vector_store._normalize_L2:
+        import faiss
+
+        faiss.normalize_L2(matrix)
+    return matrix
+
+
+def search_vectors(
+    vector_store: FAISS, query_vectors: np.ndarray, k: int, mask: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Recherche matricielle dans l'index FAISS.
+
+    Args:
+        vector_store: Vector store FAISS
+        query_vectors: Matrice des requêtes (n_queries, dimension)
+        k: Nombre de voisins par requête
+        mask: Masque booléen optionnel des positions autorisées, appliqué dans la
+            recherche ANN elle-même (IDSelectorBitmap) : pas de sur-échantillonnage
+
+    Returns:
+        (distances, positions) de forme (n_queries, k). Les positions absentes valent -1.
+    """
+    k = min(k, vector_store.index.ntotal)
+    if k <= 0:
+        empty = np.empty((len(query_vectors), 0))
+        return empty.astype(np.float32), empty.astype(np.int64)
+    return search_index(vector_store.index, query_vectors, k, mask)
+
+
+def search_index(index, query_vectors: np.ndarray, k: int, mask: Optional[np.ndarray] = None):
+    """Recherche dans un index FAISS (ou shardé), le masque étant appliqué via IDSelectorBitmap."""
+    limit_current_thread()
+    query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    if getattr(index, "is_sharded", False):
+        return index.search(query_vectors, k, mask=mask)
+    if mask is None:
+        return index.search(query_vectors, k)
+
+    import faiss
+
+    # Le bitmap doit rester référencé pendant toute la durée de la recherche
+    bitmap = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    return index.search(query_vectors, k, params=faiss.SearchParameters(sel=selector))
+
+
+def relevance_scores(vector_store: FAISS, distances: np.ndarray) -> np.ndarray:
+    """
+    Convertit les distances FAISS en scores de similarité (plus haut = plus pertinent).
+
+    Pour l'index L2 par défaut, les embeddings MiniLM sont normalisés : la distance
+    L2 au carré vaut 2 - 2·cos, d'où cos = 1 - d/2.
+    """
+    if vector_store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+        return distances
+    return 1.0 - distances / 2.0
+
+
+def reconstruct_vectors(vector_store: FAISS, positions: Sequence[int]) -> np.ndarray:
+    """Vecteurs stockés dans l'index pour les positions données (index plat : reconstruction exacte)."""
+    if len(positions) == 0:
+        return np.empty((0, vector_store.index.d), dtype=np.float32)
+    return vector_store.index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+
+
+def exact_relevance(vector_store: FAISS, query_vector: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """
+    Score de similarité exact entre une requête et des vecteurs candidats,
+    dans la même échelle que `relevance_scores` (utile pour les candidats BM25).
+    """
+    if vector_store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+        return vectors @ query_vector
+    distances = np.sum((vectors - query_vector) ** 2, axis=1)
+    return relevance_scores(vector_store, distances)
+
+
+def documents_at(vector_store: FAISS, positions: Sequence[int]) -> List[Document]:
+    """Récupère les Documents du docstore correspondant aux positions FAISS."""
+    documents = []
+    for position in positions:
+        doc_id = vector_store.index_to_docstore_id[int(position)]
+        doc = vector_store.docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            raise ValueError(f"Document introuvable pour l'identifiant {doc_id}")
+        documents.append(doc)
+    return documents
+
+
+def docstore_ids(vector_store: FAISS) -> List[str]:
+    """Identifiants docstore dans l'ordre des positions FAISS."""
+    return [vector_store.index_to_docstore_id[i] for i in range(vector_store.index.ntotal)]
@@ -149,8 +149,10 @@ class HealthChecker:
         # Vérifier le vector store
         from app.config import settings
         vector_store_path = settings.vector_store_dir / "index.faiss"
+        shard_paths = list((settings.vector_store_dir / "shards").glob("*/index.faiss"))
         health["checks"]["vector_store"] = {
-            "exists": vector_store_path.exists(),
+            "exists": vector_store_path.exists() or bool(shard_paths),
+            "num_shards": len(shard_paths),
             "path": str(vector_store_path)
         }
         
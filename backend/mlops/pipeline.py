@@ -157,11 +157,13 @@ def generate_embeddings_task(chunk_results: Dict[str, Any]) -> Dict[str, Any]:
         # Compter les documents dans le vector store
         # (approximation, car FAISS ne fournit pas directement cette info)
         vector_store_path = settings.vector_store_dir / "index.faiss"
+        shard_paths = list((settings.vector_store_dir / "shards").glob("*/index.faiss"))
         
         return {
             "status": "success",
             "vector_store_path": str(vector_store_path),
-            "vector_store_exists": vector_store_path.exists()
+            "vector_store_exists": vector_store_path.exists() or bool(shard_paths),
+            "num_shards": len(shard_paths),
         }
     except Exception as e:
         logger.error(f"Erreur génération embeddings: {e}")
@@ -187,24 +189,34 @@ def validate_pipeline_task(embedding_results: Dict[str, Any]) -> Dict[str, Any]:
         if vector_store_path.exists():
             validation_results["vector_store_valid"] = True
             
-            # Tester avec quelques questions
-            from app.rag_pipeline import answer_question
+            # Tester avec quelques questions (un seul batch d'encodage et de recherche)
+            from app.rag_pipeline import answer_questions
             
             test_questions = [
                 "Qu'est-ce que l'ISO en photographie ?",
                 "Comment fonctionne l'ouverture ?"
             ]
             
-            for question in test_questions:
-                try:
-                    result = answer_question(question, force_rebuild=False)
+            try:
+                batch = answer_questions(test_questions, force_rebuild=False)
+                validation_results["timings"] = batch["timings"]
+                for result in batch["results"]:
+                    if "error" in result:
+                        # Échec de génération pour cette question seulement
+                        validation_results["test_questions"].append({
+                            "question": result["question"],
+                            "status": "error",
+                            "error": result["error"]
+                        })
+                        continue
                     validation_results["test_questions"].append({
-                        "question": question,
+                        "question": result["question"],
                         "answer_length": len(result.get("answer", "")),
                         "sources_count": result.get("num_sources", 0),
                         "status": "success" if result.get("answer") else "failed"
                     })
-                except Exception as e:
+            except Exception as e:
+                for question in test_questions:
                     validation_results["test_questions"].append({
                         "question": question,
                         "status": "error",
@@ -0,0 +1,208 @@
+"""
+Tests pour le contrôle d'admission devant les générations LLM.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.language_models import FakeStreamingListLLM
+
+from app import admission
+from app.admission import AdmissionController, AdmissionRejected, admitted, tier_config
+from app.llm_router import LLMRouter, RoutedLLM
+
+BUDGETS = {"interactive": 1.0, "standard": 1.0, "batch": 1.0}
+
+
+def make_controller(max_concurrency=1, max_queue=4, budgets=None):
+    return AdmissionController("test", max_concurrency, max_queue, budgets or BUDGETS)
+
+
+class FakeManager:
+    """Gestionnaire factice : un LLM par nom d'endpoint."""
+
+    def __init__(self, llms):
+        self.llms = llms
+
+    def get_llm(self, name):
+        return self.llms[name]
+
+
+def fake_llm(response):
+    return FakeStreamingListLLM(responses=[response])
+
+
+class TestAdmissionController:
+    """Tests de la limite de concurrence et de la file par priorité."""
+
+    def test_immediate_grant_and_release(self):
+        controller = make_controller(max_concurrency=2)
+
+        async def scenario():
+            async with await controller.acquire("standard"):
+                assert controller.active == 1
+            return controller.active
+
+        assert asyncio.run(scenario()) == 0
+
+    def test_interactive_served_before_batch(self):
+        controller = make_controller()
+        order = []
+
+        async def waiter(tier):
+            async with await controller.acquire(tier):
+                order.append(tier)
+
+        async def scenario():
+            ticket = await controller.acquire("standard")
+            batch = asyncio.create_task(waiter("batch"))
+            await asyncio.sleep(0.01)
+            interactive = asyncio.create_task(waiter("interactive"))
+            await asyncio.sleep(0.01)
+            assert controller.queue_depth == 2
+            ticket.release()
+            await asyncio.gather(batch, interactive)
+
+        asyncio.run(scenario())
+        assert order == ["interactive", "batch"]
+        assert controller.active == 0
+
+    def test_full_queue_rejected_with_429(self):
+        controller = make_controller(max_queue=1)
+
+        async def scenario():
+            ticket = await controller.acquire("standard")
+            queued = asyncio.create_task(controller.acquire("standard"))
+            await asyncio.sleep(0.01)
+            with pytest.raises(AdmissionRejected) as exc:
+                await controller.acquire("interactive")
+            ticket.release()
+            (await queued).release()
+            return exc.value
+
+        rejected = asyncio.run(scenario())
+        assert rejected.status_code == 429
+        assert rejected.retry_after >= 1
+
+    def test_wait_budget_exceeded_returns_503(self):
+        controller = make_controller(budgets={"batch": 0.05})
+
+        async def scenario():
+            ticket = await controller.acquire("standard")
+            with pytest.raises(AdmissionRejected) as exc:
+                await controller.acquire("batch")
+            assert controller.queue_depth == 0
+            ticket.release()
+            return exc.value
+
+        rejected = asyncio.run(scenario())
+        assert rejected.status_code == 503
+        assert rejected.retry_after >= 1
+        assert controller.active == 0
+
+    def test_check_rejects_without_taking_a_slot(self):
+        controller = make_controller(max_queue=1, budgets={"interactive": 10.0, "batch": 0.5})
+        controller.check("batch")
+        assert controller.active == 0
+
+        ticket = controller.acquire_blocking("standard")
+        # Attente estimée (une génération de 5 s) au-delà du budget batch, pas du budget interactif
+        with pytest.raises(AdmissionRejected) as exc:
+            controller.check("batch")
+        assert exc.value.status_code == 503
+        controller.check("interactive")
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            waiting = executor.submit(controller.acquire_blocking, "interactive")
+            time.sleep(0.02)
+            with pytest.raises(AdmissionRejected) as exc:
+                controller.check("interactive")
+            assert exc.value.status_code == 429
+            assert controller.queue_depth == 1
+            ticket.release()
+            waiting.result(timeout=1).release()
+        assert controller.active == 0
+
+
+@pytest.fixture
+def controllers(monkeypatch):
+    """Contrôleurs par LLM isolés du reste des tests."""
+    registry = {}
+    monkeypatch.setattr(admission, "_controllers", registry)
+    return registry
+
+
+class TestGenerationAdmission:
+    """Tests de la place prise au moment de la génération, pour le LLM qui génère."""
+
+    def test_blocking_acquire_from_worker_threads(self):
+        controller = make_controller(budgets={"standard": 1.0, "batch": 0.05})
+        ticket = controller.acquire_blocking("standard")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            waiting = executor.submit(controller.acquire_blocking, "standard")
+            time.sleep(0.02)
+            assert controller.queue_depth == 1
+            with pytest.raises(AdmissionRejected) as exc:
+                controller.acquire_blocking("batch")
+            assert exc.value.status_code == 503
+            ticket.release()
+            waiting.result(timeout=1).release()
+        assert controller.active == 0
+        assert controller.queue_depth == 0
+
+    def test_routed_stream_charges_the_chosen_endpoint(self, controllers):
+        controllers["gpu-1"] = make_controller(max_queue=0)
+        controllers["gpu-2"] = make_controller()
+        # gpu-1 saturé (file de taille nulle) : 429 immédiat, bascule sur gpu-2
+        busy = controllers["gpu-1"].acquire_blocking("standard")
+        llm = RoutedLLM(LLMRouter(["gpu-1", "gpu-2"]), FakeManager({"gpu-1": fake_llm("A"), "gpu-2": fake_llm("B")}))
+
+        stream = llm.stream("question", config=tier_config("interactive"))
+        assert next(stream) == "B"
+        assert controllers["gpu-2"].active == 1
+        assert list(stream) == []
+        assert controllers["gpu-2"].active == 0
+
+        # Refus d'admission : pas un échec de l'endpoint (disjoncteur intact) ;
+        # sans tier, pas d'admission : gpu-1 sert malgré sa file pleine
+        assert llm.router.states["gpu-1"].failures == 0
+        assert llm.invoke("question") == "A"
+        busy.release()
+
+    def test_all_endpoints_saturated_keeps_the_rejection(self, controllers):
+        controllers["gpu-1"] = make_controller(max_queue=0)
+        busy = controllers["gpu-1"].acquire_blocking("standard")
+        llm = RoutedLLM(LLMRouter(["gpu-1"]), FakeManager({"gpu-1": fake_llm("A")}))
+        with pytest.raises(AdmissionRejected) as exc:
+            llm.invoke("question", config=tier_config("standard"))
+        assert exc.value.status_code == 429
+        busy.release()
+
+    def test_coalesced_questions_take_one_slot(self, controllers, monkeypatch):
+        from app import rag_pipeline
+        from app.config import settings
+
+        controller = controllers["ollama-test"] = make_controller(max_concurrency=4)
+        acquisitions = []
+        original = controller.acquire_blocking
+        monkeypatch.setattr(controller, "acquire_blocking", lambda tier: acquisitions.append(tier) or original(tier))
+        monkeypatch.setattr(settings, "single_flight_enabled", True)
+        monkeypatch.setattr(settings, "calculator_enabled", False)
+
+        def generate(question, show_sources, force_rebuild, num_docs, filters, tier):
+            with admitted("ollama-test", tier):
+                time.sleep(0.1)
+                return {"answer": "f/8", "sources": []}
+
+        monkeypatch.setattr(rag_pipeline, "_answer_question", generate)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(rag_pipeline.answer_question, "Quelle ouverture ?", tier="standard") for _ in range(3)
+            ]
+            results = [future.result() for future in futures]
+
+        assert [result["answer"] for result in results] == ["f/8"] * 3
+        assert acquisitions == ["standard"]
+        assert controller.active == 0
@@ -140,3 +140,56 @@ class TestInputValidation:
         response = authenticated_client.post("/ask", json={"question": sql_payload})
         # Le payload devrait être sanitized
         assert response.status_code in [200, 400, 500]
+
+
+class TestStreamingDisconnect:
+    """Tests de l'annulation du streaming quand le client se déconnecte."""
+
+    def test_generation_cancelled_and_partial_answer_saved(self, monkeypatch):
+        import asyncio
+        from types import SimpleNamespace
+
+        from app import api
+
+        saved = []
+        state = {"cancelled": False}
+
+        async def endless_answer(question, force_rebuild=False, filters=None, tier=None):
+            try:
+                while True:
+                    await asyncio.sleep(0.001)
+                    yield "token "
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        class FakeRequest:
+            def __init__(self):
+                self.calls = 0
+
+            async def is_disconnected(self):
+                self.calls += 1
+                return self.calls >= 3
+
+        def fake_add_message(db, conversation_id, role, content, truncated=False):
+            saved.append((content, truncated))
+
+        monkeypatch.setattr(api, "answer_question_stream_async", endless_answer)
+        monkeypatch.setattr(api, "add_message", fake_add_message)
+
+        async def scenario():
+            frames = [
+                frame
+                async for frame in api.generate_streaming_response(
+                    "Quelle vitesse ?", 1, None, SimpleNamespace(id=1), request=FakeRequest()
+                )
+            ]
+            await asyncio.sleep(0.01)
+            return frames
+
+        frames = asyncio.run(scenario())
+        assert len(frames) == 3
+        assert state["cancelled"]
+        assert len(saved) == 1
+        content, truncated = saved[0]
+        assert truncated and content.startswith("token ")
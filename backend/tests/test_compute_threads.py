@@ -0,0 +1,94 @@
+"""
+Tests pour la politique de threads de calcul.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import faiss
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app import compute_threads
+from app.compute_threads import apply_thread_policy, benchmark, threads_per_request
+from app.config import settings
+from app.vector_search import embed_queries, search_vectors
+
+
+@pytest.fixture(autouse=True)
+def restore_thread_state(monkeypatch):
+    """Restaure les limites FAISS / torch / BLAS, l'environnement et la politique du module après chaque test."""
+    previous = faiss.omp_get_max_threads()
+    environment = {name: os.environ.get(name) for name in compute_threads._BLAS_ENV_VARS}
+    monkeypatch.setattr(compute_threads, "_current_threads", None)
+    yield
+    compute_threads._set_omp_threads(previous)
+    compute_threads._set_process_threads(previous)
+    compute_threads._thread_state.__dict__.clear()
+    for name, value in environment.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+def fresh_thread(fn):
+    """Exécute `fn` dans un nouveau thread (état OpenMP par défaut)."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(fn).result()
+
+
+class TestThreadPolicy:
+    """Tests du calcul et de l'application du nombre de threads."""
+
+    def test_threads_per_request_divides_cores(self):
+        with patch.object(settings, "compute_threads", 0):
+            assert threads_per_request(cpu_count=16, concurrency=4) == 4
+            assert threads_per_request(cpu_count=4, concurrency=8) == 1
+
+    def test_explicit_setting_wins(self):
+        with patch.object(settings, "compute_threads", 3):
+            assert threads_per_request(cpu_count=16, concurrency=4) == 3
+
+    def test_apply_sets_faiss_threads(self):
+        assert apply_thread_policy(2) == 2
+        assert faiss.omp_get_max_threads() == 2
+
+    def test_policy_reaches_worker_threads(self):
+        default = fresh_thread(faiss.omp_get_max_threads)
+        target = 1 if default != 1 else 2
+        apply_thread_policy(target)
+        vector_store = FAISS.from_texts([f"Texte {i}" for i in range(10)], DeterministicFakeEmbedding(size=8))
+
+        def search_then_read():
+            search_vectors(vector_store, embed_queries(vector_store, ["Texte 1"]), 2)
+            return faiss.omp_get_max_threads()
+
+        # Le réglage OpenMP est par thread : appliqué par le thread de calcul à sa recherche
+        assert fresh_thread(search_then_read) == target
+
+    def test_process_wide_limits_only_at_startup(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(compute_threads, "_set_process_threads", calls.append)
+        for name in compute_threads._BLAS_ENV_VARS:
+            monkeypatch.delenv(name, raising=False)
+        apply_thread_policy(2)
+        assert calls == [2]
+        assert all(os.environ[name] == "2" for name in compute_threads._BLAS_ENV_VARS)
+
+        vector_store = FAISS.from_texts([f"Texte {i}" for i in range(10)], DeterministicFakeEmbedding(size=8))
+        fresh_thread(lambda: search_vectors(vector_store, embed_queries(vector_store, ["Texte 1"]), 2))
+        # Les recherches des threads de calcul ne touchent pas aux limites globales (torch, BLAS)
+        assert calls == [2]
+
+
+class TestBenchmark:
+    """Tests du mode benchmark."""
+
+    def test_benchmark_reports_percentiles(self):
+        vector_store = FAISS.from_texts([f"Texte {i}" for i in range(10)], DeterministicFakeEmbedding(size=8))
+        rows = benchmark(vector_store, ["Texte 1", "Texte 2"], [1, 2], clients=3, requests_per_client=4)
+        assert [row["threads"] for row in rows] == [1, 2]
+        assert all(row["p99_ms"] >= row["p50_ms"] > 0 for row in rows)
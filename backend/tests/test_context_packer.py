@@ -0,0 +1,65 @@
+"""
+Tests pour l'assemblage du contexte avec budget de tokens.
+"""
+
+from langchain_core.documents import Document
+
+from app.context_packer import ContextPacker, approximate_token_count, split_sentences
+
+
+def word_count(text):
+    return len(text.split())
+
+
+class TestContextPacker:
+    """Tests du remplissage du budget avec des phrases entières."""
+
+    def test_split_sentences(self):
+        text = "Ouvrez à f/2.8 pour un portrait. Fermez à f/8 ! Et en paysage ?\nUtilisez un trépied."
+        assert split_sentences(text) == [
+            "Ouvrez à f/2.8 pour un portrait.",
+            "Fermez à f/8 !",
+            "Et en paysage ?",
+            "Utilisez un trépied.",
+        ]
+
+    def test_whole_sentences_within_budget(self):
+        docs = [
+            Document(page_content="Un deux trois. Quatre cinq six. Sept huit neuf.", metadata={"page": 1}),
+            Document(page_content="Dix onze. Douze treize quatorze quinze seize.", metadata={"page": 2}),
+        ]
+        packed = ContextPacker(budget=10, count_tokens=word_count).pack(docs)
+        # 6 mots + 1 espace pour le premier document, puis la 1re phrase du second
+        assert [doc.page_content for doc in packed.documents] == ["Un deux trois. Quatre cinq six.", "Dix onze."]
+        assert packed.documents[1].metadata == {"page": 2}
+        assert packed.tokens <= packed.budget
+        assert packed.dropped_sentences == 2
+
+    def test_ranked_order_is_kept(self):
+        docs = [Document(page_content=f"Chunk {i} très pertinent.") for i in range(5)]
+        packed = ContextPacker(budget=20).pack(docs)
+        contents = [doc.page_content for doc in packed.documents]
+        assert contents == [f"Chunk {i} très pertinent." for i in range(len(contents))]
+        assert approximate_token_count(packed.text) <= packed.tokens + len(packed.documents)
+
+    def test_oversized_first_sentence_is_skipped(self):
+        docs = [
+            Document(page_content="mot " * 50 + "."),
+            Document(page_content="Court."),
+        ]
+        packed = ContextPacker(budget=5, count_tokens=word_count).pack(docs)
+        assert packed.text == "Court."
+
+    def test_oversized_top_chunk_is_truncated_when_nothing_fits(self):
+        docs = [
+            Document(page_content="mot " * 50 + ". Suite.", metadata={"page": 1}),
+            Document(page_content="autre " * 50 + "."),
+        ]
+        packed = ContextPacker(budget=5, count_tokens=word_count).pack(docs)
+        assert packed.text == "mot mot mot mot mot…"
+        assert packed.documents[0].metadata == {"page": 1}
+        assert packed.tokens == 5
+
+        packed = ContextPacker(budget=8).pack([Document(page_content="Anticonstitutionnellement" * 5)])
+        assert packed.text.endswith("…")
+        assert 0 < packed.tokens <= 8
@@ -0,0 +1,186 @@
+"""
+Tests pour la mémoire de conversation (résumé glissant, questions de suivi reformulées).
+"""
+
+import pytest
+
+from app.config import settings
+from app.context_packer import approximate_token_count
+from app.conversation_memory import (
+    ConversationMemory,
+    condense_question,
+    fold_summary,
+    is_follow_up,
+    load_memory,
+    prepare_question,
+    truncate_to_tokens,
+)
+from app.database import Conversation
+from app.db_auth import create_user_db
+from app.db_chat import add_message, create_conversation, update_conversation_summary
+
+
+class RecordingLLM:
+    """LLM factice : enregistre les prompts et renvoie une réponse fixe."""
+
+    def __init__(self, response="", error=None):
+        self.response = response
+        self.error = error
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        if self.error:
+            raise self.error
+        return self.response
+
+
+@pytest.fixture
+def memory_settings(monkeypatch):
+    monkeypatch.setattr(settings, "conversation_memory_enabled", True)
+    monkeypatch.setattr(settings, "memory_recent_turns", 3)
+    monkeypatch.setattr(settings, "memory_summary_max_tokens", 200)
+    monkeypatch.setattr(settings, "memory_turn_max_tokens", 150)
+    monkeypatch.setattr(settings, "memory_fold_batch", 4)
+
+
+def conversation_with(db, exchanges):
+    user = create_user_db(db=db, name="Test User", email="memory@example.com", password="TestPassword123!")
+    conversation = create_conversation(db, user["id"], "Photo")
+    for question, answer in exchanges:
+        add_message(db, conversation.id, "user", question)
+        if answer is not None:
+            add_message(db, conversation.id, "assistant", answer)
+    return conversation
+
+
+class TestCondenseQuestion:
+    """Tests de la reformulation des questions de suivi."""
+
+    def test_follow_up_detection(self):
+        assert is_follow_up("Et pour un portrait ?")
+        assert is_follow_up("Est-ce qu'il est stabilisé ?")
+        assert not is_follow_up("Quelle ouverture choisir pour un paysage au grand angle ?")
+        assert is_follow_up("Pourquoi ?")
+        assert is_follow_up("Et après ?")
+        assert is_follow_up("Combien de stops ?")
+
+    def test_standalone_short_and_impersonal_questions(self):
+        assert not is_follow_up("Qu'est-ce que l'ISO ?")
+        assert not is_follow_up("Le bokeh ?")
+        assert not is_follow_up("Définition hyperfocale ?")
+        assert not is_follow_up("Que faire s'il pleut pendant une séance en extérieur ?")
+        assert not is_follow_up("Faut-il un trépied pour photographier la voie lactée ?")
+        assert not is_follow_up("Quel objectif choisir quand il fait sombre ?")
+
+    def test_no_history_skips_llm(self, memory_settings):
+        llm = RecordingLLM("ne doit pas servir")
+        assert condense_question("Et pour un portrait ?", ConversationMemory(), llm=llm) == "Et pour un portrait ?"
+        assert llm.prompts == []
+
+    def test_standalone_question_skips_llm(self, memory_settings):
+        llm = RecordingLLM("ne doit pas servir")
+        memory = ConversationMemory(recent=[("user", "Quelle ouverture en paysage ?"), ("assistant", "f/8.")])
+        question = "Quelle vitesse d'obturation choisir pour photographier un oiseau en vol ?"
+        assert condense_question(question, memory, llm=llm) == question
+        assert llm.prompts == []
+
+    def test_llm_failure_keeps_original_question(self, memory_settings):
+        memory = ConversationMemory(recent=[("user", "Quelle ouverture en paysage ?"), ("assistant", "f/8.")])
+        llm = RecordingLLM(error=RuntimeError("LLM indisponible"))
+        assert condense_question("Et pour un portrait ?", memory, llm=llm) == "Et pour un portrait ?"
+
+    def test_prepare_question_uses_history_without_current_question(self, test_db, memory_settings):
+        db = test_db()
+        conversation = conversation_with(
+            db, [("Quelle ouverture en paysage ?", "f/8 à f/11."), ("Et pour un portrait ?", None)]
+        )
+        llm = RecordingLLM("Quelle ouverture pour un portrait ?\nexplication superflue")
+
+        standalone = prepare_question(db, conversation.id, "Et pour un portrait ?", llm=llm)
+
+        assert standalone == "Quelle ouverture pour un portrait ?"
+        prompt = llm.prompts[0]
+        assert "Quelle ouverture en paysage ?" in prompt
+        assert "f/8 à f/11." in prompt
+        # La question courante n'apparaît qu'une fois (pas dans les derniers échanges)
+        assert prompt.count("Et pour un portrait ?") == 1
+        db.close()
+
+    def test_disabled_memory_returns_question(self, test_db, memory_settings, monkeypatch):
+        monkeypatch.setattr(settings, "conversation_memory_enabled", False)
+        db = test_db()
+        conversation = conversation_with(db, [("Quelle ouverture en paysage ?", "f/8."), ("Et en portrait ?", None)])
+        llm = RecordingLLM("ne doit pas servir")
+        assert prepare_question(db, conversation.id, "Et en portrait ?", llm=llm) == "Et en portrait ?"
+        assert llm.prompts == []
+        db.close()
+
+
+class TestRollingSummary:
+    """Tests du résumé incrémental."""
+
+    def test_unsummarized_messages_stay_in_recent_turns(self, test_db, memory_settings):
+        db = test_db()
+        # 10 messages + question courante, fenêtre de 6, seuls les 2 premiers repliés dans le résumé
+        conversation = conversation_with(
+            db, [(f"Question {i} ?", f"Réponse {i}.") for i in range(5)] + [("Et ensuite ?", None)]
+        )
+        update_conversation_summary(db, conversation.id, "Résumé.", 2)
+        db.refresh(conversation)
+
+        memory = load_memory(conversation)
+        assert memory.summary == "Résumé."
+        assert [content for _, content in memory.recent][0] == "Question 1 ?"
+        assert len(memory.recent) == 8
+        db.close()
+
+    def test_fold_waits_for_a_full_batch(self, test_db, memory_settings):
+        db = test_db()
+        # 8 messages, fenêtre de 6 : 2 messages à résumer, sous le lot de 4
+        conversation = conversation_with(db, [(f"Question {i} ?", f"Réponse {i}.") for i in range(4)])
+        llm = RecordingLLM("Résumé.")
+        assert fold_summary(db, conversation, llm=llm) is False
+        assert llm.prompts == []
+        db.close()
+
+    def test_fold_is_incremental(self, test_db, memory_settings):
+        db = test_db()
+        conversation = conversation_with(db, [(f"Question {i} ?", f"Réponse {i}.") for i in range(5)])
+
+        llm = RecordingLLM("Premier résumé.")
+        assert fold_summary(db, conversation, llm=llm) is True
+        db.refresh(conversation)
+        assert conversation.summary == "Premier résumé."
+        assert conversation.summary_message_count == 4
+        assert "Question 0 ?" in llm.prompts[0] and "Question 2 ?" not in llm.prompts[0]
+
+        # Seuls les nouveaux messages sortis de la fenêtre sont envoyés, avec le résumé précédent
+        for i in range(5, 7):
+            add_message(db, conversation.id, "user", f"Question {i} ?")
+            add_message(db, conversation.id, "assistant", f"Réponse {i}.")
+        db.refresh(conversation)
+        llm = RecordingLLM("Second résumé.")
+        assert fold_summary(db, conversation, llm=llm) is True
+        db.refresh(conversation)
+        assert conversation.summary_message_count == 8
+        assert "Premier résumé." in llm.prompts[0]
+        assert "Question 1 ?" not in llm.prompts[0]
+        assert "Question 2 ?" in llm.prompts[0] and "Question 3 ?" in llm.prompts[0]
+        db.close()
+
+    def test_summary_is_bounded(self, test_db, memory_settings, monkeypatch):
+        monkeypatch.setattr(settings, "memory_summary_max_tokens", 20)
+        db = test_db()
+        conversation = conversation_with(db, [(f"Question {i} ?", f"Réponse {i}.") for i in range(5)])
+        llm = RecordingLLM("Le photographe parle d'ouverture et de vitesse. " * 20)
+        fold_summary(db, conversation, llm=llm)
+        stored = db.query(Conversation).filter(Conversation.id == conversation.id).first().summary
+        assert approximate_token_count(stored) <= 20
+        db.close()
+
+    def test_truncate_to_tokens_keeps_whole_sentences(self):
+        text = "Première phrase courte. " + "Deuxième phrase beaucoup plus longue que la première. " * 5
+        truncated = truncate_to_tokens(text, 10)
+        assert truncated.startswith("Première phrase courte.")
+        assert approximate_token_count(truncated) <= 10
@@ -0,0 +1,61 @@
+"""
+Tests pour la diversification MMR des chunks récupérés.
+"""
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.diversity import are_neighbours, diversify, mmr_order
+from app.hybrid_retrieval import ScoredChunk
+from app.pipeline_components import SmartChunker
+
+
+def _chunk(position, score, vector, **metadata):
+    return ScoredChunk(
+        position=position,
+        chunk_id=str(position),
+        document=Document(page_content=f"Chunk {position}", metadata=metadata),
+        score=score,
+        fused_score=0.0,
+        vector=np.asarray(vector, dtype=np.float32),
+    )
+
+
+class TestMMR:
+    """Tests de la sélection MMR."""
+
+    def test_lambda_one_is_pure_relevance(self):
+        vectors = np.eye(3, dtype=np.float32)
+        assert mmr_order(np.array([0.5, 0.9, 0.7]), vectors, k=3, lambda_mult=1.0) == [1, 2, 0]
+
+    def test_redundant_candidate_is_demoted(self):
+        vectors = np.array([[1.0, 0.0], [0.99, 0.1], [0.0, 1.0]], dtype=np.float32)
+        order = mmr_order(np.array([0.9, 0.88, 0.7]), vectors, k=2, lambda_mult=0.5)
+        assert order == [0, 2]
+
+
+class TestDiversify:
+    """Tests de la fusion des chunks voisins."""
+
+    def test_adjacent_chunks_are_collapsed(self):
+        chunks = [
+            _chunk(0, 0.9, [1.0, 0.0], source_document="a.pdf", chunk_index=4),
+            _chunk(1, 0.89, [0.0, 1.0], source_document="a.pdf", chunk_index=5),
+            _chunk(2, 0.6, [0.7, 0.7], source_document="b.pdf", chunk_index=5),
+        ]
+        assert [c.position for c in diversify(chunks, k=3, lambda_mult=1.0)] == [0, 2]
+
+    def test_text_overlap_fallback(self):
+        text = "L'exposition dépend de trois paramètres : ouverture, vitesse et sensibilité ISO. " * 3
+        a = Document(page_content=text[:150], metadata={"source_document": "a.pdf"})
+        b = Document(page_content=text[90:240], metadata={"source_document": "a.pdf"})
+        c = Document(page_content=text[90:240], metadata={"source_document": "b.pdf"})
+        assert are_neighbours(a, b)
+        assert not are_neighbours(a, c)
+
+    def test_smart_chunker_adds_positions(self):
+        chunker = SmartChunker(chunk_size=100, chunk_overlap=20)
+        docs = chunker.create_chunks({"paragraphes": ["Phrase de test sur la photo. " * 20]}, {"source_document": "a"})
+        assert [doc.metadata["chunk_index"] for doc in docs] == list(range(len(docs)))
+        assert are_neighbours(docs[0], docs[1])
+        assert not are_neighbours(docs[0], docs[2])
@@ -0,0 +1,94 @@
+"""
+Tests pour le LLM factice déterministe (benchmarks et tests de charge).
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.config import settings
+from app.fake_llm import BenchmarkLLM, FakeLLMError
+from app.llm_manager import LLMManager
+
+
+def fast_llm(**kwargs):
+    params = {"ttft_ms": 0, "tokens_per_second": 0, "answer_tokens": 8}
+    params.update(kwargs)
+    return BenchmarkLLM(**params)
+
+
+class TestBenchmarkLLM:
+    """Tests du comportement du LLM factice."""
+
+    def test_same_prompt_same_answer(self):
+        llm = fast_llm()
+        answer = llm.invoke("Quelle ouverture ?")
+        assert answer == fast_llm(seed=7).invoke("Quelle ouverture ?")
+        assert answer != llm.invoke("Quelle vitesse ?")
+        assert len(answer.split(" ")) - 1 == 8
+
+    def test_stream_matches_invoke(self):
+        llm = fast_llm()
+        tokens = list(llm.stream("Quelle ouverture ?"))
+        assert len(tokens) == 8
+        assert "".join(tokens) == llm.invoke("Quelle ouverture ?")
+
+        async def collect():
+            return [token async for token in llm.astream("Quelle ouverture ?")]
+
+        assert asyncio.run(collect()) == tokens
+
+    def test_time_to_first_token_and_throughput(self):
+        llm = fast_llm(ttft_ms=50, tokens_per_second=100, jitter=0, answer_tokens=6)
+        start = time.perf_counter()
+        stream = llm.stream("Quelle ouverture ?")
+        next(stream)
+        ttft = time.perf_counter() - start
+        list(stream)
+        total = time.perf_counter() - start
+        assert 0.045 <= ttft < 0.2
+        assert total >= 0.05 + 5 / 100
+
+    def test_error_injection_is_reproducible(self):
+        def failures(llm):
+            outcomes = []
+            for _ in range(20):
+                try:
+                    llm.invoke("Quelle ouverture ?")
+                    outcomes.append(False)
+                except FakeLLMError:
+                    outcomes.append(True)
+            return outcomes
+
+        first = failures(fast_llm(error_rate=0.5, seed=3))
+        assert any(first) and not all(first)
+        assert failures(fast_llm(error_rate=0.5, seed=3)) == first
+
+    def test_mid_stream_error(self):
+        stream = fast_llm(error_rate=1, error_after_tokens=3).stream("Quelle ouverture ?")
+        assert len([next(stream) for _ in range(3)]) == 3
+        with pytest.raises(FakeLLMError):
+            next(stream)
+
+
+class TestFakeProviderSelection:
+    """Tests de la sélection par variable d'environnement."""
+
+    def test_llm_provider_env_selects_fake_llm(self, monkeypatch):
+        monkeypatch.setenv("LLM_PROVIDER", "fake")
+        monkeypatch.setenv("FAKE_LLM_TTFT_MS", "0")
+        manager = LLMManager()
+        assert manager.default_llm == "fake_default"
+        llm = manager.get_llm()
+        assert isinstance(llm, BenchmarkLLM)
+        assert llm.ttft_ms == 0
+
+    def test_mid_stream_errors_and_no_keep_warm(self, monkeypatch):
+        monkeypatch.setenv("LLM_PROVIDER", "fake")
+        monkeypatch.setenv("FAKE_LLM_ERROR_AFTER_TOKENS", "5")
+        monkeypatch.setattr(settings, "ollama_keep_warm_interval", 60)
+        manager = LLMManager()
+        assert manager.get_llm().error_after_tokens == 5
+        manager.start_keep_warm()
+        assert manager._keep_warm_thread is None
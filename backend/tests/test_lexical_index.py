@@ -0,0 +1,129 @@
+"""
+Tests pour l'index BM25 et la recherche hybride.
+"""
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.hybrid_retrieval import HybridRetriever, ScoredChunk, reciprocal_rank_fusion, select_by_score
+from app.lexical_index import BM25Index, tokenize
+from app.pipeline_components import build_lexical_index, load_or_build_lexical_index
+
+TEXTS = [
+    "L'ouverture f/2.8 donne une faible profondeur de champ.",
+    "Une vitesse de 1/250 fige le mouvement des sujets.",
+    "En basse lumière, montez à ISO 3200 pour garder une vitesse suffisante.",
+    "La règle des tiers aide à composer une image équilibrée.",
+]
+
+
+@pytest.fixture
+def vector_store():
+    docs = [Document(page_content=text, metadata={"source_document": f"doc{i}.txt"}) for i, text in enumerate(TEXTS)]
+    return FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+
+
+class TestTokenize:
+    """Tests du tokenizer."""
+
+    def test_preserves_technical_tokens(self):
+        tokens = tokenize("ISO 3200 à f/2,8 et 1/250s")
+        assert "f/2.8" in tokens
+        assert "1/250" in tokens
+        assert "iso3200" in tokens
+
+    def test_normalizes_aperture_notation(self):
+        assert tokenize("F8")[0] == "f/8"
+
+    def test_removes_stopwords_and_accents(self):
+        assert tokenize("La profondeur de champ") == ["profondeur", "champ"]
+        assert tokenize("Qu'est-ce que l'exposition ?") == ["exposition"]
+
+
+class TestBM25Index:
+    """Tests de l'index BM25."""
+
+    def test_search_exact_technical_token(self):
+        index = BM25Index.build(TEXTS, [str(i) for i in range(len(TEXTS))])
+        results = index.search("réglage à f/2.8", k=2)
+        assert results[0][0] == 0
+
+    def test_search_with_allowed_mask(self):
+        index = BM25Index.build(TEXTS, [str(i) for i in range(len(TEXTS))])
+        results = index.search("vitesse", k=5, allowed=[True, False, True, True])
+        assert [position for position, _ in results] == [2]
+
+    def test_save_and_load(self, tmp_path):
+        index = BM25Index.build(TEXTS, [str(i) for i in range(len(TEXTS))])
+        index.save(tmp_path)
+        loaded = BM25Index.load(tmp_path)
+        assert loaded.doc_ids == index.doc_ids
+        assert loaded.search("ISO 3200", k=1) == index.search("ISO 3200", k=1)
+
+    def test_load_or_build_rebuilds_misaligned_index(self, vector_store, tmp_path):
+        BM25Index.build(["autre"], ["inconnu"]).save(tmp_path)
+        index = load_or_build_lexical_index(vector_store, tmp_path)
+        assert len(index) == len(TEXTS)
+
+
+class TestHybridRetrieval:
+    """Tests de la fusion lexicale + vectorielle."""
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+        assert [position for position, _ in fused][:2] == [1, 3]
+
+    def test_hybrid_retriever_finds_exact_tokens(self):
+        # Plus de documents que k : le chunk « 1/250 » doit être remonté par le BM25
+        texts = [f"Conseil de composition numéro {i} pour le paysage." for i in range(12)] + [TEXTS[1]]
+        docs = [Document(page_content=text) for text in texts]
+        store = FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+        vector_only = HybridRetriever(vector_store=store, k=2, vector_k=1)
+        assert TEXTS[1] not in [doc.page_content for doc in vector_only.invoke("1/250")]
+        retriever = HybridRetriever(vector_store=store, lexical_index=build_lexical_index(store), k=2, vector_k=1)
+        docs = retriever.invoke("1/250")
+        assert len(docs) == 2
+        assert TEXTS[1] in [doc.page_content for doc in docs]
+
+    def test_vector_k_is_the_faiss_k_with_lexical_index(self, vector_store):
+        lexical = build_lexical_index(vector_store)
+        retriever = HybridRetriever(vector_store=vector_store, lexical_index=lexical, k=3, vector_k=1)
+        assert len(retriever.vector_hits("ouverture").positions) == 1
+        # Sans BM25, FAISS reste la seule source : au moins k candidats
+        assert HybridRetriever(vector_store=vector_store, k=3, vector_k=1).vector_search_k == 3
+
+    def test_hybrid_retriever_without_lexical_index(self, vector_store):
+        retriever = HybridRetriever(vector_store=vector_store, k=2)
+        assert len(retriever.invoke("ouverture")) == 2
+
+    def test_retrieve_scored_exact_match(self, vector_store):
+        retriever = HybridRetriever(vector_store=vector_store, k=2)
+        chunks = retriever.retrieve_scored(TEXTS[1], n_candidates=3)
+        assert chunks[0].position == 1
+        assert chunks[0].score == pytest.approx(1.0, abs=1e-4)
+
+
+def _chunks(*scores):
+    return [
+        ScoredChunk(position=i, chunk_id=str(i), document=Document(page_content=""), score=s, fused_score=0.0)
+        for i, s in enumerate(scores)
+    ]
+
+
+class TestScoreSelection:
+    """Tests du seuil de pertinence et du k dynamique."""
+
+    def test_dominant_chunk_kept_alone(self):
+        selected = select_by_score(_chunks(0.9, 0.6, 0.55), threshold=0.3, max_k=3)
+        assert [c.position for c in selected] == [0]
+
+    def test_tight_scores_keep_more_chunks(self):
+        selected = select_by_score(_chunks(0.62, 0.7, 0.65, 0.2), threshold=0.3, max_k=3)
+        assert [c.position for c in selected] == [0, 1, 2]
+
+    def test_threshold_keeps_min_k(self):
+        selected = select_by_score(_chunks(0.1, 0.2), threshold=0.3, min_k=1, max_k=3)
+        assert [c.position for c in selected] == [1]
+        assert select_by_score(_chunks(0.1, 0.2), threshold=0.3, min_k=0) == []
@@ -0,0 +1,182 @@
+"""
+Tests pour le cache des clients LLM et les sessions HTTP keep-alive.
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.config import settings
+from app.llm_clients import ConnectionPools, PooledOllama
+from app.llm_manager import LLMManager, LLMProvider
+from app.metrics import get_metrics_collector
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Serveur Ollama factice (HTTP/1.1, keep-alive) : répond « f/8 » en deux tokens."""
+
+    protocol_version = "HTTP/1.1"
+    load_duration_ns = 2_000_000  # Modèle déjà chargé
+    payloads = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeOllamaHandler.payloads.append(payload)
+        if "prompt" not in payload and "messages" not in payload:
+            # Requête de keep-warm : chargement du modèle seul
+            lines = [{"done": True, "load_duration": self.load_duration_ns}]
+        else:
+            lines = [
+                {"response": "f/", "done": False},
+                {"response": "8", "done": True, "load_duration": self.load_duration_ns},
+            ]
+        body = "".join(json.dumps(line) + "\n" for line in lines).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ollama_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def manager():
+    return LLMManager()
+
+
+@pytest.fixture
+def ollama_manager(ollama_url, monkeypatch):
+    monkeypatch.setenv("OLLAMA_BASE_URL", ollama_url)
+    monkeypatch.delenv("OLLAMA_EXTRA_BASE_URLS", raising=False)
+    monkeypatch.delenv("CASCADE_SMALL_MODEL", raising=False)
+    FakeOllamaHandler.payloads = []
+    return LLMManager()
+
+
+class TestClientCache:
+    """Tests du cache des clients dans LLMManager."""
+
+    def test_same_config_reuses_client(self, manager):
+        first = manager.get_llm()
+        assert manager.get_llm() is first
+        assert isinstance(first, PooledOllama)
+        stats = manager.connection_stats()
+        assert stats["client_hits"] == 1
+        assert stats["client_misses"] == 1
+
+    def test_config_change_rebuilds_client(self, manager):
+        first = manager.get_llm()
+        manager.add_llm("ollama_default", LLMProvider.OLLAMA, "mistral", base_url="http://localhost:11434")
+        second = manager.get_llm()
+        assert second is not first
+        assert second.model == "mistral"
+        # Même session HTTP partagée pour le fournisseur
+        assert second.session is first.session
+
+    def test_idle_clients_are_evicted(self, manager):
+        first = manager.get_llm()
+        manager._pools.idle_timeout = -1
+        assert manager.evict_idle() == 1
+        assert manager.connection_stats()["cached_clients"] == 0
+        assert manager.get_llm() is not first
+
+
+class TestConnectionReuse:
+    """Tests de la réutilisation des connexions keep-alive."""
+
+    def test_requests_share_one_connection(self, ollama_url):
+        pools = ConnectionPools(pool_maxsize=2)
+        llm = PooledOllama(model="llama3", base_url=ollama_url, session=pools.requests_session("ollama"))
+        assert llm.invoke("Quelle ouverture ?") == "f/8"
+        assert "".join(llm.stream("Quelle ouverture ?")) == "f/8"
+
+        stats = pools.stats()["ollama"]
+        assert stats["requests"] == 2
+        assert stats["connections_opened"] == 1
+        assert stats["connections_reused"] == 1
+
+    def test_idle_release_keeps_session_usable(self, ollama_url):
+        pools = ConnectionPools(idle_timeout=-1)
+        llm = PooledOllama(model="llama3", base_url=ollama_url, session=pools.requests_session("ollama"))
+        llm.invoke("Quelle ouverture ?")
+        assert pools.evict_idle() == ["ollama"]
+        assert llm.invoke("Quelle ouverture ?") == "f/8"
+
+        stats = pools.stats()["ollama"]
+        assert stats["requests"] == 2
+        assert stats["connections_opened"] == 2
+        assert stats["idle_releases"] == 1
+
+    def test_async_streams_share_one_session(self, ollama_url):
+        pools = ConnectionPools()
+        llm = PooledOllama(model="llama3", base_url=ollama_url, async_session=lambda: pools.aiohttp_session("ollama"))
+
+        async def ask_twice():
+            answers = [await llm.ainvoke("Quelle ouverture ?") for _ in range(2)]
+            answers.append("".join([token async for token in llm.astream("Quelle ouverture ?")]))
+            await pools.aiohttp_session("ollama").close()
+            return answers
+
+        assert asyncio.run(ask_twice()) == ["f/8", "f/8", "f/8"]
+        stats = pools.stats()["ollama:aiohttp"]
+        assert stats["requests"] == 3
+        assert stats["connections_opened"] == 1
+        assert stats["connections_reused"] == 2
+
+
+class TestKeepAlive:
+    """Tests du maintien en mémoire des modèles Ollama."""
+
+    def test_keep_alive_policy_per_llm(self, ollama_manager, monkeypatch):
+        monkeypatch.setattr(settings, "ollama_keep_alive", "30m")
+        monkeypatch.setattr(settings, "ollama_keep_alive_policy", {"ollama_default": "-1"})
+        llm = ollama_manager.get_llm("ollama_default")
+        # Sans unité : envoyé en entier (Ollama refuse la chaîne « -1 »)
+        assert llm.keep_alive == -1
+        llm.invoke("Quelle ouverture ?")
+        assert FakeOllamaHandler.payloads[-1]["keep_alive"] == -1
+
+        monkeypatch.setattr(settings, "ollama_keep_alive_policy", {"ollama_default": "3600"})
+        assert ollama_manager.keep_alive_for("ollama_default") == 3600
+        assert ollama_manager.keep_alive_for("ollama_other") == "30m"
+
+    def test_keep_warm_skips_unloaded_models(self, ollama_manager, monkeypatch):
+        for keep_alive in ("0", "0s", 0):
+            monkeypatch.setattr(settings, "ollama_keep_alive_policy", {"ollama_default": keep_alive})
+            assert ollama_manager.keep_warm(idle_seconds=0) == []
+        assert FakeOllamaHandler.payloads == []
+
+    def test_model_loads_counted_from_responses(self, ollama_manager, monkeypatch):
+        metrics = get_metrics_collector()
+        before = metrics.get_counter("llm.model_loads", tags={"model": "llama3"})
+        llm = ollama_manager.get_llm("ollama_default")
+        llm.invoke("Quelle ouverture ?")
+        assert metrics.get_counter("llm.model_loads", tags={"model": "llama3"}) == before
+
+        monkeypatch.setattr(FakeOllamaHandler, "load_duration_ns", 3_000_000_000)  # Rechargement de 3 s
+        assert "".join(llm.stream("Quelle ouverture ?")) == "f/8"
+        assert metrics.get_counter("llm.model_loads", tags={"model": "llama3"}) == before + 1
+
+    def test_keep_warm_pings_only_idle_models(self, ollama_manager):
+        assert ollama_manager.keep_warm(idle_seconds=0) == ["ollama_default"]
+        ping = FakeOllamaHandler.payloads[-1]
+        assert "prompt" not in ping and ping["keep_alive"] == ollama_manager.keep_alive_for("ollama_default")
+
+        # Réponse récente : modèle chaud, pas de ping
+        ollama_manager.get_llm("ollama_default").invoke("Quelle ouverture ?")
+        assert ollama_manager.keep_warm(idle_seconds=600) == []
@@ -0,0 +1,120 @@
+"""
+Tests pour le routage LLM (charge, bascule, disjoncteur, requêtes de couverture).
+"""
+
+import asyncio
+
+import pytest
+from langchain_core.language_models import FakeStreamingListLLM
+
+from app.llm_manager import LLMManager
+from app.llm_router import CLOSED, HALF_OPEN, OPEN, LLMRouter, RoutedLLM
+
+
+class FakeManager:
+    """Gestionnaire factice : un LLM par nom d'endpoint."""
+
+    def __init__(self, llms):
+        self.llms = llms
+
+    def get_llm(self, name):
+        return self.llms[name]
+
+
+def fake_llm(response, **kwargs):
+    return FakeStreamingListLLM(responses=[response], **kwargs)
+
+
+class TestLLMRouter:
+    """Tests de la sélection des endpoints."""
+
+    def test_least_loaded_endpoint(self):
+        router = LLMRouter(["gpu-1", "gpu-2"])
+        first = router.acquire()
+        second = router.acquire()
+        assert {first, second} == {"gpu-1", "gpu-2"}
+        router.release(first)
+        assert router.acquire() == first
+
+    def test_prefers_lower_latency(self):
+        router = LLMRouter(["gpu-1", "gpu-2"])
+        router.record_success("gpu-1", 900.0)
+        router.record_success("gpu-2", 100.0)
+        assert router.acquire() == "gpu-2"
+
+    def test_circuit_breaker(self):
+        router = LLMRouter(["gpu-1", "gpu-2"], failure_threshold=2, open_seconds=60)
+        router.record_failure("gpu-1")
+        assert router.states["gpu-1"].circuit == CLOSED
+        router.record_failure("gpu-1")
+        assert router.states["gpu-1"].circuit == OPEN
+        assert router.acquire(exclude=["gpu-2"]) is None
+
+        # Après la durée d'ouverture : un seul appel d'essai
+        router.open_seconds = 0
+        assert router.acquire(exclude=["gpu-2"]) == "gpu-1"
+        assert router.states["gpu-1"].circuit == HALF_OPEN
+        assert router.acquire(exclude=["gpu-2"]) is None
+        router.release("gpu-1")
+        router.record_success("gpu-1", 100.0)
+        assert router.states["gpu-1"].circuit == CLOSED
+
+
+class TestRoutedLLM:
+    """Tests des appels routés."""
+
+    def test_failover_before_first_token(self):
+        router = LLMRouter(["gpu-1", "gpu-2"])
+        router.record_success("gpu-2", 500.0)  # gpu-1 choisi en premier
+        llm = RoutedLLM(
+            router,
+            FakeManager({"gpu-1": fake_llm("panne", error_on_chunk_number=0), "gpu-2": fake_llm("f/8")}),
+        )
+        assert llm.invoke("Quelle ouverture ?") == "f/8"
+        assert router.states["gpu-1"].failures == 1
+        assert all(state.in_flight == 0 for state in router.states.values())
+
+    def test_all_endpoints_failing(self):
+        router = LLMRouter(["gpu-1"])
+        llm = RoutedLLM(router, FakeManager({"gpu-1": fake_llm("panne", error_on_chunk_number=0)}))
+        with pytest.raises(RuntimeError):
+            llm.invoke("Quelle ouverture ?")
+
+    def test_async_failover(self):
+        router = LLMRouter(["gpu-1", "gpu-2"])
+        router.record_success("gpu-2", 500.0)
+        llm = RoutedLLM(
+            router,
+            FakeManager({"gpu-1": fake_llm("panne", error_on_chunk_number=0), "gpu-2": fake_llm("f/8")}),
+        )
+        assert asyncio.run(llm.ainvoke("Quelle ouverture ?")) == "f/8"
+
+    def test_hedged_request_wins(self):
+        router = LLMRouter(["gpu-1", "gpu-2"], hedge_enabled=True, hedge_min_samples=5)
+        for _ in range(5):
+            router.record_ttft("gpu-2", 20.0)
+        router.record_success("gpu-2", 500.0)  # gpu-1 choisi en premier, mais il est lent
+        llm = RoutedLLM(
+            router, FakeManager({"gpu-1": fake_llm("lent", sleep=0.5), "gpu-2": fake_llm("f/8", sleep=0.001)})
+        )
+
+        async def collect():
+            return "".join([chunk async for chunk in llm.astream("Quelle ouverture ?")])
+
+        assert asyncio.run(collect()) == "f/8"
+        assert all(state.in_flight == 0 for state in router.states.values())
+
+
+class TestManagerRouting:
+    """Tests du routage depuis LLMManager."""
+
+    def test_extra_ollama_hosts_enable_routing(self, monkeypatch):
+        monkeypatch.setenv("OLLAMA_EXTRA_BASE_URLS", "http://gpu-2:11434,http://gpu-3:11434")
+        manager = LLMManager()
+        assert manager.router_endpoints() == ["ollama_default", "ollama_2", "ollama_3"]
+        assert isinstance(manager.get_llm(), RoutedLLM)
+        assert manager.get_llm("ollama_2").base_url == "http://gpu-2:11434"
+
+    def test_single_host_is_not_routed(self, monkeypatch):
+        monkeypatch.delenv("OLLAMA_EXTRA_BASE_URLS", raising=False)
+        assert not isinstance(LLMManager().get_llm(), RoutedLLM)
@@ -0,0 +1,74 @@
+"""
+Tests pour la recherche filtrée par métadonnées.
+"""
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.metadata_filter import MetadataIndex, RetrievalFilters
+from app.pipeline_components import build_metadata_index
+from app.vector_search import embed_queries, search_vectors
+
+METADATAS = [
+    {"source_document": "cours.pdf", "section_type": "texte", "confidence_ocr": 0.95},
+    {"source_document": "cours.pdf", "section_type": "legende", "confidence_ocr": 0.4},
+    {"source_document": "manuel.pdf", "section_type": "texte", "confidence_ocr": 0.9},
+    {"source_document": "magazine.pdf", "section_type": "texte", "confidence_ocr": 0.3},
+]
+
+
+@pytest.fixture
+def vector_store():
+    docs = [Document(page_content=f"Chunk {i} sur l'exposition", metadata=m) for i, m in enumerate(METADATAS)]
+    return FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+
+
+class TestRetrievalFilters:
+    """Tests des filtres."""
+
+    def test_from_dict_empty(self):
+        assert RetrievalFilters.from_dict(None) is None
+        assert RetrievalFilters.from_dict({"source_document": [], "section_type": None}) is None
+
+    def test_cache_key_is_order_independent(self):
+        a = RetrievalFilters.from_dict({"source_document": ["a.pdf", "b.pdf"]})
+        b = RetrievalFilters.from_dict({"source_document": ["b.pdf", "a.pdf"]})
+        assert a.cache_key() == b.cache_key()
+
+
+class TestMetadataIndex:
+    """Tests de l'index de métadonnées."""
+
+    def test_mask_combines_fields(self):
+        index = MetadataIndex.build(METADATAS, ["a", "b", "c", "d"])
+        filters = RetrievalFilters(source_documents=("cours.pdf", "manuel.pdf"), section_types=("texte",))
+        assert index.mask(filters).tolist() == [True, False, True, False]
+
+    def test_mask_min_confidence(self):
+        index = MetadataIndex.build(METADATAS, ["a", "b", "c", "d"])
+        assert index.mask(RetrievalFilters(min_confidence_ocr=0.9)).tolist() == [True, False, True, False]
+
+    def test_no_filter_returns_none(self):
+        index = MetadataIndex.build(METADATAS, ["a", "b", "c", "d"])
+        assert index.mask(None) is None
+
+    def test_save_and_load(self, tmp_path):
+        index = MetadataIndex.build(METADATAS, ["a", "b", "c", "d"])
+        index.save(tmp_path)
+        loaded = MetadataIndex.load(tmp_path)
+        filters = RetrievalFilters(source_documents=("magazine.pdf",))
+        assert np.array_equal(loaded.mask(filters), index.mask(filters))
+
+
+class TestFilteredSearch:
+    """Tests du filtrage dans la recherche FAISS."""
+
+    def test_search_respects_mask(self, vector_store):
+        index = build_metadata_index(vector_store)
+        mask = index.mask(RetrievalFilters(source_documents=("manuel.pdf",)))
+        query = embed_queries(vector_store, ["exposition"])
+        _, positions = search_vectors(vector_store, query, k=4, mask=mask)
+        assert [p for p in positions[0] if p >= 0] == [2]
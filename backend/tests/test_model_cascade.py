@@ -0,0 +1,84 @@
+"""
+Tests pour la cascade de modèles (petit modèle pour les questions simples).
+"""
+
+from langchain_core.documents import Document
+
+from app.config import settings
+from app.hybrid_retrieval import ScoredChunk
+from app.llm_manager import LLMManager
+from app.metrics import get_metrics_collector
+from app.model_cascade import ESCALATED, LARGE, SMALL, CascadeDecision, CascadePolicy
+from app.rag_engine import RetrievalResult
+
+
+def retrieval(*scores):
+    chunks = [
+        ScoredChunk(position=i, chunk_id=str(i), document=Document(page_content="ISO"), score=score, fused_score=score)
+        for i, score in enumerate(scores)
+    ]
+    return RetrievalResult(question="", chunks=chunks)
+
+
+class TestCascadePolicy:
+    """Tests de la classification des questions."""
+
+    def setup_method(self):
+        self.policy = CascadePolicy("small", max_words=14, min_score=0.5, min_margin=0.05)
+
+    def test_definition_goes_to_small_model(self):
+        decision = self.policy.classify("Qu'est-ce que l'ISO ?", retrieval(0.8, 0.78))
+        assert decision.tier == SMALL
+        assert decision.llm_name == "small"
+
+    def test_reasoning_goes_to_large_model(self):
+        decision = self.policy.classify("Pourquoi fermer le diaphragme en paysage ?", retrieval(0.9, 0.4))
+        assert decision.tier == LARGE
+        assert decision.llm_name is None
+
+    def test_long_question_goes_to_large_model(self):
+        question = "Quelle ouverture utiliser " + "avec un objectif de 50 mm " * 3 + "?"
+        assert self.policy.classify(question, retrieval(0.9)).tier == LARGE
+
+    def test_low_score_or_ambiguous_retrieval_goes_to_large_model(self):
+        assert self.policy.classify("Quelle vitesse pour un portrait ?", retrieval(0.3)).tier == LARGE
+        assert self.policy.classify("Quelle vitesse pour un portrait ?", retrieval(0.7, 0.69)).tier == LARGE
+        assert self.policy.classify("Quelle vitesse pour un portrait ?", retrieval(0.8, 0.6)).tier == SMALL
+
+    def test_evasive_answer_needs_escalation(self):
+        assert CascadePolicy.needs_escalation("Je ne sais pas, le contexte ne le précise pas.")
+        assert CascadePolicy.needs_escalation("  ")
+        assert not CascadePolicy.needs_escalation("L'ISO mesure la sensibilité du capteur.")
+
+    def test_escalated_latency_is_not_filed_under_small(self):
+        metrics = get_metrics_collector()
+
+        def samples(tier):
+            return metrics.get_histogram_stats("cascade.latency_ms", tags={"tier": tier}).get("count", 0)
+
+        small, escalated = samples(SMALL), samples(ESCALATED)
+        decision = CascadeDecision(tier=SMALL, llm_name="small", reason="définition")
+        CascadePolicy.record(decision, 4000.0, escalated=True)
+        assert samples(SMALL) == small
+        assert samples(ESCALATED) == escalated + 1
+        assert ESCALATED in self.policy.stats()["latency_ms"]
+
+
+class TestManagerCascade:
+    """Tests de l'activation depuis LLMManager."""
+
+    def test_cascade_requires_small_model(self, monkeypatch):
+        monkeypatch.setattr(settings, "cascade_enabled", True)
+        monkeypatch.delenv("CASCADE_SMALL_MODEL", raising=False)
+        assert LLMManager().get_cascade() is None
+
+        monkeypatch.setenv("CASCADE_SMALL_MODEL", "llama3.2:1b")
+        manager = LLMManager()
+        assert manager.llms["ollama_small"].model_name == "llama3.2:1b"
+        assert manager.get_cascade().small_llm == "ollama_small"
+        assert "ollama_small" not in manager.router_endpoints()
+
+    def test_cascade_disabled_by_default(self, monkeypatch):
+        monkeypatch.setattr(settings, "cascade_enabled", False)
+        monkeypatch.setenv("CASCADE_SMALL_MODEL", "llama3.2:1b")
+        assert LLMManager().get_cascade() is None
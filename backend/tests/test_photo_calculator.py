@@ -0,0 +1,155 @@
+"""
+Tests pour le calculateur d'exposition (voie rapide sans LLM).
+"""
+
+import asyncio
+
+import pytest
+
+from app import rag_pipeline
+from app.config import settings
+from app.metrics import get_metrics_collector
+from app.photo_calculator import EQUIVALENT, EV, HYPERFOCAL, STOPS, calculate, parse_values
+
+
+class TestParsing:
+    """Tests du relevé des valeurs."""
+
+    def test_parse_exposure_values(self):
+        values = parse_values("À f/2,8 et 1/125 s à ISO 400, puis f8 et 2\" à 100 ISO avec un 50 mm")
+        assert values.apertures == [2.8, 8.0]
+        assert values.shutters == [1 / 125, 2.0]
+        assert values.isos == [400, 100]
+        assert values.focals == [50.0]
+
+    def test_shutter_fraction_is_not_an_iso(self):
+        values = parse_values("f/4 à 1/60 ISO 400")
+        assert values.shutters == [1 / 60]
+        assert values.isos == [400]
+
+
+class TestCalculations:
+    """Tests des réponses calculées."""
+
+    def test_equivalent_shutter_for_new_aperture(self):
+        calculation = calculate("À f/2.8 et 1/125, quelle vitesse à f/8 ?")
+        assert calculation.intent == EQUIVALENT
+        assert calculation.values["shutter"] == pytest.approx(1 / 125 * (8 / 2.8) ** 2)
+        assert calculation.values["standard_shutter"] == pytest.approx(1 / 15)
+
+    def test_equivalent_aperture_for_new_shutter(self):
+        calculation = calculate("f/8 à 2s, quelle ouverture à 8s pour la même exposition ?")
+        assert calculation.values["aperture"] == pytest.approx(16.0)
+        assert "f/16" in calculation.answer
+
+    def test_equivalent_shutter_for_new_iso(self):
+        calculation = calculate("Exposition équivalente de f/4 à 1/60 ISO 400 si je passe à ISO 1600 ?")
+        assert calculation.values["shutter"] == pytest.approx(1 / 240)
+        assert "1/250 s" in calculation.answer
+
+    def test_target_setting_named_first(self):
+        calculation = calculate("Quelle vitesse à f/4 si je suis à f/2.8 et 1/250 ?")
+        assert calculation.values["shutter"] == pytest.approx(1 / 250 * (4 / 2.8) ** 2)
+        assert "à f/4" in calculation.answer
+        assert calculate("Quelle vitesse à f/8 si je suis à f/4 et 1s ?").values["shutter"] == pytest.approx(4.0)
+        calculation = calculate("quelle ouverture à 1/30 si je suis à f/4 et 1/125")
+        assert calculation.values["aperture"] == pytest.approx(4 * (125 / 30) ** 0.5)
+        assert calculation.values["standard_aperture"] == 8.0
+        calculation = calculate("Quelle vitesse à ISO 800 si je suis à ISO 100, f/8 et 1/60 ?")
+        assert calculation.values["shutter"] == pytest.approx(1 / 480)
+        assert "à ISO 800" in calculation.answer
+
+    def test_from_to_wording_sets_the_order(self):
+        calculation = calculate("Si je passe de f/2.8 à f/8, quelle vitesse avec 1/125 ?")
+        assert calculation.values["shutter"] == pytest.approx(1 / 125 * (8 / 2.8) ** 2)
+
+    def test_unclear_order_falls_back(self):
+        assert calculate("Exposition équivalente f/2.8 1/125 f/8 ?") is None
+
+    def test_long_exposure_has_no_standard_hint(self):
+        calculation = calculate("Quelle vitesse à f/16 si je suis à f/2 et 2s ?")
+        assert calculation.values["shutter"] == pytest.approx(128.0)
+        assert "standard_shutter" not in calculation.values
+        assert "valeur standard" not in calculation.answer
+
+    def test_stops_between_apertures(self):
+        calculation = calculate("Combien de stops entre f/2.8 et f/8 ?")
+        assert calculation.intent == STOPS
+        assert calculation.values["stops"] == pytest.approx(2 * 1.5146, abs=1e-3)
+        assert "3 stops" in calculation.answer
+
+    def test_stops_between_isos(self):
+        assert calculate("Combien de stops entre ISO 100 et ISO 3200 ?").values["stops"] == pytest.approx(5.0)
+
+    def test_exposure_value(self):
+        calculation = calculate("Quelle est l'EV de f/8 à 1/250 à ISO 400 ?")
+        assert calculation.intent == EV
+        assert calculation.values["ev"] == pytest.approx(13.97, abs=0.01)
+        assert calculation.values["ev100"] == pytest.approx(11.97, abs=0.01)
+
+    def test_hyperfocal_distance(self):
+        calculation = calculate("Quelle est l'hyperfocale d'un 24mm à f/8 en APS-C ?")
+        assert calculation.intent == HYPERFOCAL
+        assert calculation.values["coc_mm"] == 0.02
+        assert calculation.values["hyperfocal_m"] == pytest.approx((24**2 / (8 * 0.02) + 24) / 1000)
+
+    def test_ordinary_questions_are_not_calculated(self):
+        assert calculate("Quel objectif choisir pour le paysage ?") is None
+        # « il » pronom : pas une question d'exposition
+        assert calculate("Quelle vitesse faut-il pour un portrait ?") is None
+
+    def test_judgement_questions_are_not_calculated(self):
+        # Pas d'unité de stop : la différence porte sur le rendu
+        assert calculate("Quelle est la différence entre f/2.8 et f/4 pour le bokeh ?") is None
+        # Ouverture demandée alors que les valeurs donneraient une vitesse
+        assert calculate("Quelle ouverture choisir entre f/1.8 et f/2.8 pour un portrait à 1/200 ?") is None
+        # Choix entre deux réglages
+        assert calculate("Quelle vitesse pour un filé à 1/30 avec f/8 ou f/11 ?") is None
+
+    def test_asked_quantity_must_match_the_calculation(self):
+        assert calculate("À f/2.8 et 1/125, quelle ouverture à f/8 ?") is None
+        assert calculate("Différence en stops entre f/2.8 et f/4 ?").intent == STOPS
+
+    def test_missing_values_fall_back_and_are_counted(self):
+        metrics = get_metrics_collector()
+        before = metrics.get_counter("calculator.fallbacks", tags={"intent": HYPERFOCAL})
+        assert calculate("Comment calculer la distance hyperfocale à f/11 ?") is None
+        assert metrics.get_counter("calculator.fallbacks", tags={"intent": HYPERFOCAL}) == before + 1
+
+
+class TestFastPath:
+    """Tests de la voie rapide devant le pipeline RAG."""
+
+    @pytest.fixture(autouse=True)
+    def no_rag(self, monkeypatch):
+        monkeypatch.setattr(settings, "calculator_enabled", True)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("Le RAG ne doit pas être appelé")
+
+        monkeypatch.setattr(rag_pipeline, "_answer_question", fail)
+        monkeypatch.setattr(rag_pipeline, "_prepare_stream", fail)
+
+    def test_answer_question_skips_rag(self):
+        metrics = get_metrics_collector()
+        before = metrics.get_counter("calculator.hits", tags={"intent": STOPS})
+        result = rag_pipeline.answer_question("Combien de stops entre f/4 et f/8 ?")
+        assert result["fast_path"] == STOPS
+        assert result["sources"] == []
+        assert "2 stops" in result["answer"]
+        assert metrics.get_counter("calculator.hits", tags={"intent": STOPS}) == before + 1
+
+    def test_async_stream_format(self):
+        async def collect():
+            return [item async for item in rag_pipeline.answer_question_stream_async("EV de f/8 à 1/250 ?")]
+
+        items = asyncio.run(collect())
+        assert items[0] == {"early_sources": []}
+        assert isinstance(items[1], str) and "EV" in items[1]
+        assert items[-1]["full_answer"] == items[1]
+        assert items[-1]["sources"] == []
+
+    def test_disabled_calculator_uses_rag(self, monkeypatch):
+        monkeypatch.setattr(settings, "calculator_enabled", False)
+        with pytest.raises(AssertionError):
+            rag_pipeline.answer_question("Combien de stops entre f/4 et f/8 ?")
@@ -0,0 +1,83 @@
+"""
+Tests pour le micro-batching des requêtes de retrieval.
+"""
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.metrics import get_metrics_collector
+from app.query_batcher import QueryBatcher
+from app.vector_search import embed_queries, search_vectors
+
+
+@pytest.fixture
+def vector_store():
+    docs = [Document(page_content=f"Chunk numéro {i}", metadata={}) for i in range(20)]
+    return FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+
+
+class TestQueryBatcher:
+    """Tests du micro-batcher."""
+
+    def test_results_match_direct_search(self, vector_store):
+        batcher = QueryBatcher(window_ms=1, max_batch=8)
+        hits = batcher.search(vector_store, "Chunk numéro 3", k=3)
+        _, positions = search_vectors(vector_store, embed_queries(vector_store, ["Chunk numéro 3"]), 3)
+        assert hits.positions.tolist() == positions[0].tolist()
+
+    def test_concurrent_queries_are_batched(self, vector_store):
+        batcher = QueryBatcher(window_ms=100, max_batch=32)
+        questions = [f"Chunk numéro {i}" for i in range(10)]
+        futures = [batcher.submit(vector_store, q, k=2 + i % 3) for i, q in enumerate(questions)]
+        results = [f.result(timeout=5) for f in futures]
+
+        for i, hits in enumerate(results):
+            assert len(hits.positions) == 2 + i % 3
+            assert hits.positions[0] == i
+        stats = get_metrics_collector().get_histogram_stats("retrieval.batch_size")
+        assert stats["max"] > 1
+
+    def test_masked_queries(self, vector_store):
+        batcher = QueryBatcher(window_ms=20)
+        mask = np.zeros(20, dtype=bool)
+        mask[[5, 6]] = True
+        masked = batcher.submit(vector_store, "Chunk numéro 1", k=4, mask=mask)
+        unmasked = batcher.submit(vector_store, "Chunk numéro 1", k=4)
+        assert set(p for p in masked.result(timeout=5).positions if p >= 0) <= {5, 6}
+        assert unmasked.result(timeout=5).positions[0] == 1
+
+    def test_identical_masks_share_one_search(self, vector_store, monkeypatch):
+        from app import query_batcher
+
+        searches = []
+
+        def counting_search(store, vectors, k, mask=None):
+            searches.append(len(vectors))
+            return search_vectors(store, vectors, k, mask=mask)
+
+        monkeypatch.setattr(query_batcher, "search_vectors", counting_search)
+        batcher = QueryBatcher(window_ms=100)
+        masks = [np.zeros(20, dtype=bool) for _ in range(3)]
+        for mask in masks:
+            mask[[5, 6]] = True
+        futures = [batcher.submit(vector_store, f"Chunk numéro {i}", k=2, mask=mask) for i, mask in enumerate(masks)]
+        for future in futures:
+            assert set(p for p in future.result(timeout=5).positions if p >= 0) <= {5, 6}
+        assert searches == [3]
+
+
+class PrefixedEmbedding(DeterministicFakeEmbedding):
+    """Embedder qui encode différemment questions et documents (préfixe « query: »)."""
+
+    def embed_query(self, text):
+        return super().embed_query("query: " + text)
+
+
+def test_embed_queries_uses_query_semantics_for_any_batch_size():
+    store = FAISS.from_documents([Document(page_content="Chunk")], PrefixedEmbedding(size=16))
+    questions = ["Chunk numéro 1", "Chunk numéro 2"]
+    single = np.vstack([embed_queries(store, [question]) for question in questions])
+    assert np.allclose(embed_queries(store, questions), single)
@@ -9,6 +9,7 @@ from unittest.mock import Mock, patch, MagicMock
 from app.rag_pipeline import (
     answer_question,
     answer_question_stream,
+    answer_questions,
     _load_or_build_vector_store,
     _build_vector_store_from_raw_documents,
 )
@@ -85,6 +86,82 @@ class TestRAGPipeline:
                 pytest.skip(f"Ollama non disponible: {e}")
 
 
+class TestBatchAnswer:
+    """Tests de la version batch du RAG."""
+
+    def test_answer_questions_batches_retrieval(self):
+        from langchain_community.vectorstores import FAISS
+        from langchain_core.documents import Document
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        docs = [
+            Document(page_content=f"Chunk {i} sur l'ISO", metadata={"source_document": "cours.pdf"}) for i in range(5)
+        ]
+        vector_store = FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+        with patch("app.rag_pipeline._load_or_build_vector_store", return_value=vector_store), patch(
+            "app.rag_pipeline._load_lexical_index", return_value=None
+        ), patch("app.rag_engine.RAGEngine.generate", lambda self, q, retrieval, tier=None: f"Réponse à {q}"):
+            batch = answer_questions(["Chunk 1 sur l'ISO", "Chunk 1 sur l'ISO", "Chunk 3 sur l'ISO"], num_docs=2)
+
+        assert [r["answer"] for r in batch["results"]] == [
+            "Réponse à Chunk 1 sur l'ISO",
+            "Réponse à Chunk 1 sur l'ISO",
+            "Réponse à Chunk 3 sur l'ISO",
+        ]
+        assert all(1 <= r["num_sources"] <= 2 for r in batch["results"])
+        assert all(r["sources"][0]["score"] is not None for r in batch["results"])
+        assert batch["num_unique_chunks"] < 6
+        assert {"embedding_ms", "search_ms", "generation_ms", "total_ms"} <= set(batch["timings"])
+
+    def test_failed_generation_only_affects_its_question(self):
+        from langchain_community.vectorstores import FAISS
+        from langchain_core.documents import Document
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        docs = [
+            Document(page_content=f"Chunk {i} sur l'ISO", metadata={"source_document": "cours.pdf"}) for i in range(5)
+        ]
+        vector_store = FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+
+        def generate(self, question, retrieval, tier=None):
+            if "3" in question:
+                raise RuntimeError("LLM indisponible")
+            return f"Réponse à {question}"
+
+        with patch("app.rag_pipeline._load_or_build_vector_store", return_value=vector_store), patch(
+            "app.rag_pipeline._load_lexical_index", return_value=None
+        ), patch("app.rag_engine.RAGEngine.generate", generate):
+            batch = answer_questions(["Chunk 1 sur l'ISO", "Chunk 3 sur l'ISO"], num_docs=2)
+
+        ok, failed = batch["results"]
+        assert ok["answer"] == "Réponse à Chunk 1 sur l'ISO" and "error" not in ok
+        assert failed["answer"] == "" and failed["error"] == "LLM indisponible"
+        assert batch["num_errors"] == 1
+
+    def test_admission_rejection_fails_the_whole_batch(self):
+        from langchain_community.vectorstores import FAISS
+        from langchain_core.documents import Document
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        from app.admission import AdmissionRejected
+
+        docs = [
+            Document(page_content=f"Chunk {i} sur l'ISO", metadata={"source_document": "cours.pdf"}) for i in range(5)
+        ]
+        vector_store = FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+
+        def generate(self, question, retrieval, tier=None):
+            raise AdmissionRejected(503, 7, "Temps d'attente dépassé")
+
+        with patch("app.rag_pipeline._load_or_build_vector_store", return_value=vector_store), patch(
+            "app.rag_pipeline._load_lexical_index", return_value=None
+        ), patch("app.rag_engine.RAGEngine.generate", generate):
+            with pytest.raises(AdmissionRejected) as exc:
+                answer_questions(["Chunk 1 sur l'ISO", "Chunk 3 sur l'ISO"], num_docs=2, tier="batch")
+
+        assert exc.value.status_code == 503 and exc.value.retry_after == 7
+
+
 class TestVectorStore:
     """Tests du vector store."""
 
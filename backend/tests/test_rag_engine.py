@@ -0,0 +1,129 @@
+"""
+Tests pour le moteur RAG réutilisable.
+"""
+
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeStreamingListLLM
+
+from app.loop_monitor import EventLoopLagMonitor
+from app.rag_engine import clear_rag_engines, get_rag_engine
+
+
+@pytest.fixture
+def vector_store():
+    docs = [
+        Document(page_content=f"Chunk {i} sur la vitesse", metadata={"source_document": "cours.pdf"}) for i in range(4)
+    ]
+    return FAISS.from_documents(docs, DeterministicFakeEmbedding(size=16))
+
+
+@pytest.fixture
+def fake_llm():
+    llm = FakeStreamingListLLM(responses=["Utilisez 1/500."])
+    with patch("app.llm_manager.LLMManager.get_llm", return_value=llm) as get_llm:
+        clear_rag_engines()
+        yield get_llm
+        clear_rag_engines()
+
+
+class TestRAGEngine:
+    """Tests du moteur RAG."""
+
+    def test_engine_is_cached_per_version_and_k(self, vector_store, fake_llm):
+        engine = get_rag_engine(vector_store, index_version=1, k=2)
+        assert get_rag_engine(vector_store, index_version=1, k=2) is engine
+        assert get_rag_engine(vector_store, index_version=1, k=3) is not engine
+        assert get_rag_engine(vector_store, index_version=2, k=2) is not engine
+        assert fake_llm.call_count == 3
+
+    def test_blocking_and_streaming_share_retrieval(self, vector_store, fake_llm):
+        engine = get_rag_engine(vector_store, index_version=1, k=2)
+        with patch.object(engine.retriever.__class__, "vector_hits", wraps=engine.retriever.vector_hits) as hits:
+            retrieval = engine.retrieve("Chunk 1 sur la vitesse")
+            streamed = "".join(engine.stream("Chunk 1 sur la vitesse", retrieval))
+            answer = engine.generate("Chunk 1 sur la vitesse", retrieval)
+        assert hits.call_count == 1
+        assert streamed == "Utilisez 1/500."
+        assert answer == "Utilisez 1/500."
+        assert retrieval.sources[0]["document"] == "cours.pdf"
+
+
+class TestAsyncStreaming:
+    """Tests du chemin de streaming asynchrone."""
+
+    def test_astream_matches_stream(self, vector_store, fake_llm):
+        engine = get_rag_engine(vector_store, index_version=1, k=2)
+        retrieval = engine.retrieve("Chunk 1 sur la vitesse")
+
+        async def collect():
+            return [token async for token in engine.astream("Chunk 1 sur la vitesse", retrieval)]
+
+        tokens = asyncio.run(collect())
+        assert len(tokens) > 1
+        assert "".join(tokens) == "Utilisez 1/500."
+        assert asyncio.run(engine.agenerate("Chunk 1 sur la vitesse", retrieval)) == "Utilisez 1/500."
+
+    def test_sources_sent_before_first_token(self, vector_store, fake_llm):
+        from app import rag_pipeline
+
+        engine = get_rag_engine(vector_store, index_version=1, k=2)
+        retrieval = engine.retrieve("Chunk 1 sur la vitesse")
+
+        async def collect():
+            stream = rag_pipeline._answer_question_stream_async("Chunk 1 sur la vitesse")
+            return [item async for item in stream]
+
+        with patch.object(rag_pipeline, "_prepare_stream", return_value=(engine, retrieval, 0.0, None)), patch.object(
+            rag_pipeline, "_semantic_cache_store"
+        ):
+            items = asyncio.run(collect())
+
+        assert items[0] == {"early_sources": retrieval.sources}
+        assert "".join(item for item in items if isinstance(item, str)) == "Utilisez 1/500."
+        timings = items[-1]["timings"]
+        assert timings["sources"] <= timings["first_token"] <= timings["last_token"]
+
+    def test_stream_failure_after_tokens_is_not_regenerated(self, vector_store, fake_llm):
+        from app import rag_pipeline
+
+        engine = get_rag_engine(vector_store, index_version=1, k=2)
+        retrieval = engine.retrieve("Chunk 1 sur la vitesse")
+        regenerated = []
+
+        def broken_stream(question, retrieval, tier=None):
+            yield "Utilisez "
+            raise ConnectionError("flux coupé")
+
+        with patch.object(rag_pipeline, "_prepare_stream", return_value=(engine, retrieval, 0.0, None)), patch.object(
+            engine, "stream", broken_stream
+        ), patch.object(engine, "generate", lambda *args, **kwargs: regenerated.append(1) or "Autre réponse"):
+            items = []
+            with pytest.raises(RuntimeError):
+                for item in rag_pipeline._answer_question_stream("Chunk 1 sur la vitesse"):
+                    items.append(item)
+
+        # Le token déjà envoyé n'est pas suivi d'une seconde réponse complète
+        assert [item for item in items if isinstance(item, str)] == ["Utilisez "]
+        assert regenerated == []
+
+    def test_loop_monitor_detects_blocking_call(self):
+        monitor = EventLoopLagMonitor(interval=0.01)
+
+        async def scenario():
+            monitor.start()
+            await asyncio.sleep(0.05)
+            time.sleep(0.2)  # Appel bloquant exécuté sur la boucle
+            await asyncio.sleep(0.05)
+            await monitor.stop()
+
+        asyncio.run(scenario())
+        assert monitor.samples > 0
+        assert monitor.max_lag_ms >= 150
+        assert not monitor.running
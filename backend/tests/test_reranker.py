@@ -0,0 +1,64 @@
+"""
+Tests pour le reranking cross-encoder.
+"""
+
+import pytest
+from langchain_core.documents import Document
+
+from app.hybrid_retrieval import ScoredChunk, select_by_score
+from app.metrics import get_metrics_collector
+from app.reranker import CrossEncoderReranker
+
+
+class FakeCrossEncoder:
+    """Cross-encoder factice : score = présence du mot 'diaphragme'."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size=16, show_progress_bar=False):
+        self.calls.append(len(pairs))
+        return [0.9 if "diaphragme" in text else 0.1 for _, text in pairs]
+
+
+@pytest.fixture
+def reranker():
+    reranker = CrossEncoderReranker(model_name="fake", cache_size=3)
+    reranker.enabled = True
+    reranker._model = FakeCrossEncoder()
+    return reranker
+
+
+def _chunks():
+    texts = ["La vitesse d'obturation", "Le diaphragme règle l'ouverture", "La sensibilité ISO"]
+    return [
+        ScoredChunk(position=i, chunk_id=f"id{i}", document=Document(page_content=t), score=0.8 - i / 10, fused_score=0)
+        for i, t in enumerate(texts)
+    ]
+
+
+class TestCrossEncoderReranker:
+    """Tests du reranker."""
+
+    def test_rerank_orders_by_cross_encoder_score(self, reranker):
+        reranked = reranker.rerank("Qu'est-ce que l'ouverture ?", _chunks())
+        assert reranked[0].chunk_id == "id1"
+        assert reranked[0].relevance == pytest.approx(0.9)
+        assert [c.chunk_id for c in select_by_score(reranked, threshold=0.3)] == ["id1"]
+        assert get_metrics_collector().get_timer_stats("retrieval.rerank_latency")["count"] >= 1
+
+    def test_single_batched_call_and_cache(self, reranker):
+        reranker.rerank("ouverture", _chunks())
+        reranker.rerank("ouverture", _chunks())
+        assert reranker._model.calls == [3]
+
+    def test_cache_is_bounded(self, reranker):
+        reranker.rerank("ouverture", _chunks())
+        reranker.rerank("vitesse", _chunks()[:1])
+        assert len(reranker._cache) == 3
+        reranker.rerank("ouverture", _chunks())
+        assert reranker._model.calls == [3, 1, 1]
+
+    def test_disabled_keeps_order(self):
+        reranker = CrossEncoderReranker(model_name="fake", enabled=False)
+        assert [c.chunk_id for c in reranker.rerank("ouverture", _chunks())] == ["id0", "id1", "id2"]
@@ -0,0 +1,67 @@
+"""
+Tests pour le cache sémantique des réponses.
+"""
+
+import numpy as np
+import pytest
+
+from app.semantic_cache import SemanticCache
+
+RESULT = {"answer": "L'ISO mesure la sensibilité du capteur.", "sources": [], "num_sources": 0}
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+@pytest.fixture
+def cache():
+    return SemanticCache(threshold=0.9, max_entries=3, sample_rate=1.0)
+
+
+class TestSemanticCache:
+    """Tests du cache de réponses par similarité."""
+
+    def test_close_question_hits(self, cache):
+        cache.store("Qu'est-ce que l'ISO ?", vector(1.0, 0.0, 0.0), RESULT, version=1)
+        hit = cache.lookup("C'est quoi l'ISO ?", vector(0.95, 0.1, 0.0), version=1)
+        assert hit is not None
+        result, similarity = hit
+        assert result == RESULT
+        assert similarity > 0.9
+        assert cache.stats()["hits"] == 1
+
+    def test_distant_question_misses(self, cache):
+        cache.store("Qu'est-ce que l'ISO ?", vector(1.0, 0.0, 0.0), RESULT, version=1)
+        assert cache.lookup("Qu'est-ce que la focale ?", vector(0.0, 1.0, 0.0), version=1) is None
+        stats = cache.stats()
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.0
+
+    def test_namespaces_are_isolated(self, cache):
+        cache.store("Qu'est-ce que l'ISO ?", vector(1.0, 0.0, 0.0), RESULT, version=1, namespace=("manuel.pdf", 3))
+        assert cache.lookup("Qu'est-ce que l'ISO ?", vector(1.0, 0.0, 0.0), version=1, namespace=(None, 3)) is None
+
+    def test_new_index_version_invalidates(self, cache):
+        cache.store("Qu'est-ce que l'ISO ?", vector(1.0, 0.0, 0.0), RESULT, version=1)
+        assert cache.lookup("Qu'est-ce que l'ISO ?", vector(1.0, 0.0, 0.0), version=2) is None
+        assert cache.stats()["entries"] == 0
+
+    def test_expired_entries_miss(self, cache):
+        cache.ttl = -1
+        cache.store("Qu'est-ce que l'ISO ?", vector(1.0, 0.0, 0.0), RESULT, version=1)
+        assert cache.lookup("Qu'est-ce que l'ISO ?", vector(1.0, 0.0, 0.0), version=1) is None
+
+    def test_eviction_keeps_max_entries(self, cache):
+        for i in range(5):
+            cache.store(f"Question {i}", vector(float(i), 1.0, 0.0), RESULT, version=1)
+        assert cache.stats()["entries"] == 3
+        assert cache.lookup("Question 0", vector(0.0, 1.0, 0.0), version=1) is None
+
+    def test_hits_and_near_misses_are_sampled(self, cache):
+        cache.store("Qu'est-ce que l'ISO ?", vector(1.0, 0.0, 0.0), RESULT, version=1)
+        cache.lookup("C'est quoi l'ISO ?", vector(1.0, 0.05, 0.0), version=1)
+        cache.lookup("L'ISO en basse lumière ?", vector(1.0, 0.55, 0.0), version=1)
+        samples = cache.stats()["samples"]
+        assert [sample["kind"] for sample in samples] == ["hit", "near_miss"]
+        assert samples[0]["cached_question"] == "Qu'est-ce que l'ISO ?"
@@ -0,0 +1,120 @@
+"""
+Tests pour l'index vectoriel shardé.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.pipeline_components import DocumentCollector, VectorStoreManager
+from app.sharded_index import ShardedVectorStore
+from app.vector_search import documents_at, embed_queries, search_vectors
+
+COLLECTIONS = {
+    "cours": [f"Cours {i} sur l'exposition" for i in range(6)],
+    "manuels": [f"Manuel {i} du boîtier" for i in range(4)],
+    "magazines": [f"Magazine {i} de reportage" for i in range(5)],
+}
+
+
+@pytest.fixture
+def embedding():
+    return DeterministicFakeEmbedding(size=16)
+
+
+@pytest.fixture
+def shards(embedding):
+    return {
+        name: FAISS.from_documents([Document(page_content=t, metadata={"collection": name}) for t in texts], embedding)
+        for name, texts in COLLECTIONS.items()
+    }
+
+
+@pytest.fixture
+def sharded(shards):
+    return ShardedVectorStore(shards, executor=ThreadPoolExecutor(max_workers=3))
+
+
+@pytest.fixture
+def monolithic(embedding):
+    texts = [t for name in sorted(COLLECTIONS) for t in COLLECTIONS[name]]
+    return FAISS.from_documents([Document(page_content=t) for t in texts], embedding)
+
+
+class TestShardedSearch:
+    """Tests de la recherche distribuée."""
+
+    def test_matches_monolithic_index(self, sharded, monolithic):
+        queries = embed_queries(sharded, ["Manuel 2 du boîtier", "Cours 5 sur l'exposition"])
+        distances, positions = search_vectors(sharded, queries, k=5)
+        expected_distances, expected_positions = search_vectors(monolithic, queries, k=5)
+        assert positions.tolist() == expected_positions.tolist()
+        assert np.allclose(distances, expected_distances, atol=1e-5)
+        assert documents_at(sharded, positions[0])[0].page_content == "Manuel 2 du boîtier"
+
+    def test_mask_spans_shards(self, sharded):
+        ranges = sharded.shard_ranges()
+        mask = np.zeros(sharded.index.ntotal, dtype=bool)
+        start, _ = ranges["manuels"]
+        mask[start + 1] = True
+        _, positions = search_vectors(sharded, embed_queries(sharded, ["Cours 1"]), k=3, mask=mask)
+        assert positions[0].tolist() == [start + 1, -1, -1]
+
+    def test_reconstruct_batch(self, sharded, monolithic):
+        positions = [0, 7, 14, 3]
+        assert np.allclose(sharded.index.reconstruct_batch(positions), monolithic.index.reconstruct_batch(positions))
+
+    def test_langchain_similarity_search(self, sharded):
+        assert sharded.similarity_search("Magazine 3 de reportage", k=1)[0].page_content == "Magazine 3 de reportage"
+
+
+class TestShardedWrites:
+    """Tests des ajouts routés vers les shards."""
+
+    def test_add_texts_routes_to_collection_shards(self, sharded):
+        ids = sharded.add_texts(
+            ["Manuel 9 du flash", "Nouveau tutoriel de retouche"],
+            metadatas=[{"collection": "manuels"}, {"collection": "tutoriels"}],
+        )
+        ranges = sharded.shard_ranges()
+        assert ranges["manuels"][1] - ranges["manuels"][0] == 5
+        assert ranges["tutoriels"][1] - ranges["tutoriels"][0] == 1
+        assert sharded.index.ntotal == 17
+        assert [sharded.docstore.search(doc_id).page_content for doc_id in ids] == [
+            "Manuel 9 du flash",
+            "Nouveau tutoriel de retouche",
+        ]
+        assert sharded.similarity_search("Manuel 9 du flash", k=1)[0].page_content == "Manuel 9 du flash"
+
+    def test_add_documents_without_collection_uses_default_shard(self, sharded):
+        sharded.add_documents([Document(page_content="Astuce sans collection")])
+        start, end = sharded.shard_ranges()["general"]
+        assert end - start == 1
+        assert documents_at(sharded, [start])[0].page_content == "Astuce sans collection"
+
+
+class TestShardStorage:
+    """Tests de la sauvegarde shard par shard."""
+
+    def test_save_load_and_rebuild_single_shard(self, sharded, embedding, tmp_path):
+        manager = VectorStoreManager(storage_dir=tmp_path, embedding_model=embedding)
+        manager.save(sharded)
+        assert manager.list_shards() == ["cours", "magazines", "manuels"]
+
+        untouched = (tmp_path / "shards" / "cours" / "index.faiss").stat().st_mtime_ns
+        manager.save_shard("manuels", FAISS.from_texts(["Nouveau manuel"], embedding))
+        assert (tmp_path / "shards" / "cours" / "index.faiss").stat().st_mtime_ns == untouched
+
+        loaded = manager.load()
+        assert isinstance(loaded, ShardedVectorStore)
+        assert loaded.index.ntotal == 6 + 5 + 1
+        assert loaded.similarity_search("Nouveau manuel", k=1)[0].page_content == "Nouveau manuel"
+
+    def test_collection_of(self, tmp_path):
+        collector = DocumentCollector(root_dir=tmp_path)
+        assert collector.collection_of(tmp_path / "manuels" / "x100v.pdf") == "manuels"
+        assert collector.collection_of(tmp_path / "cours.pdf") == "general"
@@ -0,0 +1,168 @@
+"""
+Tests pour la coalescence des questions identiques en cours.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.single_flight import SingleFlight, normalize_question
+
+TOKENS = ["Ouvrez ", "à ", "f/2.8", {"sources": []}]
+
+
+class TestSingleFlight:
+    """Tests du regroupement des appels concurrents."""
+
+    def test_normalize_question(self):
+        assert normalize_question("  Qu'est-ce que   l'ISO ?") == normalize_question("qu'est-ce que l'iso")
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def generate():
+            calls.append(1)
+            release.wait(1)
+            return {"answer": "1/500"}
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(flight.do, "question", generate) for _ in range(5)]
+            time.sleep(0.1)
+            release.set()
+            results = [future.result() for future in futures]
+
+        assert len(calls) == 1
+        assert all(result == {"answer": "1/500"} for result in results)
+        assert flight.in_flight() == 0
+
+    def test_errors_reach_every_caller(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def failing():
+            release.wait(1)
+            raise RuntimeError("LLM indisponible")
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(flight.do, "question", failing) for _ in range(3)]
+            time.sleep(0.1)
+            release.set()
+            for future in futures:
+                with pytest.raises(RuntimeError):
+                    future.result()
+
+    def test_stream_subscribers_replay_from_start(self):
+        flight = SingleFlight()
+        started = []
+
+        def tokens():
+            started.append(1)
+            for token in TOKENS:
+                time.sleep(0.02)
+                yield token
+
+        first = flight.stream("question", tokens)
+        assert next(first) == "Ouvrez "
+        second = flight.stream("question", tokens)
+        assert list(second) == TOKENS
+        assert ["Ouvrez ", *first] == TOKENS
+        assert len(started) == 1
+
+    def test_stream_stopped_when_last_subscriber_leaves(self):
+        flight = SingleFlight()
+        closed = threading.Event()
+        produced = []
+
+        def tokens():
+            try:
+                while True:
+                    time.sleep(0.01)
+                    produced.append(1)
+                    yield "token"
+            finally:
+                closed.set()
+
+        stream = flight.stream("question", tokens)
+        assert next(stream) == "token"
+        stream.close()
+        assert closed.wait(1)
+        count = len(produced)
+        time.sleep(0.05)
+        assert len(produced) == count
+        assert flight.in_flight() == 0
+
+        # Une nouvelle requête relance une génération au lieu de rejoindre le flux abandonné
+        stream = flight.stream("question", lambda: iter(TOKENS))
+        assert list(stream) == TOKENS
+
+    def test_abandoned_stream_is_not_joined(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def slow():
+            yield "premier"
+            release.wait(1)
+            yield "ignoré"
+
+        stream = flight.stream("question", slow)
+        assert next(stream) == "premier"
+        stream.close()
+        # Le producteur est encore bloqué dans l'appel en cours : le flux abandonné ne doit pas être rejoint
+        fresh = flight.stream("question", lambda: iter(TOKENS))
+        release.set()
+        assert list(fresh) == TOKENS
+
+    def test_async_stream_subscribers_replay_from_start(self):
+        flight = SingleFlight()
+        started = []
+
+        async def tokens():
+            started.append(1)
+            for token in TOKENS:
+                await asyncio.sleep(0.02)
+                yield token
+
+        async def late_subscriber():
+            await asyncio.sleep(0.05)
+            return [token async for token in flight.astream("question", tokens)]
+
+        async def scenario():
+            first = asyncio.create_task(_collect(flight.astream("question", tokens)))
+            return await asyncio.gather(first, late_subscriber())
+
+        first, late = asyncio.run(scenario())
+        assert first == TOKENS
+        assert late == TOKENS
+        assert len(started) == 1
+
+    def test_async_stream_cancelled_when_last_subscriber_leaves(self):
+        flight = SingleFlight()
+        cancelled = []
+
+        async def tokens():
+            try:
+                while True:
+                    await asyncio.sleep(0.01)
+                    yield "token"
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def scenario():
+            stream = flight.astream("question", tokens)
+            assert await stream.__anext__() == "token"
+            await stream.aclose()
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+        assert cancelled == [1]
+        assert flight.in_flight() == 0
+
+
+async def _collect(stream):
+    return [token async for token in stream]
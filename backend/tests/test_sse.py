@@ -0,0 +1,61 @@
+"""
+Tests pour le regroupement des tokens en trames SSE.
+"""
+
+import asyncio
+import json
+
+from app.sse import ChunkCoalescer, chunk_frame, coalesce_chunks
+
+
+def parse(frames):
+    return [json.loads(frame[len("data: ") :]) for frame in frames if isinstance(frame, str)]
+
+
+async def fake_stream(items, delay=0.0):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield item
+
+
+def collect(stream, coalescer):
+    async def run():
+        return [item async for item in coalesce_chunks(stream, coalescer)]
+
+    return asyncio.run(run())
+
+
+class TestSSE:
+    """Tests des trames et du regroupement."""
+
+    def test_chunk_frame_matches_json_dumps(self):
+        text = 'f/2.8 "ouverture" é\n'
+        assert chunk_frame(text) == f"data: {json.dumps({'type': 'chunk', 'content': text})}\n\n"
+
+    def test_tokens_grouped_by_size(self):
+        coalescer = ChunkCoalescer(flush_interval_ms=10_000, flush_bytes=10)
+        tokens = ["Ouvrez", " à", " f/2.8", " pour", " un", " flou", " d'arrière-plan"]
+        items = collect(fake_stream(tokens + [{"sources": []}]), coalescer)
+
+        events = parse(items)
+        assert "".join(event["content"] for event in events) == "".join(tokens)
+        assert events[0]["content"] == "Ouvrez"  # Premier token envoyé immédiatement
+        assert len(events) < len(tokens)
+        assert items[-1] == {"sources": []}
+
+    def test_pending_text_flushed_after_interval(self):
+        coalescer = ChunkCoalescer(flush_interval_ms=20, flush_bytes=10_000)
+
+        async def slow_stream():
+            yield "ISO"
+            yield " 100"
+            await asyncio.sleep(0.2)
+            yield " ou 200"
+
+        events = parse(collect(slow_stream(), coalescer))
+        assert [event["content"] for event in events] == ["ISO", " 100", " ou 200"]
+
+    def test_zero_bytes_disables_coalescing(self):
+        coalescer = ChunkCoalescer(flush_interval_ms=50, flush_bytes=0)
+        tokens = ["1", "/", "500"]
+        assert [event["content"] for event in parse(collect(fake_stream(tokens), coalescer))] == tokens